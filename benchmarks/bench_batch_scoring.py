@@ -0,0 +1,69 @@
+import argparse
+import random
+import time
+
+from dental_scraper.matching.models import Product
+from dental_scraper.matching.similarity import fuzzy_match, fuzzy_match_batch
+
+WORDS = [
+    "resina", "filtek", "z350", "z250", "xt", "a1", "a2", "a3", "b1", "luva", "latex",
+    "nitrilo", "procedimento", "sem", "po", "anestesico", "lidocaina", "mepivacaina",
+    "broca", "diamantada", "carbide", "fio", "sutura", "seda", "nylon", "gaze", "algodao",
+    "rolete", "sugador", "descartavel", "cimento", "ionomero", "vidro", "adesivo", "bond",
+]
+BRANDS = ["3M", "Dentsply", "FGM", "Ivoclar", "Coltene", "SS White", "Maquira", "DFL", ""]
+CATEGORIES = [
+    "Consumíveis > Resinas",
+    "Consumíveis > Luvas",
+    "Anestésicos > Injetáveis",
+    "Instrumentos > Brocas",
+    "Outros > Geral",
+]
+
+
+def make_block(size: int, supplier: str, seed: int) -> list[Product]:
+    rng = random.Random(seed)
+    products = []
+    for i in range(size):
+        name = " ".join(rng.sample(WORDS, rng.randint(3, 7)))
+        products.append(Product.from_dict({
+            "supplier": supplier,
+            "external_id": str(i),
+            "name": name,
+            "normalized_name": name,
+            "normalized_brand": rng.choice(BRANDS),
+            "category": rng.choice(CATEGORIES),
+            "quantity": rng.choice([1, 1, 1, 10, 50, 100]),
+            "unit": rng.choice(["unidade", "caixa", "pacote"]),
+        }))
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scalar and batched fuzzy scoring")
+    parser.add_argument("--size", type=int, default=300, help="Products per side of the block")
+    args = parser.parse_args()
+
+    products_a = make_block(args.size, "dental_speed", seed=1)
+    products_b = make_block(args.size, "dental_cremer", seed=2)
+
+    start = time.perf_counter()
+    scalar = [[fuzzy_match(a, b) for b in products_b] for a in products_a]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = fuzzy_match_batch(products_a, products_b)
+    batch_time = time.perf_counter() - start
+
+    for i, row in enumerate(scalar):
+        for j, result in enumerate(row):
+            assert batch[i, j] == (result.confidence if result else 0.0)
+
+    print(f"Block: {args.size} x {args.size} pairs")
+    print(f"Scalar: {scalar_time:.3f}s")
+    print(f"Batch:  {batch_time:.3f}s")
+    print(f"Speedup: {scalar_time / batch_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
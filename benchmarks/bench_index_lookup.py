@@ -0,0 +1,84 @@
+import argparse
+import random
+import time
+
+from dental_scraper.matching.index import MatchIndex
+from dental_scraper.matching.models import Product
+
+BLOCK_SIZE = 20
+
+
+def _ean(i: int) -> str:
+    # A valid GTIN-13, so every product keeps its EAN through normalization
+    # and each lookup also probes the EAN bucket.
+    digits = [int(d) for d in f"{789000000000 + i:012d}"]
+    checksum = sum(d * (3 if k % 2 else 1) for k, d in enumerate(digits))
+    return "".join(map(str, digits)) + str((10 - checksum % 10) % 10)
+
+
+def make_products(size: int, supplier: str) -> list[Product]:
+    # Brands grow with the catalog so brand/category blocks keep a realistic
+    # size instead of growing linearly with the index.
+    brands = max(size // BLOCK_SIZE, 1)
+    return [
+        Product.from_dict({
+            "supplier": supplier,
+            "external_id": str(i),
+            "name": f"produto {i}",
+            "normalized_name": f"produto {i}",
+            "normalized_brand": f"marca {i % brands}",
+            "category": "Consumíveis > Resinas",
+            "ean": _ean(i),
+        })
+        for i in range(size)
+    ]
+
+
+def measure(size: int, queries: int) -> tuple[float, float]:
+    index = MatchIndex()
+    start = time.perf_counter()
+    index.add_many(make_products(size, "dental_speed"))
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(size)
+    probes = [
+        Product.from_dict({
+            "supplier": "dental_cremer",
+            "external_id": str(i),
+            "name": "produto",
+            "normalized_name": "produto",
+            "normalized_brand": f"marca {i % max(size // BLOCK_SIZE, 1)}",
+            "category": "Consumíveis > Resinas",
+            "ean": _ean(i),
+        })
+        for i in (rng.randrange(size) for _ in range(queries))
+    ]
+
+    start = time.perf_counter()
+    for probe in probes:
+        index.find_candidates(probe)
+    lookup_time = time.perf_counter() - start
+
+    return build_time, lookup_time / queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MatchIndex lookup time vs. index size")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="Index sizes to measure",
+    )
+    parser.add_argument("--queries", type=int, default=10_000, help="Lookups per size")
+    args = parser.parse_args()
+
+    print(f"{'products':>10} {'build (s)':>10} {'lookup (us)':>12}")
+    for size in args.sizes:
+        build_time, lookup_time = measure(size, args.queries)
+        print(f"{size:>10} {build_time:>10.2f} {lookup_time * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import random
+import time
+
+from rapidfuzz import fuzz
+
+from benchmarks.catalog import iter_catalog
+from dental_scraper.pipelines.linker import MasterIndex
+from dental_scraper.pipelines.postgres import normalize_name
+
+
+def make_names(size: int, seed: int = 0) -> tuple[list[str], list[str]]:
+    # The first supplier's listings become master products and the second
+    # supplier's perturbed copies are the items being linked. The templates
+    # only yield a few thousand distinct names, so the rest of the masters
+    # are variants with other codes and sizes.
+    rng = random.Random(seed)
+    masters: dict[str, None] = {}
+    queries = []
+    for record in iter_catalog(20_000, seed=seed):
+        name = normalize_name(record["name"], record["quantity"], record["unit"])
+        if record["supplier"] == "dental_speed":
+            masters.setdefault(name)
+        else:
+            queries.append(name)
+
+    base = list(masters)
+    while len(masters) < size:
+        tokens = rng.choice(base).split()
+        numeric = [i for i, t in enumerate(tokens) if any(c.isdigit() for c in t)] or [len(tokens) - 1]
+        tokens[rng.choice(numeric)] = str(rng.randrange(1, 10_000))
+        masters.setdefault(" ".join(tokens))
+    return list(masters), queries
+
+
+def linear_scan(masters: list[str], name: str, threshold: int):
+    best_id, best_score = None, 0
+    for product_id, product_name in enumerate(masters):
+        score = fuzz.ratio(name, product_name)
+        if score > best_score and score >= threshold:
+            best_id, best_score = product_id, score
+    return best_id
+
+
+def score(name: str, masters: list[str], product_id) -> float | None:
+    return None if product_id is None else fuzz.ratio(name, masters[product_id])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Master product linking time per item")
+    parser.add_argument("--size", type=int, default=200_000, help="Master products")
+    parser.add_argument("--queries", type=int, default=2_000, help="Items linked per threshold")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[100, 95, 90])
+    parser.add_argument("--scan-queries", type=int, default=20, help="Items linked by linear scan")
+    args = parser.parse_args()
+
+    masters, queries = make_names(args.size)
+    queries = random.Random(0).sample(queries, min(args.queries, len(queries)))
+    print(f"{len(masters)} master products")
+
+    print(f"{'threshold':>10} {'build (s)':>10} {'index (us)':>11} {'scan (us)':>10} {'agree':>6}")
+    for threshold in args.thresholds:
+        index = MasterIndex(threshold)
+        start = time.perf_counter()
+        for product_id, name in enumerate(masters):
+            index.add(product_id, name)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = [index.find(name) for name in queries]
+        index_time = (time.perf_counter() - start) / len(queries)
+
+        sample = queries[: args.scan_queries]
+        start = time.perf_counter()
+        scanned = [linear_scan(masters, name, threshold) for name in sample]
+        scan_time = (time.perf_counter() - start) / len(sample)
+
+        # Equal-scoring masters count as agreement; ties break differently.
+        agree = sum(
+            score(name, masters, a) == score(name, masters, b)
+            for name, a, b in zip(sample, found, scanned)
+        )
+        print(
+            f"{threshold:>10} {build_time:>10.2f} {index_time * 1e6:>11.1f} "
+            f"{scan_time * 1e6:>10.0f} {agree:>3}/{len(sample)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.catalog import make_catalogs
+from dental_scraper.matching.engine import MatchingEngine
+from dental_scraper.matching.similarity import compute_similarity
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# Physical memory a size needs. Larger sizes are skipped on smaller
+# machines, and reported as skipped so the gap in the curve stays visible.
+# 1M peaks at about 3.2 GB and takes some 45 minutes on one core.
+REQUIRED_MB = {1_000_000: 4_000}
+BASELINE = Path(__file__).with_name("baseline.json")
+TOLERANCE = 0.10
+TIME_TOLERANCE = 0.50
+MIN_SECONDS = 0.05
+REPEAT = 3
+
+# Every metric is "lower is better". Counts are deterministic for a seed, so
+# they get a tight tolerance; timings on shared machines need a loose one.
+TIMINGS = ("build_s", "match_s", "lookup_us", "similarity_us")
+METRICS = (
+    "build_s",
+    "match_s",
+    "lookup_us",
+    "similarity_us",
+    "pairs_scored",
+    "candidates_per_query",
+    "peak_mb",
+)
+
+
+def best_of(func, repeat: int = REPEAT) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_size(size: int, queries: int, seed: int) -> dict:
+    products_a, products_b = make_catalogs(size, suppliers=2, seed=seed).values()
+    engine = MatchingEngine()
+
+    build_time = best_of(lambda: engine.build_index(products_b))
+    index_b = engine.build_index(products_b)
+
+    rng = random.Random(seed)
+    probes = [products_a[rng.randrange(len(products_a))] for _ in range(queries)]
+    candidates = [engine._candidates(index_b, probe) for probe in probes]
+    lookup_time = best_of(lambda: [engine._candidates(index_b, p) for p in probes]) / queries
+
+    pairs = [(probe, c) for probe, found in zip(probes, candidates) for c in found]
+    similarity_time = best_of(lambda: [compute_similarity(a, b) for a, b in pairs])
+    similarity_time /= max(len(pairs), 1)
+
+    # A full match on the largest catalogs is too slow to repeat.
+    match_time = float("inf")
+    for _ in range(REPEAT if size <= 10_000 else 1):
+        start = time.perf_counter()
+        result = engine.match(products_a, products_b, index_b)
+        match_time = min(match_time, time.perf_counter() - start)
+
+    # Counted on a separate run so the instrumentation does not skew match_s.
+    stats = MatchingEngine(instrument=True).match(products_a, products_b, index_b).run_stats
+    counters = stats["counters"]
+    pairs_scored = counters.get("exact_pairs", 0) + counters.get("fuzzy_pairs", 0)
+
+    return {
+        "size": size,
+        "build_s": round(build_time, 3),
+        "match_s": round(match_time, 3),
+        "lookup_us": round(lookup_time * 1e6, 1),
+        "similarity_us": round(similarity_time * 1e6, 2),
+        "pairs_scored": pairs_scored,
+        "candidates_per_query": round(pairs_scored / len(products_a), 2),
+        "matches": len(result.matches),
+        "counters": counters,
+        "peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def physical_mb() -> float:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**20
+
+
+def measure(size: int, queries: int, seed: int) -> dict:
+    # Each size runs in its own process so peak memory is not carried over.
+    command = [sys.executable, "-m", "benchmarks.bench_matching", "--run-size", str(size)]
+    command += ["--queries", str(queries), "--seed", str(seed)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def compare(
+    results: list[dict], baseline: dict, tolerance: float, time_tolerance: float
+) -> list[str]:
+    regressions = []
+    for row in results:
+        reference = baseline.get(str(row["size"]))
+        if reference is None:
+            continue
+        for metric in METRICS:
+            before, after = reference.get(metric), row[metric]
+            if not before:
+                continue
+            allowed = time_tolerance if metric in TIMINGS else tolerance
+            if metric.endswith("_s") and after - before < MIN_SECONDS:
+                continue
+            if after > before * (1 + allowed):
+                regressions.append(
+                    f"{row['size']:>9} {metric}: {before} -> {after} (+{after / before - 1:.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching engine scaling on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Total products")
+    parser.add_argument("--queries", type=int, default=2_000, help="Candidate lookups timed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="Allowed growth of counts and memory over the baseline",
+    )
+    parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        default=TIME_TOLERANCE,
+        help="Allowed growth of timings over the baseline",
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store these results as the new baseline"
+    )
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size:
+        print(json.dumps(run_size(args.run_size, args.queries, args.seed)))
+        return
+
+    header = f"{'products':>9}" + "".join(f" {m:>20}" for m in METRICS) + f" {'matches':>8}"
+    print(header)
+    results = []
+    skipped = []
+    for size in args.sizes:
+        required = REQUIRED_MB.get(size, 0)
+        if physical_mb() < required:
+            skipped.append(size)
+            print(f"{size:>9} skipped: needs about {required} MB of RAM, {physical_mb():.0f} MB here")
+            continue
+        row = measure(size, args.queries, args.seed)
+        results.append(row)
+        print(f"{size:>9}" + "".join(f" {row[m]:>20}" for m in METRICS) + f" {row['matches']:>8}")
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update({str(row["size"]): row for row in results})
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline saved to: {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    for size in skipped:
+        if str(size) in baseline:
+            print(f"\nNot checked against the {size} baseline on this machine")
+    regressions = compare(results, baseline, args.tolerance, args.time_tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(line)
+        sys.exit(1)
+    print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import random
+from collections.abc import Iterator
+
+from dental_scraper.matching.models import Product
+from dental_scraper.normalization import normalize_text
+
+SUPPLIERS = ["dental_speed", "dental_cremer", "surya_dental", "dental_partner", "dental_medsul"]
+
+EAN_COVERAGE = 0.55
+ANVISA_COVERAGE = 0.30
+MANUFACTURER_CODE_COVERAGE = 0.25
+SHARED_RATIO = 0.70
+BRAND_BLOCK = 500
+
+# (category, brands, template, slots)
+FAMILIES = [
+    (
+        "Dentística > Resinas",
+        ["3M", "FGM", "Ivoclar", "Dentsply", "Kulzer"],
+        "Resina Composta {line} {shade} {weight}g",
+        {
+            "line": ["Filtek Z350 XT", "Filtek Z250", "Opallis", "Vittra APS", "Charisma", "Tetric N-Ceram"],
+            "shade": ["A1", "A2", "A3", "A3.5", "B1", "B2", "C2", "OA2", "EA1", "DA3"],
+            "weight": ["2", "4", "4.5"],
+        },
+    ),
+    (
+        "Descartáveis > Luvas",
+        ["Supermax", "Descarpack", "Talge", "Unigloves", "Medix"],
+        "Luva de Procedimento {material} {size} c/ {count} un",
+        {
+            "material": ["Látex", "Nitrílica", "Vinil", "Látex sem Pó", "Nitrílica Azul"],
+            "size": ["PP", "P", "M", "G", "XG"],
+            "count": ["50", "100", "200"],
+        },
+    ),
+    (
+        "Anestésicos > Injetáveis",
+        ["DFL", "Nova DFL", "Septodont", "Dentsply"],
+        "Anestésico {drug} {concentration}% {vasoconstrictor} c/ {count} tubetes",
+        {
+            "drug": ["Lidocaína", "Mepivacaína", "Articaína", "Prilocaína", "Bupivacaína"],
+            "concentration": ["2", "3", "4", "0.5"],
+            "vasoconstrictor": ["c/ Epinefrina 1:100.000", "c/ Epinefrina 1:200.000", "sem Vaso", "c/ Felipressina"],
+            "count": ["50", "100"],
+        },
+    ),
+    (
+        "Instrumentais > Brocas",
+        ["KG Sorensen", "Microdont", "Jota", "SS White", "American Burrs"],
+        "Broca {kind} {code} {shank}",
+        {
+            "kind": ["Diamantada", "Carbide", "Multilaminada", "Zekrya"],
+            "code": [str(c) for c in range(1010, 4300, 7)],
+            "shank": ["FG", "CA", "PM"],
+        },
+    ),
+    (
+        "Cirurgia > Fios de Sutura",
+        ["Ethicon", "Shalon", "Technofio", "Procare"],
+        "Fio de Sutura {material} {gauge} c/ Agulha {needle} c/ {count} un",
+        {
+            "material": ["Seda", "Nylon", "Vicryl", "Poliglactina", "Catgut"],
+            "gauge": ["2-0", "3-0", "4-0", "5-0", "6-0"],
+            "needle": ["1/2 3/8", "3/8 1.7cm", "1/2 2.0cm", "3/8 2.5cm"],
+            "count": ["12", "24", "36"],
+        },
+    ),
+    (
+        "Dentística > Adesivos",
+        ["3M", "FGM", "Ivoclar", "Kuraray", "Dentsply"],
+        "Adesivo {line} {volume}ml",
+        {
+            "line": ["Single Bond Universal", "Ambar Universal", "Adper Single Bond 2", "Clearfil SE Bond", "Prime & Bond"],
+            "volume": ["3", "4", "5", "6"],
+        },
+    ),
+    (
+        "Prótese > Cimentos",
+        ["3M", "FGM", "SS White", "Maquira", "Ivoclar"],
+        "Cimento {kind} {line} {presentation}",
+        {
+            "kind": ["Ionômero de Vidro", "Resinoso", "Fosfato de Zinco", "Provisório"],
+            "line": ["RelyX U200", "Allcem", "Vitro Fil", "Maxxion R", "Riva"],
+            "presentation": ["Kit", "Refil", "Pó + Líquido", "Automix", "Clicker"],
+        },
+    ),
+]
+
+# Each supplier spells the same thing its own way.
+ABBREVIATIONS = [
+    ("c/", "com"),
+    (" un", " unidades"),
+    ("Procedimento", "Proced."),
+    ("Composta", ""),
+    ("Diamantada", "Diam."),
+    ("Anestésico", "Anest."),
+    ("tubetes", "tb"),
+    ("Ionômero de Vidro", "Ionomero"),
+]
+CATEGORY_ALIASES = {
+    "dental_cremer": lambda c: c.replace("Dentística", "Consumíveis"),
+    "surya_dental": lambda c: c.split(" > ")[-1],
+    "dental_medsul": lambda c: c.replace(" > ", " / "),
+}
+
+
+def _perturb(name: str, rng: random.Random) -> str:
+    for original, variant in ABBREVIATIONS:
+        if original in name and rng.random() < 0.35:
+            name = name.replace(original, variant)
+
+    words = name.split()
+    roll = rng.random()
+    if roll < 0.15 and len(words) > 3:
+        # Move the leading product type to the end: "Z350 XT A2 Resina".
+        words = words[1:] + words[:1]
+    elif roll < 0.25 and len(words) > 4:
+        del words[rng.randrange(2, len(words))]
+    elif roll < 0.33:
+        i = rng.randrange(len(words))
+        word = words[i]
+        if len(word) > 3:
+            j = rng.randrange(len(word) - 1)
+            words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+
+    name = " ".join(word for word in words if word)
+    return name.upper() if rng.random() < 0.1 else name
+
+
+def _ean(rng: random.Random) -> str:
+    digits = [7, 8, 9] + [rng.randrange(10) for _ in range(9)]
+    checksum = sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return "".join(map(str, digits)) + str((10 - checksum % 10) % 10)
+
+
+def _master(rng: random.Random, brands_per_family: int) -> dict:
+    category, brands, template, slots = rng.choice(FAMILIES)
+    values = {slot: rng.choice(options) for slot, options in slots.items()}
+    # The brand pool grows with the catalog so brand/category blocks keep the
+    # same size at every scale, as they do when more suppliers are crawled.
+    i = rng.randrange(brands_per_family)
+    brand = brands[i] if i < len(brands) else f"Marca {i}"
+    return {
+        "category": category,
+        "brand": brand,
+        "name": template.format(**values),
+        "quantity": int(values.get("count", 1)),
+        "unit": "caixa" if "count" in values else "unidade",
+        "price": round(rng.lognormvariate(3.5, 1.0), 2),
+        "ean": _ean(rng) if rng.random() < EAN_COVERAGE else None,
+        "anvisa_registration": (
+            f"{rng.randrange(10**10, 10**11)}" if rng.random() < ANVISA_COVERAGE else None
+        ),
+        "manufacturer_code": (
+            f"{rng.randrange(1000, 99999)}" if rng.random() < MANUFACTURER_CODE_COVERAGE else None
+        ),
+    }
+
+
+def iter_catalog(size: int, suppliers: int = 2, seed: int = 0) -> Iterator[dict]:
+    rng = random.Random(seed)
+    names = SUPPLIERS[:suppliers]
+    masters: list[dict] = []
+    per_supplier = size // suppliers
+
+    for s, supplier in enumerate(names):
+        alias = CATEGORY_ALIASES.get(supplier, lambda c: c)
+        count = per_supplier if s < suppliers - 1 else size - per_supplier * (suppliers - 1)
+        for i in range(count):
+            if masters and s and rng.random() < SHARED_RATIO:
+                master = masters[rng.randrange(len(masters))]
+            else:
+                master = _master(rng, max(size // BRAND_BLOCK, 5))
+                if not s:
+                    masters.append(master)
+
+            name = _perturb(master["name"], rng) if s else master["name"]
+            brand = master["brand"] if rng.random() > 0.05 else ""
+            price = round(master["price"] * rng.uniform(0.85, 1.2), 2)
+            yield {
+                "supplier": supplier,
+                "external_id": str(i),
+                "external_url": f"https://www.{supplier.replace('_', '')}.com.br/p/{i}",
+                "name": name,
+                "normalized_name": normalize_text(name),
+                "brand": brand,
+                "normalized_brand": brand,
+                "category": alias(master["category"]),
+                "quantity": master["quantity"],
+                "unit": master["unit"],
+                "price": price,
+                "pix_price": round(price * 0.95, 2),
+                "ean": master["ean"] if rng.random() < 0.9 else None,
+                "anvisa_registration": master["anvisa_registration"],
+                "manufacturer_code": master["manufacturer_code"],
+                "in_stock": rng.random() < 0.85,
+            }
+
+
+def make_catalogs(size: int, suppliers: int = 2, seed: int = 0) -> dict[str, list[Product]]:
+    catalogs: dict[str, list[Product]] = {name: [] for name in SUPPLIERS[:suppliers]}
+    for record in iter_catalog(size, suppliers, seed):
+        catalogs[record["supplier"]].append(Product.from_dict(record))
+    return catalogs
@@ -67,6 +67,7 @@ class NormalizedProductItem(scrapy.Item):
     scraped_at = scrapy.Field()
     ean = scrapy.Field()
     anvisa_registration = scrapy.Field()
+    invalid_codes = scrapy.Field()
     restricted_sale = scrapy.Field()
     professional_area = scrapy.Field()
     specialty = scrapy.Field()
@@ -1,16 +1,47 @@
+from .dedup import find_duplicates
 from .engine import MatchingEngine
 from .index import MatchIndex
-from .models import Match, MatchResult, Product, ProductMatch
-from .similarity import compute_similarity, exact_match, fuzzy_match
+from .loader import iter_products, load_index
+from .manifest import ExportManifest, ManifestEntry
+from .models import (
+    ClusterResult,
+    DedupResult,
+    DuplicateGroup,
+    Match,
+    MatchResult,
+    Product,
+    ProductCluster,
+    ProductMatch,
+)
+from .ngrams import NgramIndex
+from .similarity import compute_similarity, exact_match, fuzzy_match, fuzzy_match_batch
+from .snapshot import CatalogSnapshot, SnapshotWriter
+from .store import MatchStore
+from .writer import ResultWriter
 
 __all__ = [
     "MatchingEngine",
     "MatchIndex",
+    "CatalogSnapshot",
+    "ClusterResult",
+    "DedupResult",
+    "DuplicateGroup",
+    "ExportManifest",
+    "ManifestEntry",
     "Match",
     "MatchResult",
+    "MatchStore",
+    "NgramIndex",
     "Product",
+    "ProductCluster",
     "ProductMatch",
+    "ResultWriter",
+    "SnapshotWriter",
     "compute_similarity",
     "exact_match",
+    "find_duplicates",
     "fuzzy_match",
+    "fuzzy_match_batch",
+    "iter_products",
+    "load_index",
 ]
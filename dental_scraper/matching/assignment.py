@@ -0,0 +1,104 @@
+from collections.abc import Iterator, Sequence
+from itertools import chain
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+Edge = tuple[int, int, float]
+
+
+def greedy_assignment(edges: list[Edge]) -> list[Edge]:
+    chosen: list[Edge] = []
+    taken_rows: set[int] = set()
+    taken_cols: set[int] = set()
+
+    for row, col, weight in sorted(edges, key=lambda e: (-e[2], e[0], e[1])):
+        if row in taken_rows or col in taken_cols:
+            continue
+        taken_rows.add(row)
+        taken_cols.add(col)
+        chosen.append((row, col, weight))
+
+    return chosen
+
+
+def exact_assignment(edges: list[Edge]) -> list[Edge]:
+    rows = sorted({e[0] for e in edges})
+    cols = sorted({e[1] for e in edges})
+    row_pos = {row: i for i, row in enumerate(rows)}
+    col_pos = {col: j for j, col in enumerate(cols)}
+
+    weights = np.zeros((len(rows), len(cols)))
+    for row, col, weight in edges:
+        weights[row_pos[row], col_pos[col]] = weight
+
+    chosen_rows, chosen_cols = linear_sum_assignment(weights, maximize=True)
+    return [
+        (rows[i], cols[j], float(weights[i, j]))
+        for i, j in zip(chosen_rows, chosen_cols)
+        if weights[i, j] > 0
+    ]
+
+
+def connected_components(edges: list[Edge]) -> list[list[Edge]]:
+    parent: dict[tuple[str, int], tuple[str, int]] = {}
+
+    def find(node: tuple[str, int]) -> tuple[str, int]:
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for row, col, _ in edges:
+        root_row, root_col = find(("a", row)), find(("b", col))
+        if root_row != root_col:
+            parent[root_col] = root_row
+
+    components: dict[tuple[str, int], list[Edge]] = {}
+    for edge in edges:
+        components.setdefault(find(("a", edge[0])), []).append(edge)
+    return list(components.values())
+
+
+def assign_components(
+    edges: list[Edge],
+    pinned: Sequence[Edge] = (),
+    max_exact_size: int = 100,
+    kept: Sequence[Edge] = (),
+) -> Iterator[list[Edge]]:
+    # The chosen edges, a component at a time, so callers can act on each
+    # one as soon as it is resolved. Pinned edges (exact identifier hits) are
+    # never traded away for a higher total of fuzzy confidences.
+    chosen = greedy_assignment(list(pinned))
+    yield chosen
+    taken_rows = {e[0] for e in chosen}
+    taken_cols = {e[1] for e in chosen}
+
+    kept_edges = set(kept)
+    remaining = [
+        e for e in chain(edges, kept_edges) if e[0] not in taken_rows and e[1] not in taken_cols
+    ]
+    for component in connected_components(remaining):
+        size = max(len({e[0] for e in component}), len({e[1] for e in component}))
+        # Edges kept from an earlier run are chosen as well, but the component
+        # is still sized with them, so the rest of it is resolved as it was.
+        held = greedy_assignment([e for e in component if e in kept_edges])
+        if held:
+            held_rows = {e[0] for e in held}
+            held_cols = {e[1] for e in held}
+            component = [e for e in component if e[0] not in held_rows and e[1] not in held_cols]
+        if size <= max_exact_size:
+            held += exact_assignment(component) if component else []
+        else:
+            held += greedy_assignment(component)
+        yield held
+
+
+def global_assignment(
+    edges: list[Edge],
+    pinned: Sequence[Edge] = (),
+    max_exact_size: int = 100,
+    kept: Sequence[Edge] = (),
+) -> list[Edge]:
+    return list(chain.from_iterable(assign_components(edges, pinned, max_exact_size, kept)))
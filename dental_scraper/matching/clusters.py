@@ -0,0 +1,70 @@
+from collections.abc import Iterable
+
+from .models import ProductCluster, ProductMatch
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent: dict[str, str] = {}
+        self.size: dict[str, int] = {}
+        self.suppliers: dict[str, set[str]] = {}
+
+    def add(self, uid: str, supplier: str) -> None:
+        if uid not in self.parent:
+            self.parent[uid] = uid
+            self.size[uid] = 1
+            self.suppliers[uid] = {supplier}
+
+    def find(self, uid: str) -> str:
+        parent = self.parent
+        while parent[uid] != uid:
+            parent[uid] = parent[parent[uid]]
+            uid = parent[uid]
+        return uid
+
+    def union(self, uid_a: str, uid_b: str) -> bool:
+        root_a, root_b = self.find(uid_a), self.find(uid_b)
+        if root_a == root_b:
+            return False
+
+        # A cluster holds at most one product per supplier.
+        if self.suppliers[root_a] & self.suppliers[root_b]:
+            return False
+
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        self.suppliers[root_a] |= self.suppliers.pop(root_b)
+        return True
+
+
+def build_clusters(links: list[ProductMatch]) -> list[ProductCluster]:
+    return build_ranked_clusters(sorted(links, key=lambda m: m.confidence, reverse=True))
+
+
+def build_ranked_clusters(links: Iterable[ProductMatch]) -> list[ProductCluster]:
+    # Links come best first and only accepted ones are kept, so callers can
+    # produce them lazily instead of holding every scored pair as an object.
+    uf = UnionFind()
+    accepted: list[ProductMatch] = []
+
+    for link in links:
+        uf.add(link.product_a.uid, link.product_a.supplier)
+        uf.add(link.product_b.uid, link.product_b.supplier)
+        if uf.union(link.product_a.uid, link.product_b.uid):
+            accepted.append(link)
+
+    clusters: dict[str, ProductCluster] = {}
+    members: dict[str, set[str]] = {}
+    for link in accepted:
+        root = uf.find(link.product_a.uid)
+        cluster = clusters.setdefault(root, ProductCluster(products=[], links=[]))
+        uids = members.setdefault(root, set())
+        for product in (link.product_a, link.product_b):
+            if product.uid not in uids:
+                uids.add(product.uid)
+                cluster.products.append(product)
+        cluster.links.append(link)
+
+    return list(clusters.values())
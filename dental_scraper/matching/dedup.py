@@ -0,0 +1,146 @@
+import zlib
+from collections import defaultdict
+from collections.abc import Iterable
+from itertools import combinations
+
+import numpy as np
+
+from .features import features_of
+from .models import DedupResult, DuplicateGroup, Product
+from .ngrams import char_ngrams
+
+SHINGLE_SIZE = 3
+NUM_HASHES = 64
+BANDS = 8
+SIMILARITY_THRESHOLD = 0.85
+
+# Buckets this large are near-identical boilerplate names; their members
+# are only compared to the first one so a bucket never costs n^2.
+MAX_BUCKET_SIZE = 50
+
+_PRIME = (1 << 31) - 1
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> frozenset[int]:
+    return frozenset(zlib.crc32(gram.encode("utf-8")) for gram in char_ngrams(text, size))
+
+
+def jaccard(a: frozenset[int], b: frozenset[int]) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class MinHasher:
+    def __init__(self, num_hashes: int = NUM_HASHES, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=(num_hashes, 1), dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=(num_hashes, 1), dtype=np.uint64)
+
+    def signature(self, shingle_set: frozenset[int]) -> np.ndarray:
+        # Shingle hashes are 32 bit and a, b stay below 2^31, so the
+        # products fit in 64 bits before the modulus.
+        x = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+        signature: np.ndarray = ((self.a * x + self.b) % _PRIME).min(axis=1).astype(np.uint32)
+        return signature
+
+
+def _same_item(a: Product, b: Product) -> bool:
+    # Shade, size and model codes differ by a character or two, which
+    # shingles barely notice; listings of one item agree on all of them.
+    fa, fb = features_of(a), features_of(b)
+    if fa.quantity != fb.quantity or fa.unit != fb.unit:
+        return False
+    if fa.brand and fb.brand and fa.brand != fb.brand:
+        return False
+    for code_a, code_b in ((fa.ean, fb.ean), (fa.manufacturer_code, fb.manufacturer_code)):
+        if code_a and code_b and code_a != code_b:
+            return False
+    return _coded_tokens(fa.tokens) == _coded_tokens(fb.tokens)
+
+
+def _coded_tokens(tokens: tuple[str, ...]) -> set[str]:
+    return {t for t in tokens if any(c.isdigit() for c in t)}
+
+
+def _keep_first(product: Product) -> tuple:
+    return (not product.in_stock, product.price_cents or float("inf"), product.uid)
+
+
+def find_duplicates(
+    products: Iterable[Product],
+    threshold: float = SIMILARITY_THRESHOLD,
+    num_hashes: int = NUM_HASHES,
+    bands: int = BANDS,
+    seed: int = 0,
+) -> DedupResult:
+    if num_hashes % bands:
+        raise ValueError(f"num_hashes ({num_hashes}) must be a multiple of bands ({bands})")
+
+    hasher = MinHasher(num_hashes, seed)
+    rows = num_hashes // bands
+    by_uid: dict[str, Product] = {}
+    shingle_sets: dict[str, frozenset[int]] = {}
+    buckets: dict[tuple[str, int, bytes], list[str]] = defaultdict(list)
+
+    for product in products:
+        shingle_set = shingles(product.normalized_name or "")
+        if not shingle_set:
+            continue
+        by_uid[product.uid] = product
+        shingle_sets[product.uid] = shingle_set
+        signature = hasher.signature(shingle_set)
+        for band in range(bands):
+            key = signature[band * rows : (band + 1) * rows].tobytes()
+            buckets[product.supplier, band, key].append(product.uid)
+
+    parent: dict[str, str] = {}
+
+    def find(uid: str) -> str:
+        root = uid
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while uid != root:
+            parent[uid], uid = root, parent[uid]
+        return root
+
+    similarity: dict[str, float] = {}
+    candidate_pairs = 0
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        pairs: Iterable[tuple[str, str]]
+        if len(members) > MAX_BUCKET_SIZE:
+            pairs = ((members[0], other) for other in members[1:])
+        else:
+            pairs = combinations(members, 2)
+
+        for uid_a, uid_b in pairs:
+            root_a, root_b = find(uid_a), find(uid_b)
+            if root_a == root_b:
+                continue
+            candidate_pairs += 1
+            score = jaccard(shingle_sets[uid_a], shingle_sets[uid_b])
+            if score < threshold or not _same_item(by_uid[uid_a], by_uid[uid_b]):
+                continue
+            parent[root_b] = parent[root_a] = root_a
+            similarity[root_a] = min(
+                score, similarity.get(root_a, 1.0), similarity.pop(root_b, 1.0)
+            )
+
+    members_of: dict[str, list[Product]] = defaultdict(list)
+    for uid in parent:
+        members_of[find(uid)].append(by_uid[uid])
+
+    groups = [
+        DuplicateGroup(products=sorted(group, key=_keep_first), similarity=similarity[root])
+        for root, group in members_of.items()
+        if len(group) > 1
+    ]
+    groups.sort(key=lambda g: (g.supplier, g.canonical.uid))
+
+    return DedupResult(
+        groups=groups,
+        run_stats={"products": len(by_uid), "candidate_pairs": candidate_pairs},
+    )
@@ -1,71 +1,717 @@
+import hashlib
+import time
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain
 from typing import Optional
 
+import numpy as np
+
+from .assignment import Edge, assign_components
+from .clusters import build_ranked_clusters
 from .index import MatchIndex
-from .models import MatchResult, Product, ProductMatch
-from .similarity import compute_similarity
+from .models import ClusterResult, Match, MatchResult, Product, ProductMatch
+from .similarity import FUZZY_WEIGHTS, compute_similarity, exact_match, fuzzy_match_batch
+from .stats import MatchStats, stage
+from .store import MatchStore, fingerprint
+
+ScoredCandidates = list[tuple[Product, Match]]
+MatchSink = Callable[[ProductMatch], None]
+
+EXACT_METHODS = ("ean", "manufacturer_code")
+
+# Confidences have three decimals; offsets below this, summed over a whole
+# component, never outweigh a real difference.
+TIE_BREAK_SCALE = 1e-7 / 2**32
+
+
+def _tie_break(uid_a: str, uid_b: str) -> float:
+    # A fixed per-pair offset, so equally good assignments resolve the same
+    # way whichever part of the catalog is being assigned.
+    digest = hashlib.blake2b(f"{uid_a}\0{uid_b}".encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "big") * TIE_BREAK_SCALE
+
+
+_worker_engine: Optional["MatchingEngine"] = None
+_worker_index: Optional[MatchIndex] = None
+
+
+def _init_worker(engine: "MatchingEngine", index_b: MatchIndex) -> None:
+    global _worker_engine, _worker_index
+    _worker_engine = engine
+    _worker_index = index_b
+
+
+def _score_shard(
+    products_a: list[Product],
+) -> tuple[list[list[tuple[str, Match]]], Optional[MatchStats]]:
+    # Set by _init_worker before the pool hands out any shard.
+    engine, index_b = _worker_engine, _worker_index
+    assert engine is not None and index_b is not None, "worker was not initialised"
+    stats = MatchStats() if engine.instrument else None
+    scored = engine._score_all(index_b, products_a, stats)
+    rows = [[(product_b.uid, result) for product_b, result in candidates] for candidates in scored]
+    return rows, stats
 
 
 class MatchingEngine:
-    def __init__(self, fuzzy_threshold: float = 0.70):
+    def __init__(
+        self,
+        fuzzy_threshold: float = 0.70,
+        fuzzy_top_k: int = 20,
+        batch_size: int = 0,
+        workers: int = 1,
+        shards_per_worker: int = 4,
+        assignment: str = "global",
+        max_exact_component: int = 100,
+        instrument: bool = False,
+        ngram_top_k: int = 0,
+    ):
+        if assignment not in ("global", "greedy"):
+            raise ValueError(f"Unknown assignment mode: {assignment}")
+
         self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_top_k = fuzzy_top_k
+        self.batch_size = batch_size
+        self.workers = workers
+        self.shards_per_worker = shards_per_worker
+        self.assignment = assignment
+        self.max_exact_component = max_exact_component
+        self.instrument = instrument
+        self.ngram_top_k = ngram_top_k
+
+    def build_index(self, products: Iterable[Product] = ()) -> MatchIndex:
+        index = MatchIndex(fuzzy_top_k=self.fuzzy_top_k)
+        index.add_many(products)
+        return index
+
+    def score(self, index_b: MatchIndex, product_a: Product) -> ScoredCandidates:
+        # Every candidate at or above the threshold, best first, without
+        # assigning: for lookups of one product against a catalog.
+        scored = [
+            (product_b, result)
+            for product_b, result in self._score(index_b, product_a)
+            if result.confidence >= self.fuzzy_threshold
+        ]
+        scored.sort(key=lambda pair: pair[1].confidence, reverse=True)
+        return scored
 
     def match(
         self,
         products_a: list[Product],
         products_b: list[Product],
+        index_b: Optional[MatchIndex] = None,
+        sink: Optional[MatchSink] = None,
     ) -> MatchResult:
-        index_b = MatchIndex()
-        index_b.add_many(products_b)
+        # With a sink, each match is handed to it as soon as it is final and
+        # the result only counts them, leaving result.matches empty.
+        stats = MatchStats() if self.instrument else None
 
-        matches: list[ProductMatch] = []
-        matched_a_uids: set[str] = set()
+        with stage(stats, "index_build"):
+            if index_b is None:
+                index_b = self.build_index(products_b)
+
+        if self.ngram_top_k:
+            with stage(stats, "ngram_lookup"):
+                index_b.prepare_ngrams(products_a, self.ngram_top_k)
+
+        if self.assignment == "greedy" and self.workers <= 1 and not self.batch_size:
+            # Greedy choices can be made while scoring, which lets each
+            # product skip taken candidates and prune against its best so far.
+            with stage(stats, "score"):
+                matches = self._match_greedy(index_b, products_a, stats)
+                result = self._result(products_a, products_b, matches, sink)
+        else:
+            with stage(stats, "score"):
+                scored = self._score_products(index_b, products_a, stats)
+            with stage(stats, "resolve"):
+                result = self._resolve(products_a, products_b, scored, sink=sink)
+
+        if stats is not None:
+            result.run_stats.update(stats.to_dict())
+        return result
+
+    def match_incremental(
+        self,
+        products_a: list[Product],
+        products_b: list[Product],
+        store: MatchStore,
+        index_a: Optional[MatchIndex] = None,
+        index_b: Optional[MatchIndex] = None,
+        sink: Optional[MatchSink] = None,
+    ) -> MatchResult:
+        # Scoring is limited to what changed. Finding the A products a change
+        # in B reaches is too, as long as B keeps its size and n-grams are
+        # off; otherwise every A product is checked, though still not
+        # rescored unless its candidates moved.
+        stats = MatchStats() if self.instrument else None
+
+        with stage(stats, "store_load"):
+            # Edges are stored A to B, so the sides are part of the config: a
+            # store written with the suppliers the other way round is reset.
+            store.check_config({
+                "suppliers": [
+                    sorted({p.supplier for p in products_a}),
+                    sorted({p.supplier for p in products_b}),
+                ],
+                "fuzzy_top_k": self.fuzzy_top_k,
+                "fuzzy_threshold": self.fuzzy_threshold,
+                "ngram_top_k": self.ngram_top_k,
+                "weights": FUZZY_WEIGHTS,
+            })
+            known = store.fingerprints()
+            current = {p.uid: fingerprint(p) for p in chain(products_a, products_b)}
+            changed = {uid for uid, fp in current.items() if known.get(uid) != fp}
+            removed = known.keys() - current.keys()
+            stale = changed | removed
+
+        with stage(stats, "index_build"):
+            if index_a is None:
+                index_a = self.build_index(products_a)
+            if index_b is None:
+                index_b = self.build_index(products_b)
+
+        changed_a = [p for p in index_a.products.values() if p.uid in changed]
+        changed_b = [p for p in index_b.products.values() if p.uid in changed]
+        keys_b = {p.uid: index_b.lookup_keys(p) for p in changed_b}
+        with stage(stats, "store_load"):
+            old_keys = store.lookup_keys(stale)
+            b_changed = bool(keys_b or old_keys)
+            neighbours = store.neighbours() if self.ngram_top_k and b_changed else {}
+
+        if self.ngram_top_k:
+            with stage(stats, "ngram_lookup"):
+                # Neighbour ranks depend on the whole of B, so once it changes
+                # every A product is looked up again.
+                index_b.prepare_ngrams(
+                    list(index_a.products.values()) if b_changed else changed_a,
+                    self.ngram_top_k,
+                )
+
+        # Only A products are scored, against B, as match() scores them. An A
+        # product that did not change keeps its stored edges, except with the
+        # changed or removed B products that may have entered or left its
+        # candidates.
+        rescored = changed_a
+        partial: list[tuple[Product, list[Product]]] = []
+        checked = 0
+        with stage(stats, "invalidate"):
+            if b_changed:
+                touched = set(chain.from_iterable(old_keys.values()))
+                changed_by_key: dict[str, list[Product]] = {}
+                for product_b in changed_b:
+                    touched.update(keys_b[product_b.uid])
+                    for key in index_b.lookup_keys(product_b, with_tokens=False):
+                        changed_by_key.setdefault(key, []).append(product_b)
+                # Token ranks are weighted by the size of B, so fallback
+                # lookups can change whenever it grows or shrinks.
+                added = sum(uid not in known for uid in keys_b)
+                dropped = sum(uid not in index_b for uid in old_keys)
+                resized = added != dropped
+
+                if self.ngram_top_k or resized:
+                    # Any A product's neighbours or fallback may have moved,
+                    # so every one of them is checked.
+                    unchanged = index_a.products.values()
+                else:
+                    # Otherwise only those filed under a key a changed or
+                    # removed B product had or has can see different
+                    # candidates.
+                    unchanged = index_a.filed_under(touched).values()
+
+                rescored = list(changed_a)
+                for product_a in unchanged:
+                    if product_a.uid in changed:
+                        continue
+                    checked += 1
+                    candidates = self._stale_candidates(
+                        index_b,
+                        product_a,
+                        touched,
+                        changed_by_key,
+                        resized,
+                        stale,
+                        neighbours,
+                    )
+                    if candidates is None:
+                        rescored.append(product_a)
+                    elif candidates:
+                        partial.append((product_a, candidates))
+            rescored_uids = {p.uid for p in rescored}
+
+        with stage(stats, "score"):
+            scored_a = self._score_products(index_b, rescored, stats)
+            new_edges = [
+                (product_a.uid, product_b.uid, match)
+                for product_a, candidates in zip(rescored, scored_a)
+                for product_b, match in candidates
+            ]
+            for product_a, candidates in partial:
+                for product_b in candidates:
+                    match = compute_similarity(product_a, product_b, stats, self.fuzzy_threshold)
+                    if match:
+                        new_edges.append((product_a.uid, product_b.uid, match))
+
+        fresh = {(uid_a, uid_b): match for uid_a, uid_b, match in new_edges}
+        with stage(stats, "store_load"):
+            edges, carried = self._reuse_edges(
+                store, fresh, rescored_uids, stale, index_a, index_b
+            )
+
+        rows = {uid: i for i, uid in enumerate(p.uid for p in products_a)}
+        scored: list[ScoredCandidates] = [[] for _ in products_a]
+        for (uid_a, uid_b), match in sorted(edges.items()):
+            if uid_a in rows:
+                scored[rows[uid_a]].append((index_b.products[uid_b], match))
+
+        # The store keeps each A product's match, streamed or not.
+        kept: dict[str, tuple[str, str]] = {}
+        keep: Optional[MatchSink] = None
+        if sink is not None:
+            forward = sink
+
+            def keep(chosen: ProductMatch) -> None:
+                kept[chosen.product_a.uid] = (chosen.product_b.uid, chosen.status)
+                forward(chosen)
+
+        with stage(stats, "resolve"):
+            outcome = self._resolve(products_a, products_b, scored, carried, keep)
+        if sink is None:
+            kept = {m.product_a.uid: (m.product_b.uid, m.status) for m in outcome.matches}
+        outcome.run_stats.update({
+            "checked_a": checked,
+            "rescored_a": len(rescored),
+            "rescored_pairs": sum(len(candidates) for _, candidates in partial),
+            "changed_b": len(changed_b),
+            "removed": len(removed),
+            "cached_edges": len(edges) - len(fresh),
+            "carried_matches": len(carried),
+        })
+
+        with stage(stats, "store_sync"):
+            store.sync(
+                stale,
+                rescored_uids,
+                {uid: current[uid] for uid in changed},
+                new_edges,
+                kept,
+                keys_b,
+                {
+                    p.uid: [n.uid for n in index_b.find_by_ngrams(p, self.ngram_top_k)]
+                    for p in rescored
+                } if self.ngram_top_k else {},
+            )
+
+        if stats is not None:
+            outcome.run_stats.update(stats.to_dict())
+        return outcome
+
+    def _reuse_edges(
+        self,
+        store: MatchStore,
+        fresh: dict[tuple[str, str], Match],
+        rescored_uids: set[str],
+        stale: set[str],
+        index_a: MatchIndex,
+        index_b: MatchIndex,
+    ) -> tuple[dict[tuple[str, str], Match], set[tuple[str, str]]]:
+        # The freshly scored edges plus every stored one whose A product was
+        # not rescored and whose B product did not change, and the confirmed
+        # matches that can be carried over. With nothing reusable this is
+        # fresh and an empty set, which resolve exactly as a full run does.
+        edges = dict(fresh)
+        for uid_a, uid_b, match in store.edges():
+            if (
+                uid_a not in rescored_uids
+                and uid_b not in stale
+                and uid_a in index_a
+                and uid_b in index_b
+            ):
+                edges[uid_a, uid_b] = match
+
+        carried = {
+            (uid_a, uid_b)
+            for uid_a, (uid_b, status) in store.matches().items()
+            if status == "confirmed"
+            and uid_a not in stale
+            and uid_b not in stale
+            and (uid_a, uid_b) in edges
+        }
+        return edges, carried
+
+    def _stale_candidates(
+        self,
+        index_b: MatchIndex,
+        product_a: Product,
+        touched: set[str],
+        changed_by_key: dict[str, list[Product]],
+        resized: bool,
+        stale: set[str],
+        neighbours: dict[str, list[str]],
+    ) -> Optional[list[Product]]:
+        # The changed B products among an unchanged A product's candidates,
+        # or None when the candidate list itself may have changed and the
+        # product has to be scored again in full. Follows _candidates: blocks
+        # and n-gram neighbours, then the token fallback when both are empty.
+        blocking = index_b.lookup_keys(product_a, with_tokens=False)
+
+        found: list[Product] = []
+        if self.ngram_top_k:
+            found = index_b.find_by_ngrams(product_a, self.ngram_top_k)
+            if {p.uid for p in found} != set(neighbours.get(product_a.uid, ())):
+                return None
+
+        if not touched.isdisjoint(blocking):
+            # Blocks only gain or lose the changed members, unless they were
+            # or now are empty and the token fallback was or is used instead.
+            if not found and not index_b.has_candidates(product_a, ignore=stale):
+                return None
+        elif not found and not index_b.has_candidates(product_a):
+            if resized or not touched.isdisjoint(index_b.lookup_keys(product_a)):
+                return None
+            return []
+
+        candidates = {p.uid: p for key in blocking for p in changed_by_key.get(key, ())}
+        candidates.update((p.uid, p) for p in found if p.uid in stale)
+        return list(candidates.values())
+
+    def _score_products(
+        self,
+        index_b: MatchIndex,
+        products_a: list[Product],
+        stats: Optional[MatchStats] = None,
+    ) -> list[ScoredCandidates]:
+        if self.workers > 1 and len(products_a) > 1:
+            return self._score_parallel(index_b, products_a, stats)
+        return self._score_all(index_b, products_a, stats)
+
+    def _score_all(
+        self,
+        index_b: MatchIndex,
+        products_a: list[Product],
+        stats: Optional[MatchStats] = None,
+    ) -> list[ScoredCandidates]:
+        if self.batch_size:
+            return self._score_batched(index_b, products_a, stats)
+        return [self._score(index_b, product_a, stats) for product_a in products_a]
+
+    def _score_parallel(
+        self,
+        index_b: MatchIndex,
+        products_a: list[Product],
+        stats: Optional[MatchStats] = None,
+    ) -> list[ScoredCandidates]:
+        shard_count = min(self.workers * self.shards_per_worker, len(products_a))
+        shard_size = -(-len(products_a) // shard_count)
+        shards = [
+            products_a[start : start + shard_size]
+            for start in range(0, len(products_a), shard_size)
+        ]
+
+        # With the fork start method the workers inherit index_b without
+        # pickling it; otherwise it is sent once per worker, not per shard.
+        scored: list[ScoredCandidates] = []
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self, index_b),
+        ) as executor:
+            for shard, shard_stats in executor.map(_score_shard, shards):
+                if stats is not None and shard_stats is not None:
+                    stats.merge(shard_stats)
+                for candidates in shard:
+                    scored.append([(index_b.products[uid], result) for uid, result in candidates])
+
+        return scored
+
+    def _candidates(
+        self,
+        index_b: MatchIndex,
+        product_a: Product,
+        stats: Optional[MatchStats] = None,
+    ) -> list[Product]:
+        candidates = index_b.find_candidates(product_a)
+        if self.ngram_top_k:
+            # Name neighbours catch pairs that blocking misses, such as a
+            # product listed without a brand or under a catch-all category.
+            blocked = {p.uid for p in candidates}
+            neighbours = [
+                p for p in index_b.find_by_ngrams(product_a, self.ngram_top_k)
+                if p.uid not in blocked
+            ]
+            if stats is not None:
+                stats.count("ngram_candidates", len(neighbours))
+            candidates += neighbours
+        if candidates:
+            return candidates
+
+        candidates = index_b.find_by_tokens(product_a)
+        if stats is not None:
+            stats.count("fallback_queries")
+            if candidates:
+                stats.count("fallback_hits")
+        return candidates
+
+    def _score(
+        self,
+        index_b: MatchIndex,
+        product_a: Product,
+        stats: Optional[MatchStats] = None,
+    ) -> ScoredCandidates:
+        cutoff = self.fuzzy_threshold
+        if stats is None:
+            scored: ScoredCandidates = []
+            for product_b in self._candidates(index_b, product_a):
+                result = compute_similarity(product_a, product_b, score_cutoff=cutoff)
+                if result:
+                    scored.append((product_b, result))
+            return scored
+
+        start = time.perf_counter()
+        candidates = self._candidates(index_b, product_a, stats)
+        lookup_done = time.perf_counter()
+        stats.add_time("candidate_lookup", lookup_done - start)
+        stats.record_candidates(len(candidates))
+
+        scored = []
+        for product_b in candidates:
+            result = compute_similarity(product_a, product_b, stats, cutoff)
+            if result:
+                scored.append((product_b, result))
+        stats.add_time("similarity", time.perf_counter() - lookup_done)
+        return scored
+
+    def _match_greedy(
+        self,
+        index_b: MatchIndex,
+        products_a: list[Product],
+        stats: Optional[MatchStats] = None,
+    ) -> Iterator[ProductMatch]:
         matched_b_uids: set[str] = set()
 
         for product_a in products_a:
-            best_match: Optional[ProductMatch] = None
-            best_confidence = 0.0
+            if stats is not None:
+                start = time.perf_counter()
+            candidates = self._candidates(index_b, product_a, stats)
+            if stats is not None:
+                lookup_done = time.perf_counter()
+                stats.add_time("candidate_lookup", lookup_done - start)
+                stats.record_candidates(len(candidates))
 
-            candidates = index_b.find_candidates(product_a)
-
-            if not candidates:
-                candidates = [
-                    p for p in products_b
-                    if p.normalized_brand
-                    and product_a.normalized_brand
-                    and p.normalized_brand.lower() == product_a.normalized_brand.lower()
-                ]
+            best: Optional[tuple[Product, Match]] = None
+            best_confidence = 0.0
 
             for product_b in candidates:
                 if product_b.uid in matched_b_uids:
                     continue
 
-                result = compute_similarity(product_a, product_b)
+                cutoff = max(best_confidence, self.fuzzy_threshold)
+                result = compute_similarity(product_a, product_b, stats, cutoff)
                 if result and result.confidence > best_confidence:
                     best_confidence = result.confidence
-                    best_match = ProductMatch(
-                        product_a=product_a,
-                        product_b=product_b,
-                        confidence=result.confidence,
-                        method=result.method,
-                        status="confirmed" if result.confidence >= 0.85 else "pending",
-                    )
+                    best = (product_b, result)
+                    if best_confidence >= 1.0:
+                        if stats is not None:
+                            stats.count("early_exits")
+                        break
+
+            if stats is not None:
+                stats.add_time("similarity", time.perf_counter() - lookup_done)
+
+            if best and best_confidence >= self.fuzzy_threshold:
+                matched_b_uids.add(best[0].uid)
+                yield self._product_match(product_a, *best)
+
+    def _score_batched(
+        self,
+        index_b: MatchIndex,
+        products_a: list[Product],
+        stats: Optional[MatchStats] = None,
+    ) -> list[ScoredCandidates]:
+        blocks: dict[tuple[str, str], list[int]] = {}
+        for i, product_a in enumerate(products_a):
+            key = (product_a.normalized_brand or "", product_a.category or "")
+            blocks.setdefault(key, []).append(i)
+
+        scored: list[ScoredCandidates] = [[] for _ in products_a]
+        for block in blocks.values():
+            for start in range(0, len(block), self.batch_size):
+                chunk = block[start : start + self.batch_size]
+
+                lookup_start = time.perf_counter() if stats is not None else 0.0
+                candidates = [self._candidates(index_b, products_a[i], stats) for i in chunk]
+
+                columns: dict[str, int] = {}
+                block_b: list[Product] = []
+                for product_b in (p for cands in candidates for p in cands):
+                    if product_b.uid not in columns:
+                        columns[product_b.uid] = len(block_b)
+                        block_b.append(product_b)
 
-            if best_match and best_match.confidence >= self.fuzzy_threshold:
-                matches.append(best_match)
-                matched_a_uids.add(product_a.uid)
-                matched_b_uids.add(best_match.product_b.uid)
+                name_mask = None
+                if stats is not None:
+                    lookup_done = time.perf_counter()
+                    stats.add_time("candidate_lookup", lookup_done - lookup_start)
+                    for cands in candidates:
+                        stats.record_candidates(len(cands))
+                    name_mask = np.zeros((len(chunk), len(block_b)), dtype=bool)
 
+                confidences = fuzzy_match_batch(
+                    [products_a[i] for i in chunk], block_b, name_mask=name_mask
+                )
+
+                for row, (i, cands) in enumerate(zip(chunk, candidates)):
+                    for product_b in cands:
+                        result = exact_match(products_a[i], product_b)
+                        if result:
+                            if stats is not None:
+                                stats.count("exact_pairs")
+                        else:
+                            col = columns[product_b.uid]
+                            if stats is not None:
+                                stats.count("fuzzy_pairs")
+                                if name_mask is not None and not name_mask[row, col]:
+                                    stats.count("min_name_rejects")
+                            confidence = confidences[row, col]
+                            if not confidence:
+                                continue
+                            result = Match(confidence=float(confidence), method="fuzzy")
+                        scored[i].append((product_b, result))
+
+                if stats is not None:
+                    stats.add_time("similarity", time.perf_counter() - lookup_done)
+
+        return scored
+
+    def _resolve(
+        self,
+        products_a: list[Product],
+        products_b: list[Product],
+        scored: list[ScoredCandidates],
+        carried: Optional[set[tuple[str, str]]] = None,
+        sink: Optional[MatchSink] = None,
+    ) -> MatchResult:
+        carried = carried or set()
+        if self.assignment == "greedy":
+            matches = self._resolve_greedy(products_a, scored, carried)
+        else:
+            matches = self._resolve_global(products_a, scored, carried)
+        return self._result(products_a, products_b, matches, sink)
+
+    def _result(
+        self,
+        products_a: list[Product],
+        products_b: list[Product],
+        matches: Iterable[ProductMatch],
+        sink: Optional[MatchSink] = None,
+    ) -> MatchResult:
+        matched_a_uids: set[str] = set()
+        matched_b_uids: set[str] = set()
+        kept: list[ProductMatch] = []
+        methods: dict[str, int] = {}
+        for match in matches:
+            matched_a_uids.add(match.product_a.uid)
+            matched_b_uids.add(match.product_b.uid)
+            if sink is None:
+                kept.append(match)
+            else:
+                methods[match.method] = methods.get(match.method, 0) + 1
+                sink(match)
         unmatched_a = [p for p in products_a if p.uid not in matched_a_uids]
         unmatched_b = [p for p in products_b if p.uid not in matched_b_uids]
 
-        matches.sort(key=lambda m: m.confidence, reverse=True)
+        # Best first, and equally good ones in the order of products_a.
+        order = {p.uid: i for i, p in enumerate(products_a)} if kept else {}
+        kept.sort(key=lambda m: (-m.confidence, order[m.product_a.uid]))
+
+        result = MatchResult(matches=kept, unmatched_a=unmatched_a, unmatched_b=unmatched_b)
+        if sink is not None:
+            # Counted here, since result.matches no longer holds them.
+            result.run_stats.update({"total_matches": len(matched_a_uids), "by_method": methods})
+        return result
 
-        return MatchResult(
-            matches=matches,
-            unmatched_a=unmatched_a,
-            unmatched_b=unmatched_b,
+    def _product_match(self, product_a: Product, product_b: Product, result: Match) -> ProductMatch:
+        return ProductMatch(
+            product_a=product_a,
+            product_b=product_b,
+            confidence=result.confidence,
+            method=result.method,
+            status="confirmed" if result.confidence >= 0.85 else "pending",
         )
 
+    def _resolve_greedy(
+        self,
+        products_a: list[Product],
+        scored: list[ScoredCandidates],
+        carried: set[tuple[str, str]],
+    ) -> Iterator[ProductMatch]:
+        matched_b_uids = {uid_b for _, uid_b in carried}
+
+        for product_a, candidates in zip(products_a, scored):
+            kept = [(b, r) for b, r in candidates if (product_a.uid, b.uid) in carried]
+            if kept:
+                yield self._product_match(product_a, *kept[0])
+                continue
+
+            best: Optional[tuple[Product, Match]] = None
+            best_confidence = 0.0
+
+            for product_b, result in candidates:
+                if product_b.uid in matched_b_uids:
+                    continue
+
+                if result.confidence > best_confidence:
+                    best_confidence = result.confidence
+                    best = (product_b, result)
+
+            if best and best_confidence >= self.fuzzy_threshold:
+                matched_b_uids.add(best[0].uid)
+                yield self._product_match(product_a, *best)
+
+    def _resolve_global(
+        self,
+        products_a: list[Product],
+        scored: list[ScoredCandidates],
+        carried: set[tuple[str, str]],
+    ) -> Iterator[ProductMatch]:
+        # Rows and columns are numbered in uid order so that ties are broken
+        # the same way whatever the input order.
+        rows = sorted(range(len(products_a)), key=lambda i: products_a[i].uid)
+        products_b = {
+            product_b.uid: product_b
+            for candidates in scored
+            for product_b, _ in candidates
+        }
+        cols = sorted(products_b)
+        col_of = {uid: col for col, uid in enumerate(cols)}
+
+        results: dict[tuple[int, int], Match] = {}
+        edges: list[Edge] = []
+        pinned: list[Edge] = []
+        kept: list[Edge] = []
+
+        for row, i in enumerate(rows):
+            for product_b, result in scored[i]:
+                if result.confidence < self.fuzzy_threshold:
+                    continue
+                col = col_of[product_b.uid]
+                results[row, col] = result
+                weight = result.confidence + _tie_break(products_a[i].uid, product_b.uid)
+                if result.method in EXACT_METHODS and result.confidence >= 1.0:
+                    pinned.append((row, col, weight))
+                elif (products_a[i].uid, product_b.uid) in carried:
+                    kept.append((row, col, weight))
+                else:
+                    edges.append((row, col, weight))
+
+        for chosen in assign_components(edges, pinned, self.max_exact_component, kept):
+            for row, col, _ in sorted(chosen):
+                yield self._product_match(
+                    products_a[rows[row]], products_b[cols[col]], results[row, col]
+                )
+
     def match_all_pairs(self, products: list[Product]) -> MatchResult:
         by_supplier: dict[str, list[Product]] = {}
         for p in products:
@@ -76,8 +722,115 @@ class MatchingEngine:
         suppliers = list(by_supplier.keys())
         if len(suppliers) < 2:
             return MatchResult(matches=[], unmatched_a=products, unmatched_b=[])
+        if len(suppliers) > 2:
+            raise ValueError(
+                f"match_all_pairs matches two suppliers, got {len(suppliers)}: "
+                "use match_clusters instead"
+            )
 
         products_a = by_supplier[suppliers[0]]
         products_b = by_supplier[suppliers[1]]
 
         return self.match(products_a, products_b)
+
+    def match_clusters(
+        self, products: list[Product], index: Optional[MatchIndex] = None
+    ) -> ClusterResult:
+        stats = MatchStats() if self.instrument else None
+
+        with stage(stats, "index_build"):
+            if index is None:
+                index = self.build_index(products)
+
+        if self.ngram_top_k:
+            with stage(stats, "ngram_lookup"):
+                index.prepare_ngrams(
+                    list(index.products.values()), self.ngram_top_k, exclude_own_supplier=True
+                )
+
+        # Most scored pairs never make it into a cluster, so they are kept as
+        # flat columns (product pairs, confidences, methods) until clustering
+        # and only the accepted ones become ProductMatch objects.
+        link_products: list[Product] = []
+        link_confidences = array("d")
+        link_methods: list[str] = []
+        # Neighbour and token lookups are not symmetric; a pair found from
+        # both sides is scored once. Products that found a pair before the
+        # other side's turn are parked under it until then.
+        pending: dict[str, list[str]] = {}
+        done: set[str] = set()
+
+        with stage(stats, "score"):
+            for product in index.products.values():
+                blocked = [
+                    p for p in index.find_candidates(product) if p.supplier != product.supplier
+                ]
+                # Block keys are symmetric, so each pair is scored from the
+                # side with the smaller uid only.
+                candidates = [p for p in blocked if product.uid < p.uid]
+
+                extra: list[Product] = []
+                if self.ngram_top_k:
+                    blocked_uids = {p.uid for p in blocked}
+                    extra = [
+                        p
+                        for p in index.find_by_ngrams(
+                            product, self.ngram_top_k, exclude_own_supplier=True
+                        )
+                        if p.uid not in blocked_uids
+                    ]
+                    if stats is not None:
+                        stats.count("ngram_candidates", len(extra))
+                if not blocked:
+                    fallback = index.find_by_tokens(product, exclude_supplier=product.supplier)
+                    if stats is not None:
+                        stats.count("fallback_queries")
+                        if fallback:
+                            stats.count("fallback_hits")
+                    extra += fallback
+
+                seen = pending.pop(product.uid, ())
+                for p in {p.uid: p for p in extra}.values():
+                    if p.uid in seen:
+                        continue
+                    if p.uid not in done:
+                        pending.setdefault(p.uid, []).append(product.uid)
+                    candidates.append(p)
+                done.add(product.uid)
+
+                if stats is not None:
+                    stats.record_candidates(len(candidates))
+
+                for other in candidates:
+                    result = compute_similarity(product, other, stats, self.fuzzy_threshold)
+                    if result and result.confidence >= self.fuzzy_threshold:
+                        link_products += (product, other)
+                        link_confidences.append(result.confidence)
+                        link_methods.append(result.method)
+            del pending, done
+
+        with stage(stats, "cluster"):
+            # A stable sort on the negated confidences ranks links as
+            # sorted(reverse=True) would, ties in scoring order.
+            order = np.argsort(-np.array(link_confidences), kind="stable")
+            # One timestamp for the run instead of a datetime on each link.
+            matched_at = datetime.now()
+            clusters = build_ranked_clusters(
+                ProductMatch(
+                    product_a=link_products[2 * i],
+                    product_b=link_products[2 * i + 1],
+                    confidence=link_confidences[i],
+                    method=link_methods[i],
+                    status="confirmed" if link_confidences[i] >= 0.85 else "pending",
+                    matched_at=matched_at,
+                )
+                for i in order
+            )
+            clustered = {p.uid for c in clusters for p in c.products}
+            clusters.sort(key=lambda c: (len(c.products), c.confidence), reverse=True)
+
+        return ClusterResult(
+            clusters=clusters,
+            unclustered=[p for p in index.products.values() if p.uid not in clustered],
+            run_stats=stats.to_dict() if stats is not None else {},
+        )
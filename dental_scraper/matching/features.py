@@ -0,0 +1,67 @@
+import hashlib
+import sys
+from dataclasses import dataclass
+from functools import cache, lru_cache
+from typing import Optional
+
+from rapidfuzz import fuzz
+
+from .models import Product
+
+
+@dataclass(slots=True)
+class MatchFeatures:
+    sorted_name: str
+    brand: str
+    category: str
+    category_id: int
+    quantity: Optional[int]
+    unit: str
+    ean: Optional[str]
+    manufacturer_code: Optional[str]
+    anvisa_registration: Optional[str]
+
+    @property
+    def tokens(self) -> tuple[str, ...]:
+        # Derived on use instead of stored: only indexing and the token
+        # fallback need them, and a stored tuple of fresh strings per product
+        # cost more memory than the rest of the features together.
+        return tuple(dict.fromkeys(self.sorted_name.split()))
+
+
+@cache
+def category_id(category: str) -> int:
+    # Derived from the text rather than assigned in order, so ids agree
+    # between the parent process and scoring workers.
+    if not category:
+        return -1
+    digest = hashlib.blake2b(category.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True) & sys.maxsize
+
+
+@lru_cache(maxsize=4096)
+def category_similarity(category_a: str, category_b: str) -> float:
+    return fuzz.ratio(category_a, category_b) / 100
+
+
+def extract_features(product: Product) -> MatchFeatures:
+    words = (product.normalized_name or "").split()
+    category = product.category or ""
+    return MatchFeatures(
+        sorted_name=" ".join(sorted(words)),
+        brand=product.brand_key,
+        category=category,
+        category_id=category_id(category),
+        quantity=product.quantity,
+        unit=sys.intern(product.unit.lower()) if product.unit else "",
+        ean=product.ean,
+        manufacturer_code=product.manufacturer_code,
+        anvisa_registration=product.anvisa_registration,
+    )
+
+
+def features_of(product: Product) -> MatchFeatures:
+    features = product.features
+    if features is None:
+        features = product.features = extract_features(product)
+    return features
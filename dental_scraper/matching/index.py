@@ -1,90 +1,260 @@
+import math
 from collections import defaultdict
+from collections.abc import Container, Iterable, Iterator
 from typing import Optional
 
+from ..normalization.codes import normalize_gtin
+from .features import features_of
 from .models import Product
+from .ngrams import NgramIndex
 
+Bucket = dict[str, Product]
 
-class MatchIndex:
-    def __init__(self):
-        self.by_ean: dict[str, list[Product]] = defaultdict(list)
-        self.by_manufacturer_code: dict[str, list[Product]] = defaultdict(list)
-        self.by_anvisa: dict[str, list[Product]] = defaultdict(list)
-        self.by_brand_category: dict[str, list[Product]] = defaultdict(list)
-        self.all_products: list[Product] = []
 
-    def add(self, product: Product) -> None:
-        self.all_products.append(product)
+class MatchIndex:
+    def __init__(self, fuzzy_top_k: int = 20, posting_budget: int = 5000, ngram_top_k: int = 10):
+        self.fuzzy_top_k = fuzzy_top_k
+        self.posting_budget = posting_budget
+        self.ngram_top_k = ngram_top_k
+        self.products: dict[str, Product] = {}
+        self.by_ean: dict[str, Bucket] = defaultdict(dict)
+        self.by_manufacturer_code: dict[str, Bucket] = defaultdict(dict)
+        self.by_anvisa: dict[str, Bucket] = defaultdict(dict)
+        self.by_brand_category: dict[str, Bucket] = defaultdict(dict)
+        self.by_token: dict[str, Bucket] = defaultdict(dict)
+        self._tables = {
+            "ean": self.by_ean,
+            "manufacturer_code": self.by_manufacturer_code,
+            "anvisa": self.by_anvisa,
+            "brand_category": self.by_brand_category,
+            "token": self.by_token,
+        }
+        self._ngrams: Optional[NgramIndex] = None
+        self._ngram_neighbours: dict[str, tuple[Product, tuple, list[Product]]] = {}
+        # Set once buckets are shared with a copy: only the ones listed here
+        # may be written in place, the rest are copied first.
+        self._owned: Optional[set[tuple[str, str]]] = None
 
+    def _buckets(self, product: Product, with_tokens: bool = True) -> Iterator[tuple[str, str]]:
         if product.ean:
-            self.by_ean[product.ean].append(product)
+            yield "ean", product.ean
 
         if product.manufacturer_code and product.normalized_brand:
-            key = f"{product.normalized_brand}:{product.manufacturer_code}"
-            self.by_manufacturer_code[key].append(product)
+            yield "manufacturer_code", f"{product.normalized_brand}:{product.manufacturer_code}"
 
         if product.anvisa_registration:
-            self.by_anvisa[product.anvisa_registration].append(product)
+            yield "anvisa", product.anvisa_registration
 
         if product.normalized_brand and product.category:
-            key = f"{product.normalized_brand}:{product.category}"
-            self.by_brand_category[key].append(product)
+            yield "brand_category", f"{product.normalized_brand}:{product.category}"
+
+        if with_tokens:
+            for token in features_of(product).tokens:
+                yield "token", token
+
+    def lookup_keys(self, product: Product, with_tokens: bool = True) -> list[str]:
+        # The buckets a product is filed under, or looked up in, as plain
+        # strings that can be kept between runs.
+        return [f"{table}:{key}" for table, key in self._buckets(product, with_tokens)]
+
+    def filed_under(self, keys: Iterable[str]) -> dict[str, Product]:
+        # The products filed under any of the given lookup keys.
+        found: dict[str, Product] = {}
+        for key in keys:
+            table, _, value = key.partition(":")
+            found.update(self._tables[table].get(value, ()))
+        return found
+
+    def copy(self) -> "MatchIndex":
+        # Buckets are shared until either index changes one, so a copy costs
+        # a dict per table rather than a rebuild, and updating it leaves this
+        # index as it was for whoever is still reading it.
+        index = MatchIndex(self.fuzzy_top_k, self.posting_budget, self.ngram_top_k)
+        index.products = dict(self.products)
+        for name, table in self._tables.items():
+            index._tables[name].update(table)
+        self._owned = set()
+        index._owned = set()
+        return index
+
+    def _writable(self, table: str, key: str) -> Bucket:
+        bucket = self._tables[table][key]
+        if self._owned is not None and (table, key) not in self._owned:
+            bucket = self._tables[table][key] = dict(bucket)
+            self._owned.add((table, key))
+        return bucket
 
-    def add_many(self, products: list[Product]) -> None:
+    def add(self, product: Product) -> None:
+        if product.uid in self.products:
+            self.remove(product.uid)
+
+        self.products[product.uid] = product
+        if self._ngrams is not None:
+            self._clear_ngrams()
+        for table, key in self._buckets(product):
+            self._writable(table, key)[product.uid] = product
+
+    def add_many(self, products: Iterable[Product]) -> None:
         for product in products:
             self.add(product)
 
+    def remove(self, uid: str) -> Optional[Product]:
+        product = self.products.pop(uid, None)
+        if product is None:
+            return None
+
+        if self._ngrams is not None:
+            self._clear_ngrams()
+        for table, key in self._buckets(product):
+            if key in self._tables[table]:
+                bucket = self._writable(table, key)
+                bucket.pop(uid, None)
+                if not bucket:
+                    del self._tables[table][key]
+        return product
+
+    def update(self, product: Product) -> None:
+        self.add(product)
+
+    def get(self, uid: str) -> Optional[Product]:
+        return self.products.get(uid)
+
+    @property
+    def all_products(self) -> list[Product]:
+        return list(self.products.values())
+
     def find_by_ean(self, ean: str) -> list[Product]:
-        return self.by_ean.get(ean, [])
+        return list(self.by_ean.get(normalize_gtin(ean) or ean, {}).values())
 
     def find_by_manufacturer_code(self, brand: str, code: str) -> list[Product]:
         key = f"{brand}:{code}"
-        return self.by_manufacturer_code.get(key, [])
+        return list(self.by_manufacturer_code.get(key, {}).values())
 
     def find_by_anvisa(self, anvisa: str) -> list[Product]:
-        return self.by_anvisa.get(anvisa, [])
+        return list(self.by_anvisa.get(anvisa, {}).values())
 
     def find_by_brand_category(self, brand: str, category: str) -> list[Product]:
         key = f"{brand}:{category}"
-        return self.by_brand_category.get(key, [])
+        return list(self.by_brand_category.get(key, {}).values())
 
-    def find_candidates(self, product: Product) -> list[Product]:
-        candidates = set()
+    def find_by_tokens(
+        self,
+        product: Product,
+        top_k: Optional[int] = None,
+        exclude_supplier: Optional[str] = None,
+    ) -> list[Product]:
+        top_k = top_k or self.fuzzy_top_k
+        tokens = features_of(product).tokens
+        # Ties are broken by token and by uid throughout, so the candidates
+        # do not depend on the order products were added in.
+        postings = [
+            self.by_token[t]
+            for _, t in sorted((len(self.by_token[t]), t) for t in tokens if t in self.by_token)
+        ]
+        if not postings:
+            return []
 
-        if product.ean:
-            for p in self.find_by_ean(product.ean):
-                if p.uid != product.uid:
-                    candidates.add(p.uid)
+        total = len(self.products)
+        scores: dict[str, float] = {}
+        visited = 0
 
-        if product.manufacturer_code and product.normalized_brand:
-            for p in self.find_by_manufacturer_code(
-                product.normalized_brand, product.manufacturer_code
-            ):
-                if p.uid != product.uid:
-                    candidates.add(p.uid)
+        # Rarest tokens first: they carry the most weight, and very common
+        # tokens ("de", "com", ...) are cut off by the posting budget.
+        for posting in postings:
+            if visited and visited + len(posting) > self.posting_budget:
+                break
+            visited += len(posting)
 
-        if product.anvisa_registration:
-            for p in self.find_by_anvisa(product.anvisa_registration):
-                if p.uid != product.uid:
-                    candidates.add(p.uid)
+            idf = math.log(1 + total / len(posting))
+            for uid in posting:
+                scores[uid] = scores.get(uid, 0.0) + idf
 
-        if product.normalized_brand and product.category:
-            for p in self.find_by_brand_category(
-                product.normalized_brand, product.category
-            ):
-                if p.uid != product.uid:
-                    candidates.add(p.uid)
+        scores.pop(product.uid, None)
+        ranked = sorted(scores, key=lambda uid: (-scores[uid], uid))
+        if exclude_supplier is None:
+            return [self.products[uid] for uid in ranked[:top_k]]
+
+        candidates = []
+        for uid in ranked:
+            p = self.products[uid]
+            if p.supplier != exclude_supplier:
+                candidates.append(p)
+                if len(candidates) == top_k:
+                    break
+        return candidates
+
+    def _clear_ngrams(self) -> None:
+        self._ngrams = None
+        self._ngram_neighbours = {}
+
+    @property
+    def ngrams(self) -> NgramIndex:
+        # Built on first use and dropped whenever the index changes.
+        if self._ngrams is None:
+            self._ngrams = NgramIndex(self.products.values())
+        return self._ngrams
 
-        uid_to_product = {p.uid: p for p in self.all_products}
-        return [uid_to_product[uid] for uid in candidates if uid in uid_to_product]
+    def prepare_ngrams(
+        self,
+        products: list[Product],
+        top_k: Optional[int] = None,
+        exclude_own_supplier: bool = False,
+    ) -> None:
+        top_k = top_k or self.ngram_top_k
+        key = (top_k, exclude_own_supplier)
+        neighbours = self.ngrams.top_k(products, top_k, exclude_own_supplier)
+        self._ngram_neighbours = {
+            product.uid: (product, key, [p for p, _ in found])
+            for product, found in zip(products, neighbours)
+        }
+
+    def find_by_ngrams(
+        self,
+        product: Product,
+        top_k: Optional[int] = None,
+        exclude_own_supplier: bool = False,
+    ) -> list[Product]:
+        top_k = top_k or self.ngram_top_k
+        key = (top_k, exclude_own_supplier)
+        # Compared by value, not identity: products sent to worker processes
+        # are copies of the ones the neighbours were prepared for.
+        cached = self._ngram_neighbours.get(product.uid)
+        if cached is not None and cached[1] == key and cached[0] == product:
+            return list(cached[2])
+        return [p for p, _ in self.ngrams.top_k([product], top_k, exclude_own_supplier)[0]]
+
+    def find_candidates(self, product: Product) -> list[Product]:
+        candidates: Bucket = {}
+
+        for table, key in self._buckets(product, with_tokens=False):
+            bucket = self._tables[table].get(key)
+            if bucket:
+                candidates.update(bucket)
+
+        candidates.pop(product.uid, None)
+        return list(candidates.values())
+
+    def has_candidates(self, product: Product, ignore: Container[str] = ()) -> bool:
+        # Whether find_candidates would return anything besides the ignored
+        # uids, without building the list.
+        return any(
+            uid != product.uid and uid not in ignore
+            for table, key in self._buckets(product, with_tokens=False)
+            for uid in self._tables[table].get(key, ())
+        )
 
     def __len__(self) -> int:
-        return len(self.all_products)
+        return len(self.products)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.products
 
     def stats(self) -> dict:
         return {
-            "total_products": len(self.all_products),
+            "total_products": len(self.products),
             "with_ean": len(self.by_ean),
             "with_manufacturer_code": len(self.by_manufacturer_code),
             "with_anvisa": len(self.by_anvisa),
             "by_brand_category": len(self.by_brand_category),
+            "by_token": len(self.by_token),
         }
@@ -0,0 +1,150 @@
+import json
+import logging
+import re
+from collections.abc import Iterator
+from itertools import chain
+from pathlib import Path
+from typing import Optional
+
+from .index import MatchIndex
+from .models import Product
+from .snapshot import SNAPSHOT_SUFFIX, CatalogSnapshot
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\r\n"
+
+_decoder = json.JSONDecoder()
+
+# Whole strings, so brackets and commas inside them are skipped; a lone quote
+# is a string that runs past the end of the buffer.
+_STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\],"]')
+
+
+def _skip(buffer: str, pos: int, chars: str) -> int:
+    while pos < len(buffer) and buffer[pos] in chars:
+        pos += 1
+    return pos
+
+
+def _value_end(buffer: str, pos: int) -> Optional[int]:
+    # Where the array element starting at pos ends, going by strings and
+    # nesting alone, so it also works for an element that does not parse.
+    # None if the buffer ends first.
+    depth = 0
+    for match in _STRUCTURE.finditer(buffer, pos):
+        token = match.group()
+        if token == '"':
+            return None
+        if token[0] == '"':
+            continue
+        if token in "{[":
+            depth += 1
+        elif token in "}]":
+            if depth == 0:
+                # A stray "}" is part of the bad element; a "]" closes the array.
+                return match.end() if token == "}" else match.start()
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif depth == 0:
+            return match.start()
+    return None
+
+
+def _iter_array(f, buffer: str, path: Path) -> Iterator[dict]:
+    pos = _skip(buffer, 0, WHITESPACE) + 1
+    offset = 0
+    eof = False
+
+    while True:
+        pos = _skip(buffer, pos, WHITESPACE + ",")
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+
+        try:
+            record, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            skip_to = _value_end(buffer, pos)
+            if skip_to is not None:
+                # The whole element is there and still does not parse: skip
+                # it and carry on from the next one.
+                logger.warning(f"{path}: skipped malformed record at offset {offset + pos}")
+                pos = skip_to
+                continue
+            if eof:
+                if buffer[pos:].strip():
+                    logger.warning(f"{path}: dropped truncated record at end of file")
+                else:
+                    logger.warning(f"{path}: array is not closed")
+                return
+            chunk = f.read(CHUNK_SIZE)
+            eof = not chunk
+            offset += pos
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        # A record that ends exactly at the buffer edge may be a number or
+        # literal cut short, so only trust it once more input has been seen.
+        if end == len(buffer) and not eof and not isinstance(record, dict):
+            chunk = f.read(CHUNK_SIZE)
+            eof = not chunk
+            offset += pos
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        pos = end
+        if isinstance(record, dict):
+            yield record
+
+
+def _iter_lines(f, buffer: str, path: Path) -> Iterator[dict]:
+    lines = buffer.split("\n")
+    lines[-1] += f.readline()
+
+    for line_number, line in enumerate(chain(lines, f), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"{path}:{line_number}: skipped malformed record")
+            continue
+        if isinstance(record, dict):
+            yield record
+
+
+def iter_records(path: Path) -> Iterator[dict]:
+    path = Path(path)
+    with open(path, encoding="utf-8") as f:
+        buffer = f.read(CHUNK_SIZE)
+        while buffer and not buffer.strip():
+            buffer = f.read(CHUNK_SIZE)
+        if not buffer:
+            return
+
+        if buffer.lstrip().startswith("["):
+            yield from _iter_array(f, buffer, path)
+        else:
+            yield from _iter_lines(f, buffer, path)
+
+
+def iter_products(path: Path) -> Iterator[Product]:
+    if Path(path).suffix == SNAPSHOT_SUFFIX:
+        with CatalogSnapshot(path) as snapshot:
+            yield from snapshot
+        return
+
+    for record in iter_records(path):
+        yield Product.from_dict(record)
+
+
+def load_index(path: Path, index: Optional[MatchIndex] = None) -> MatchIndex:
+    if index is None:
+        index = MatchIndex()
+    index.add_many(iter_products(path))
+    return index
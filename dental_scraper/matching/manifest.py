@@ -0,0 +1,126 @@
+import fcntl
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from .snapshot import SNAPSHOT_SUFFIX
+
+MANIFEST_NAME = "manifest.json"
+VERSION = 1
+
+# Run ids are the export timestamps, so they sort in run order as strings.
+RUN_FORMAT = "%Y%m%d_%H%M%S"
+
+# A snapshot of the same run loads without reparsing JSON.
+PREFERRED_SUFFIXES = (SNAPSHOT_SUFFIX, ".json")
+
+
+@dataclass
+class ManifestEntry:
+    spider: str
+    run: str
+    file: str
+    items: int
+    bytes: int
+    sha256: str
+    finished_at: str
+
+    @classmethod
+    def describe(cls, path: Path, spider: str, run: str, items: int) -> "ManifestEntry":
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        return cls(
+            spider=spider,
+            run=run,
+            file=path.name,
+            items=items,
+            bytes=path.stat().st_size,
+            sha256=digest,
+            finished_at=datetime.now().isoformat(),
+        )
+
+    @property
+    def suffix(self) -> str:
+        return Path(self.file).suffix
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ExportManifest:
+    # One small JSON document per output directory listing, for each spider,
+    # the files of its latest completed run. Exporters only record a file
+    # after it is closed and renamed into place, so readers never see a
+    # half-written export, and the manifest itself is replaced atomically.
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_NAME
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> dict[str, list[ManifestEntry]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if data.get("version") != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} export manifest")
+        return {
+            spider: [ManifestEntry(**entry) for entry in entries]
+            for spider, entries in data["spiders"].items()
+        }
+
+    def record(self, entry: ManifestEntry) -> None:
+        # Spiders run in separate processes and finish in any order; the lock
+        # keeps their read-modify-write cycles from losing each other's runs.
+        with open(self.path.with_name(self.path.name + ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            spiders = self.load()
+
+            entries = spiders.get(entry.spider, [])
+            run = max((e.run for e in entries), default="")
+            if entry.run < run:
+                # An older run that finished late must not replace a newer one.
+                return
+            if entry.run > run:
+                entries = []
+            entries = [e for e in entries if e.file != entry.file] + [entry]
+            spiders[entry.spider] = entries
+
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": VERSION,
+                        "spiders": {
+                            spider: [e.to_dict() for e in entries]
+                            for spider, entries in sorted(spiders.items())
+                        },
+                    },
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+            os.replace(tmp_path, self.path)
+
+    def latest(self) -> dict[str, Path]:
+        files = {}
+        for spider, entries in self.load().items():
+            entry = _preferred(entries)
+            if entry is not None:
+                files[spider] = self.output_dir / entry.file
+        return files
+
+
+def _preferred(entries: list[ManifestEntry]) -> Optional[ManifestEntry]:
+    by_suffix = {entry.suffix: entry for entry in entries}
+    for suffix in PREFERRED_SUFFIXES:
+        if suffix in by_suffix:
+            return by_suffix[suffix]
+    return None
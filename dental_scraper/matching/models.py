@@ -1,10 +1,39 @@
+import sys
+from collections.abc import Iterable
 from dataclasses import dataclass, field
 from datetime import datetime
-from decimal import Decimal
-from typing import Optional
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import TYPE_CHECKING, Optional
 
+from ..normalization.codes import normalize_anvisa, normalize_gtin
 
-@dataclass
+if TYPE_CHECKING:
+    from .features import MatchFeatures
+
+
+def _intern(value: Optional[str]) -> str:
+    return sys.intern(value) if value else ""
+
+
+def _cents(value) -> Optional[int]:
+    if not value:
+        return None
+    # Through Decimal, not float, so 1.005 is 101 cents rather than 100.
+    try:
+        return int((Decimal(str(value)) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"invalid price: {value!r}") from None
+
+
+def _decimal(cents: Optional[int]) -> Optional[Decimal]:
+    return None if cents is None else Decimal(cents).scaleb(-2)
+
+
+def _float(cents: Optional[int]) -> Optional[float]:
+    return cents / 100 if cents else None
+
+
+@dataclass(slots=True)
 class Product:
     supplier: str
     external_id: str
@@ -14,48 +43,85 @@ class Product:
     brand: str
     normalized_brand: str
     category: str
-    quantity: int
+    quantity: Optional[int]
     unit: str
-    price: Optional[Decimal]
-    pix_price: Optional[Decimal]
+    price_cents: Optional[int]
+    pix_price_cents: Optional[int]
     ean: Optional[str]
     manufacturer_code: Optional[str]
     anvisa_registration: Optional[str]
     in_stock: bool
+    uid: str = field(init=False, repr=False, compare=False)
+    brand_key: str = field(init=False, repr=False, compare=False)
+    features: Optional["MatchFeatures"] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.uid = f"{self.supplier}:{self.external_id}"
+        self.brand_key = _intern(self.normalized_brand.lower()) if self.normalized_brand else ""
+
+    @property
+    def price(self) -> Optional[Decimal]:
+        return _decimal(self.price_cents)
 
     @property
-    def uid(self) -> str:
-        return f"{self.supplier}:{self.external_id}"
+    def pix_price(self) -> Optional[Decimal]:
+        return _decimal(self.pix_price_cents)
 
     @classmethod
     def from_dict(cls, data: dict) -> "Product":
         return cls(
-            supplier=data.get("supplier", ""),
+            supplier=_intern(data.get("supplier")),
             external_id=data.get("external_id", ""),
             external_url=data.get("external_url", ""),
             name=data.get("name", ""),
             normalized_name=data.get("normalized_name", ""),
-            brand=data.get("brand", ""),
-            normalized_brand=data.get("normalized_brand", ""),
-            category=data.get("category", ""),
+            brand=_intern(data.get("brand")),
+            normalized_brand=_intern(data.get("normalized_brand")),
+            category=_intern(data.get("category")),
             quantity=data.get("quantity", 1),
-            unit=data.get("unit", "unidade"),
-            price=Decimal(str(data["price"])) if data.get("price") else None,
-            pix_price=Decimal(str(data["pix_price"])) if data.get("pix_price") else None,
-            ean=data.get("ean"),
+            unit=_intern(data.get("unit", "unidade")),
+            price_cents=_cents(data.get("price")),
+            pix_price_cents=_cents(data.get("pix_price")),
+            ean=normalize_gtin(data.get("ean")),
             manufacturer_code=data.get("manufacturer_code"),
-            anvisa_registration=data.get("anvisa_registration"),
+            anvisa_registration=normalize_anvisa(data.get("anvisa_registration")),
             in_stock=data.get("in_stock", False),
         )
 
+    @classmethod
+    def from_snapshot(cls, path) -> list["Product"]:
+        from .snapshot import CatalogSnapshot
 
-@dataclass
+        with CatalogSnapshot(path) as snapshot:
+            return list(snapshot)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> list["Product"]:
+        # Rows from the CSV exporter carry every value as a string.
+        products = []
+        for row in rows:
+            # Coerced on a copy so the caller's rows are left as they were.
+            row = dict(row)
+            quantity = row.get("quantity")
+            if isinstance(quantity, str):
+                row["quantity"] = int(quantity) if quantity.isdigit() else 1
+            in_stock = row.get("in_stock")
+            if isinstance(in_stock, str):
+                row["in_stock"] = in_stock.lower() == "true"
+            for key in ("ean", "manufacturer_code", "anvisa_registration"):
+                if row.get(key) == "":
+                    row[key] = None
+            products.append(cls.from_dict(row))
+        return products
+
+
+@dataclass(slots=True)
 class Match:
     confidence: float
     method: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ProductMatch:
     product_a: Product
     product_b: Product
@@ -66,23 +132,24 @@ class ProductMatch:
 
     @property
     def price_diff_absolute(self) -> Optional[Decimal]:
-        if self.product_a.price and self.product_b.price:
-            return self.product_b.price - self.product_a.price
+        if self.product_a.price_cents and self.product_b.price_cents:
+            return _decimal(self.product_b.price_cents - self.product_a.price_cents)
         return None
 
     @property
     def price_diff_percent(self) -> Optional[float]:
-        if self.product_a.price and self.product_b.price and self.product_a.price > 0:
-            diff = float(self.product_b.price - self.product_a.price)
-            return round((diff / float(self.product_a.price)) * 100, 2)
+        price_a, price_b = self.product_a.price_cents, self.product_b.price_cents
+        if price_a and price_b and price_a > 0:
+            return round(((price_b - price_a) / price_a) * 100, 2)
         return None
 
     @property
     def cheaper_supplier(self) -> Optional[str]:
-        if self.product_a.price and self.product_b.price:
-            if self.product_a.price < self.product_b.price:
+        price_a, price_b = self.product_a.price_cents, self.product_b.price_cents
+        if price_a and price_b:
+            if price_a < price_b:
                 return self.product_a.supplier
-            elif self.product_b.price < self.product_a.price:
+            elif price_b < price_a:
                 return self.product_b.supplier
         return None
 
@@ -92,15 +159,15 @@ class ProductMatch:
                 "supplier": self.product_a.supplier,
                 "external_id": self.product_a.external_id,
                 "name": self.product_a.name,
-                "price": float(self.product_a.price) if self.product_a.price else None,
-                "pix_price": float(self.product_a.pix_price) if self.product_a.pix_price else None,
+                "price": _float(self.product_a.price_cents),
+                "pix_price": _float(self.product_a.pix_price_cents),
             },
             "product_b": {
                 "supplier": self.product_b.supplier,
                 "external_id": self.product_b.external_id,
                 "name": self.product_b.name,
-                "price": float(self.product_b.price) if self.product_b.price else None,
-                "pix_price": float(self.product_b.pix_price) if self.product_b.pix_price else None,
+                "price": _float(self.product_b.price_cents),
+                "pix_price": _float(self.product_b.pix_price_cents),
             },
             "confidence": self.confidence,
             "method": self.method,
@@ -116,10 +183,11 @@ class MatchResult:
     matches: list[ProductMatch]
     unmatched_a: list[Product]
     unmatched_b: list[Product]
+    run_stats: dict = field(default_factory=dict)
 
     @property
     def stats(self) -> dict:
-        methods = {}
+        methods: dict[str, int] = {}
         for m in self.matches:
             methods[m.method] = methods.get(m.method, 0) + 1
 
@@ -128,6 +196,7 @@ class MatchResult:
             "by_method": methods,
             "unmatched_a": len(self.unmatched_a),
             "unmatched_b": len(self.unmatched_b),
+            **self.run_stats,
         }
 
     def to_dict(self) -> dict:
@@ -135,3 +204,142 @@ class MatchResult:
             "matches": [m.to_dict() for m in self.matches],
             "stats": self.stats,
         }
+
+
+@dataclass
+class ProductCluster:
+    products: list[Product]
+    links: list[ProductMatch]
+
+    @property
+    def suppliers(self) -> list[str]:
+        return [p.supplier for p in self.products]
+
+    @property
+    def confidence(self) -> float:
+        return min((link.confidence for link in self.links), default=0.0)
+
+    @property
+    def cheapest(self) -> Optional[Product]:
+        priced = [(p.price_cents, p) for p in self.products if p.price_cents]
+        return min(priced, key=lambda pair: pair[0])[1] if priced else None
+
+    def to_dict(self) -> dict:
+        cheapest = self.cheapest
+        return {
+            "products": [
+                {
+                    "supplier": p.supplier,
+                    "external_id": p.external_id,
+                    "name": p.name,
+                    "price": _float(p.price_cents),
+                    "pix_price": _float(p.pix_price_cents),
+                }
+                for p in self.products
+            ],
+            "links": [
+                {
+                    "a": link.product_a.uid,
+                    "b": link.product_b.uid,
+                    "confidence": link.confidence,
+                    "method": link.method,
+                }
+                for link in self.links
+            ],
+            "confidence": self.confidence,
+            "cheapest_at": cheapest.supplier if cheapest else None,
+        }
+
+
+@dataclass
+class ClusterResult:
+    clusters: list[ProductCluster]
+    unclustered: list[Product]
+    run_stats: dict = field(default_factory=dict)
+
+    @property
+    def stats(self) -> dict:
+        sizes: dict[int, int] = {}
+        for c in self.clusters:
+            sizes[len(c.products)] = sizes.get(len(c.products), 0) + 1
+
+        return {
+            "total_clusters": len(self.clusters),
+            "by_size": dict(sorted(sizes.items())),
+            "unclustered": len(self.unclustered),
+            **self.run_stats,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "clusters": [c.to_dict() for c in self.clusters],
+            "stats": self.stats,
+        }
+
+
+@dataclass
+class DuplicateGroup:
+    # The product kept when collapsing comes first.
+    products: list[Product]
+    similarity: float
+
+    @property
+    def supplier(self) -> str:
+        return self.products[0].supplier
+
+    @property
+    def canonical(self) -> Product:
+        return self.products[0]
+
+    @property
+    def duplicates(self) -> list[Product]:
+        return self.products[1:]
+
+    def to_dict(self) -> dict:
+        return {
+            "supplier": self.supplier,
+            "canonical": self.canonical.external_id,
+            "products": [
+                {
+                    "external_id": p.external_id,
+                    "name": p.name,
+                    "price": _float(p.price_cents),
+                    "in_stock": p.in_stock,
+                }
+                for p in self.products
+            ],
+            "similarity": self.similarity,
+        }
+
+
+@dataclass
+class DedupResult:
+    groups: list[DuplicateGroup]
+    run_stats: dict = field(default_factory=dict)
+
+    @property
+    def duplicate_uids(self) -> set[str]:
+        return {p.uid for g in self.groups for p in g.duplicates}
+
+    def collapse(self, products: Iterable[Product]) -> list[Product]:
+        duplicates = self.duplicate_uids
+        return [p for p in products if p.uid not in duplicates]
+
+    @property
+    def stats(self) -> dict:
+        by_supplier: dict[str, int] = {}
+        for g in self.groups:
+            by_supplier[g.supplier] = by_supplier.get(g.supplier, 0) + len(g.duplicates)
+
+        return {
+            "total_groups": len(self.groups),
+            "duplicates": sum(by_supplier.values()),
+            "by_supplier": dict(sorted(by_supplier.items())),
+            **self.run_stats,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "groups": [g.to_dict() for g in self.groups],
+            "stats": self.stats,
+        }
@@ -0,0 +1,117 @@
+from collections.abc import Iterable
+
+import numpy as np
+from scipy import sparse
+
+from .models import Product
+
+NGRAM_SIZE = 3
+BLOCK_SIZE = 512
+MIN_SIMILARITY = 0.3
+
+# Trigrams shared by more than this share of the catalog ("res", " de") add
+# little to the ranking but make every similarity row nearly dense. Small
+# catalogs are cheap either way and keep them all.
+MAX_DOCUMENT_FREQUENCY = 0.05
+MIN_POSTINGS_LIMIT = 100
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> list[str]:
+    padded = f" {text} "
+    return [padded[i : i + n] for i in range(len(padded) - n + 1)]
+
+
+class NgramIndex:
+    def __init__(
+        self,
+        products: Iterable[Product],
+        min_similarity: float = MIN_SIMILARITY,
+        max_document_frequency: float = MAX_DOCUMENT_FREQUENCY,
+        block_size: int = BLOCK_SIZE,
+    ):
+        self.products = list(products)
+        self.min_similarity = min_similarity
+        self.block_size = block_size
+        self.vocabulary: dict[str, int] = {}
+        self.suppliers: dict[str, int] = {}
+        self._supplier_ids = np.array(
+            [self.suppliers.setdefault(p.supplier, len(self.suppliers)) for p in self.products],
+            dtype=np.int32,
+        )
+
+        counts = self._counts(self.products, grow=True)
+        total = len(self.products)
+        document_frequency = np.bincount(counts.indices, minlength=len(self.vocabulary))
+        idf = np.log((1 + total) / (1 + document_frequency)) + 1
+
+        # Common trigrams are weighted out entirely, so they never pull in
+        # candidates on their own.
+        limit = max(max_document_frequency * total, MIN_POSTINGS_LIMIT)
+        self.idf = np.where(document_frequency > limit, 0, idf).astype(np.float32)
+        self._postings = self._normalize(counts, self.idf).T.tocsr()
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def _counts(self, products: list[Product], grow: bool = False) -> sparse.csr_matrix:
+        vocabulary = self.vocabulary
+        indptr = [0]
+        indices: list[int] = []
+        for product in products:
+            for gram in char_ngrams(product.normalized_name or ""):
+                column = vocabulary.get(gram)
+                if column is None:
+                    if not grow:
+                        continue
+                    column = vocabulary[gram] = len(vocabulary)
+                indices.append(column)
+            indptr.append(len(indices))
+
+        data = np.ones(len(indices), dtype=np.float32)
+        counts = sparse.csr_matrix(
+            (data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(products), len(vocabulary)),
+        )
+        counts.sum_duplicates()
+        return counts
+
+    @staticmethod
+    def _normalize(counts: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+        weighted = counts.copy()
+        weighted.data = (1 + np.log(weighted.data)) * idf[weighted.indices]
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ weighted
+
+    def top_k(
+        self, products: list[Product], k: int, exclude_own_supplier: bool = False
+    ) -> list[list[tuple[Product, float]]]:
+        neighbours: list[list[tuple[Product, float]]] = []
+        for start in range(0, len(products), self.block_size):
+            block = products[start : start + self.block_size]
+            queries = self._normalize(self._counts(block), self.idf)
+            similarities = (queries @ self._postings).tocsr()
+
+            for row, product in enumerate(block):
+                lo, hi = similarities.indptr[row], similarities.indptr[row + 1]
+                scores = similarities.data[lo:hi]
+                columns = similarities.indices[lo:hi]
+
+                keep = scores >= self.min_similarity
+                if exclude_own_supplier:
+                    supplier = self.suppliers.get(product.supplier, -1)
+                    keep &= self._supplier_ids[columns] != supplier
+                scores, columns = scores[keep], columns[keep]
+                # One extra so the query itself can be dropped when indexed.
+                if len(scores) > k + 1:
+                    best = np.argpartition(-scores, k)[: k + 1]
+                    scores, columns = scores[best], columns[best]
+                order = np.argsort(-scores, kind="stable")
+
+                found = []
+                for i in order:
+                    other = self.products[columns[i]]
+                    if other.uid != product.uid:
+                        found.append((other, float(scores[i])))
+                neighbours.append(found[:k])
+        return neighbours
@@ -1,80 +1,293 @@
 import argparse
-import json
+import heapq
+import pkgutil
+import re
+import time
+from collections.abc import Iterable
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
+from .. import spiders
+from .dedup import find_duplicates
 from .engine import MatchingEngine
-from .models import Product
+from .index import MatchIndex
+from .loader import iter_products, load_index
+from .manifest import MANIFEST_NAME, ExportManifest
+from .models import ClusterResult, Product, ProductCluster, ProductMatch
+from .snapshot import SNAPSHOT_SUFFIX
+from .store import MatchStore
+from .writer import ResultWriter
+
+# <spider>_<run>.json from the exporter pipelines, or a bare <spider>.json
+# from `scrapy crawl <spider> -o`; bare names are only taken for spiders
+# this project has, so stray files like foo_backup.json are not catalogs.
+EXPORT_NAME = re.compile(r"^(?P<spider>.+)_\d{8}_\d{6}$")
+KNOWN_SPIDERS = frozenset(
+    module.name for module in pkgutil.iter_modules(spiders.__path__) if module.name != "base"
+)
+
+# Files kept next to the exports that are never supplier catalogs.
+NOT_EXPORTS = (MANIFEST_NAME, "suppliers_metadata.json")
 
 
 def load_products_from_json(file_path: Path) -> list[Product]:
-    with open(file_path, encoding="utf-8") as f:
-        content = f.read()
-        if not content.rstrip().endswith("]"):
-            last_brace = content.rfind("}")
-            content = content[: last_brace + 1] + "]"
-        data = json.loads(content)
+    return list(iter_products(file_path))
 
-    return [Product.from_dict(item) for item in data]
 
+def _is_results(path: Path) -> bool:
+    # Match and cluster results are JSON objects opening with their header;
+    # exports are arrays, or one record per line.
+    with open(path, encoding="utf-8", errors="replace") as f:
+        head = f.read(64)
+    return head.startswith('{\n  "generated_at"')
 
-def find_latest_json_files(output_dir: Path) -> dict[str, Path]:
+
+def find_latest_json_files(output_dir: Path, scan: bool = False) -> dict[str, Path]:
+    # Directories written by the exporter pipelines list their latest
+    # complete run per spider, and the manifest is all that is read. The
+    # directory is only scanned when there is no manifest, or on request for
+    # exports placed by hand or from before the manifest existed.
+    manifest = ExportManifest(output_dir)
+    if manifest.exists() and not scan:
+        return manifest.latest()
+
+    files = _scan_exports(output_dir)
+    files.update(manifest.latest())
+    return files
+
+
+def _scan_exports(output_dir: Path) -> dict[str, Path]:
     files: dict[str, Path] = {}
+    mtimes: dict[str, float] = {}
 
     for json_file in output_dir.glob("*.json"):
-        if json_file.name == "suppliers_metadata.json":
+        if json_file.name in NOT_EXPORTS or _is_results(json_file):
+            continue
+
+        match = EXPORT_NAME.match(json_file.stem)
+        spider = match.group("spider") if match else json_file.stem
+        if not match and spider not in KNOWN_SPIDERS:
             continue
+        mtime = json_file.stat().st_mtime
+        if spider not in files or mtime > mtimes[spider]:
+            files[spider] = json_file
+            mtimes[spider] = mtime
 
-        name = json_file.stem
-        if name.startswith("dental_cremer"):
-            if "dental_cremer" not in files or json_file.stat().st_mtime > files["dental_cremer"].stat().st_mtime:
-                files["dental_cremer"] = json_file
-        elif name.startswith("dental_speed"):
-            if "dental_speed" not in files or json_file.stat().st_mtime > files["dental_speed"].stat().st_mtime:
-                files["dental_speed"] = json_file
+    # A binary snapshot written by the same crawl loads without reparsing JSON.
+    for spider, json_file in files.items():
+        snapshot = json_file.with_suffix(SNAPSHOT_SUFFIX)
+        if snapshot.exists():
+            files[spider] = snapshot
 
     return files
 
 
+class MatchSummary:
+    # What the report prints about a run's matches, kept as they stream by
+    # instead of from a list of all of them.
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.best: list[tuple[float, int, ProductMatch]] = []
+        self.seen = 0
+        self.cheaper_count: dict[str, int] = {}
+        self.total_savings: dict[str, float] = {}
+
+    def add(self, match: ProductMatch) -> None:
+        # Ties keep the order they arrived in.
+        entry = (match.confidence, -self.seen, match)
+        self.seen += 1
+        if len(self.best) < self.top:
+            heapq.heappush(self.best, entry)
+        elif entry[:2] > self.best[0][:2]:
+            heapq.heapreplace(self.best, entry)
+
+        for supplier in (match.product_a.supplier, match.product_b.supplier):
+            self.cheaper_count.setdefault(supplier, 0)
+            self.total_savings.setdefault(supplier, 0.0)
+        cheaper = match.cheaper_supplier
+        price_a, price_b = match.product_a.price_cents, match.product_b.price_cents
+        if cheaper and price_a is not None and price_b is not None:
+            self.cheaper_count[cheaper] += 1
+            self.total_savings[cheaper] += abs(price_a - price_b) / 100
+
+    def top_matches(self) -> list[ProductMatch]:
+        return [match for *_, match in sorted(self.best, key=lambda e: e[:2], reverse=True)]
+
+
+def print_clusters(result: ClusterResult) -> None:
+    print(f"\n{'='*60}")
+    print("CLUSTER RESULTS")
+    print(f"{'='*60}")
+    print(f"Total clusters: {result.stats['total_clusters']}")
+    print(f"By size: {result.stats['by_size']}")
+    print(f"Unclustered products: {result.stats['unclustered']}")
+
+    if result.clusters:
+        print(f"\n{'='*60}")
+        print("TOP 10 CLUSTERS")
+        print(f"{'='*60}")
+
+        for i, cluster in enumerate(result.clusters[:10], 1):
+            print(f"\n{i}. {len(cluster.products)} suppliers - Confidence: {cluster.confidence:.1%}")
+            for product in cluster.products:
+                print(f"   {product.supplier}: {product.name} - R${product.price}")
+            cheapest = cluster.cheapest
+            if cheapest:
+                print(f"   -> Cheapest at {cheapest.supplier}")
+
+
+def print_profile(stats: dict) -> None:
+    if "timings" not in stats:
+        return
+
+    print(f"\n{'='*60}")
+    print("STAGE PROFILE")
+    print(f"{'='*60}")
+    for stage, seconds in stats["timings"].items():
+        print(f"{stage:>20}: {seconds:.3f}s")
+    for name, count in stats["counters"].items():
+        print(f"{name:>20}: {count}")
+    print("Candidates per query:")
+    for bucket, count in stats["candidates_per_query"].items():
+        print(f"{bucket:>20}: {count}")
+
+
+def _results_header(files: dict[str, Path]) -> dict:
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "files_used": {k: str(v) for k, v in files.items()},
+    }
+
+
+def save_results(
+    output_file: Path,
+    key: str,
+    items: Iterable[ProductMatch | ProductCluster],
+    stats: dict,
+    files: dict[str, Path],
+) -> None:
+    with ResultWriter(output_file, key, _results_header(files)) as writer:
+        for item in items:
+            writer.add(item.to_dict())
+        writer.stats = stats
+
+    print(f"\nResults saved to: {output_file}")
+
+
 def run_matching(
     output_dir: Path,
     threshold: float = 0.70,
     output_file: Path | None = None,
+    batch_size: int = 0,
+    workers: int = 1,
+    assignment: str = "global",
+    store_path: Path | None = None,
+    profile: bool = False,
+    ngram_top_k: int = 0,
+    dedup: bool = False,
+    scan_exports: bool = False,
 ) -> None:
-    files = find_latest_json_files(output_dir)
+    files = find_latest_json_files(output_dir, scan_exports)
 
     if len(files) < 2:
         print(f"Need at least 2 supplier files. Found: {list(files.keys())}")
         return
 
-    print(f"Loading products from {len(files)} suppliers...")
-    all_products: list[Product] = []
-
-    for supplier, file_path in files.items():
-        products = load_products_from_json(file_path)
-        print(f"  {supplier}: {len(products)} products")
-        all_products.extend(products)
+    engine = MatchingEngine(
+        fuzzy_threshold=threshold,
+        batch_size=batch_size,
+        workers=workers,
+        assignment=assignment,
+        instrument=profile,
+        ngram_top_k=ngram_top_k,
+    )
 
-    print(f"\nTotal products: {len(all_products)}")
-    print(f"Running matching with threshold: {threshold}...")
+    # Records are indexed as they are parsed, so the raw export is never held
+    # in memory; with more than two suppliers they all share one index.
+    print(f"Loading products from {len(files)} suppliers...")
+    shared = engine.build_index() if len(files) > 2 else None
+    catalogs: dict[str, MatchIndex] = {}
+    total = 0
+    load_start = time.perf_counter()
+
+    # Sorted, so supplier A and B are the same on every run whatever order
+    # the exports were found in.
+    for supplier, file_path in sorted(files.items()):
+        index = shared if shared is not None else engine.build_index()
+        before = len(index)
+        load_index(file_path, index)
+        print(f"  {supplier}: {len(index) - before} products")
+        catalogs[supplier] = index
+        total += len(index) - before
+
+    print(f"\nTotal products: {total}")
+    if dedup:
+        # Repeat listings within a supplier would otherwise compete for the
+        # same counterpart; only the in-stock, cheapest copy is matched.
+        for index in [shared] if shared is not None else catalogs.values():
+            duplicates = find_duplicates(index.all_products)
+            for uid in duplicates.duplicate_uids:
+                index.remove(uid)
+            for supplier, count in duplicates.stats["by_supplier"].items():
+                print(f"  {supplier}: collapsed {count} duplicate listings")
+    if profile:
+        print(f"Loaded and indexed in {time.perf_counter() - load_start:.3f}s")
+    print(f"Running matching with threshold: {threshold} ({workers} worker(s))...")
+
+    if shared is not None:
+        clusters = engine.match_clusters(shared.all_products, index=shared)
+        print_clusters(clusters)
+        print_profile(clusters.stats)
+        if output_file:
+            save_results(output_file, "clusters", clusters.clusters, clusters.stats, files)
+        return
 
-    engine = MatchingEngine(fuzzy_threshold=threshold)
-    result = engine.match_all_pairs(all_products)
+    # Matches go to the writer as the engine resolves them and are never
+    # held as a list; the report is built from the summary's counters.
+    index_a, index_b = catalogs.values()
+    summary = MatchSummary()
+    results: Optional[ResultWriter] = None
+    if output_file:
+        results = ResultWriter(output_file, "matches", _results_header(files))
+
+    def sink(match: ProductMatch) -> None:
+        summary.add(match)
+        if results is not None:
+            results.add(match.to_dict())
+
+    with results if results is not None else nullcontext():
+        if store_path:
+            with MatchStore(store_path) as store:
+                result = engine.match_incremental(
+                    index_a.all_products, index_b.all_products, store, index_a, index_b, sink
+                )
+            print(
+                f"Rescored {result.stats['rescored_a']} products and "
+                f"{result.stats['rescored_pairs']} single pairs, "
+                f"reused {result.stats['cached_edges']} cached pairs"
+            )
+        else:
+            result = engine.match(index_a.all_products, index_b.all_products, index_b, sink)
+        if results is not None:
+            results.stats = result.stats
 
     print(f"\n{'='*60}")
     print("MATCHING RESULTS")
     print(f"{'='*60}")
-    print(f"Total matches: {len(result.matches)}")
+    print(f"Total matches: {result.stats['total_matches']}")
     print(f"By method: {result.stats['by_method']}")
     print(f"Unmatched (supplier A): {len(result.unmatched_a)}")
     print(f"Unmatched (supplier B): {len(result.unmatched_b)}")
+    print_profile(result.stats)
 
-    if result.matches:
+    if summary.seen:
         print(f"\n{'='*60}")
         print("TOP 10 MATCHES")
         print(f"{'='*60}")
 
-        for i, match in enumerate(result.matches[:10], 1):
+        for i, match in enumerate(summary.top_matches(), 1):
             print(f"\n{i}. [{match.method}] Confidence: {match.confidence:.1%}")
             print(f"   A: {match.product_a.name}")
             print(f"      {match.product_a.supplier} - R${match.product_a.price}")
@@ -85,40 +298,16 @@ def run_matching(
                 cheaper = match.cheaper_supplier
                 print(f"   -> Price diff: {diff:+.1f}% (cheaper at {cheaper})")
 
-    if result.matches:
+    if summary.seen:
         print(f"\n{'='*60}")
         print("PRICE COMPARISON SUMMARY")
         print(f"{'='*60}")
 
-        suppliers = set()
-        for m in result.matches:
-            suppliers.add(m.product_a.supplier)
-            suppliers.add(m.product_b.supplier)
-        suppliers = list(suppliers)
-
-        cheaper_count = {s: 0 for s in suppliers}
-        total_savings = {s: 0.0 for s in suppliers}
-
-        for match in result.matches:
-            if match.cheaper_supplier:
-                cheaper_count[match.cheaper_supplier] += 1
-                if match.product_a.price and match.product_b.price:
-                    diff = abs(float(match.product_a.price) - float(match.product_b.price))
-                    total_savings[match.cheaper_supplier] += diff
-
-        for supplier in suppliers:
-            count = cheaper_count[supplier]
-            savings = total_savings[supplier]
+        for supplier, count in summary.cheaper_count.items():
+            savings = summary.total_savings[supplier]
             print(f"{supplier}: cheaper in {count} products (potential savings: R${savings:.2f})")
 
     if output_file:
-        output_data = result.to_dict()
-        output_data["generated_at"] = datetime.now().isoformat()
-        output_data["files_used"] = {k: str(v) for k, v in files.items()}
-
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
-
         print(f"\nResults saved to: {output_file}")
 
 
@@ -140,11 +329,68 @@ def main():
         "--output",
         type=Path,
         default=None,
-        help="Output file for match results (JSON)",
+        help="Output file for match results (JSON, or JSON Lines with a .jsonl suffix)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        help="Score fuzzy candidates in blocks of this many products (0 = pair by pair)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to score candidates",
+    )
+    parser.add_argument(
+        "--assignment",
+        choices=["global", "greedy"],
+        default="global",
+        help="One-to-one resolution: global per component, or greedy in input order",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=None,
+        help="SQLite match store; only new or changed products are rescored",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record per-stage timings and counters and print them",
+    )
+    parser.add_argument(
+        "--ngram-top-k",
+        type=int,
+        default=0,
+        help="Also consider this many nearest names by character trigrams (0 = off)",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Collapse near-duplicate listings within each supplier before matching",
+    )
+    parser.add_argument(
+        "--scan-exports",
+        action="store_true",
+        help="Also scan the directory for exports the manifest does not list",
     )
 
     args = parser.parse_args()
-    run_matching(args.output_dir, args.threshold, args.output)
+    run_matching(
+        args.output_dir,
+        args.threshold,
+        args.output,
+        args.batch_size,
+        args.workers,
+        args.assignment,
+        args.store,
+        args.profile,
+        args.ngram_top_k,
+        args.dedup,
+        args.scan_exports,
+    )
 
 
 if __name__ == "__main__":
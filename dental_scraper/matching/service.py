@@ -0,0 +1,371 @@
+import argparse
+import json
+import math
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+from ..normalization import normalize_brand, normalize_text
+from .engine import MatchingEngine
+from .index import MatchIndex
+from .loader import iter_products
+from .models import Product
+from .runner import find_latest_json_files
+
+REFRESH_INTERVAL = 30.0
+DEFAULT_LIMIT = 3
+MAX_BATCH = 1000
+LATENCY_WINDOW = 10_000
+
+TEXT_FIELDS = (
+    "supplier",
+    "external_id",
+    "external_url",
+    "name",
+    "normalized_name",
+    "brand",
+    "normalized_brand",
+    "category",
+    "unit",
+)
+CODE_FIELDS = ("ean", "manufacturer_code", "anvisa_registration")
+PRICE_FIELDS = ("price", "pix_price")
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _limit(value) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise QueryError("limit must be a positive integer")
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError("limit must be a positive integer") from None
+    if limit <= 0:
+        raise QueryError("limit must be a positive integer")
+    return limit
+
+
+def _coerce(query: dict) -> dict:
+    # Queries come straight from clients; anything the matcher would trip
+    # over is rejected here, as a bad request, rather than mid-scoring.
+    # A null field is the same as a missing one.
+    data = {key: value for key, value in query.items() if value is not None}
+    for key in TEXT_FIELDS:
+        if key in data and not isinstance(data[key], str):
+            raise QueryError(f"{key} must be a string")
+    for key in CODE_FIELDS:
+        value = data.get(key)
+        if isinstance(value, int) and not isinstance(value, bool):
+            data[key] = str(value)
+        elif value is not None and not isinstance(value, str):
+            raise QueryError(f"{key} must be a string")
+    if "quantity" in data:
+        quantity = data["quantity"]
+        if isinstance(quantity, str) and quantity.strip().isdigit():
+            quantity = int(quantity)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            raise QueryError("quantity must be a positive integer")
+        data["quantity"] = quantity
+    for key in PRICE_FIELDS:
+        value = data.get(key)
+        if value is None:
+            continue
+        try:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError
+            price = float(value)
+        except ValueError:
+            raise QueryError(f"{key} must be a number") from None
+        if not math.isfinite(price) or price < 0:
+            raise QueryError(f"{key} must be a non-negative number")
+        data[key] = price
+    if "in_stock" in data and not isinstance(data["in_stock"], bool):
+        raise QueryError("in_stock must be true or false")
+    return data
+
+
+def _price(value: Optional[Decimal]) -> Optional[float]:
+    return float(value) if value else None
+
+
+def _offer(product: Product, confidence: float, method: str) -> dict:
+    return {
+        "supplier": product.supplier,
+        "external_id": product.external_id,
+        "external_url": product.external_url,
+        "name": product.name,
+        "price": _price(product.price),
+        "pix_price": _price(product.pix_price),
+        "in_stock": product.in_stock,
+        "confidence": confidence,
+        "method": method,
+    }
+
+
+class MatchService:
+    def __init__(self, output_dir: Path, engine: Optional[MatchingEngine] = None):
+        self.output_dir = Path(output_dir)
+        self.engine = engine or MatchingEngine()
+        # Catalogs are keyed by the supplier name the products carry, which
+        # is also the first part of their uids; queries may use either that
+        # or the spider name.
+        self.catalogs: dict[str, MatchIndex] = {}
+        self.suppliers: dict[str, str] = {}
+        self.sources: dict[str, tuple[Path, float]] = {}
+        self.loaded_at: Optional[float] = None
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self) -> dict[str, dict[str, int]]:
+        changes = {}
+        with self._refresh_lock:
+            for spider, path in find_latest_json_files(self.output_dir).items():
+                source = (path, path.stat().st_mtime)
+                if self.sources.get(spider) == source:
+                    continue
+
+                # The export is parsed, diffed and indexed without blocking
+                # queries, which keep using the current catalog until the
+                # updated one is swapped in. Prices count as changes here,
+                # unlike in the match store.
+                products = {p.uid: p for p in iter_products(path)}
+                supplier = next(
+                    (p.supplier for p in products.values() if p.supplier),
+                    self.suppliers.get(spider, spider),
+                )
+                catalog = self.catalogs.get(supplier)
+                current = catalog.products if catalog is not None else {}
+                changed = [p for uid, p in products.items() if current.get(uid) != p]
+                removed = current.keys() - products.keys()
+
+                # Only the changes are applied, to a copy. Unchanged listings
+                # keep their objects, and with them their match features.
+                index = catalog.copy() if catalog is not None else self.engine.build_index()
+                for uid in removed:
+                    index.remove(uid)
+                index.add_many(changed)
+                if self.engine.ngram_top_k:
+                    # Built here so the first query does not pay for it.
+                    index.ngrams
+
+                with self._lock:
+                    self.catalogs[supplier] = index
+                    self.suppliers[spider] = supplier
+
+                self.sources[spider] = source
+                changes[spider] = {"changed": len(changed), "removed": len(removed)}
+            self.loaded_at = time.time()
+        return changes
+
+    def _query_product(self, query: dict) -> Product:
+        if not isinstance(query, dict):
+            raise QueryError("query must be a JSON object")
+        data = _coerce(query)
+        if "supplier" in data:
+            data["supplier"] = self.suppliers.get(data["supplier"], data["supplier"])
+
+        # A known listing can be referenced by supplier and external id alone.
+        if "name" not in data and "normalized_name" not in data:
+            index = self.catalogs.get(data.get("supplier", ""))
+            uid = f"{data.get('supplier', '')}:{data.get('external_id', '')}"
+            product = index.get(uid) if index is not None else None
+            if product is None:
+                raise QueryError(f"unknown product: {uid}")
+            return product
+
+        data.setdefault("supplier", "")
+        if not data.get("normalized_name"):
+            data["normalized_name"] = normalize_text(data.get("name", ""))
+        if not data.get("normalized_brand") and data.get("brand"):
+            data["normalized_brand"] = normalize_brand(data["brand"])
+        return Product.from_dict(data)
+
+    def match(self, query: dict, limit: int = DEFAULT_LIMIT) -> dict:
+        limit = _limit(limit)
+        product = self._query_product(query)
+        # Refreshes swap in whole catalogs, so scoring against the ones held
+        # here needs no lock and does not hold up other queries.
+        with self._lock:
+            catalogs = dict(self.catalogs)
+        offers: dict[str, list[dict]] = {}
+        for supplier, index in catalogs.items():
+            if supplier == product.supplier:
+                continue
+            offers[supplier] = [
+                _offer(other, result.confidence, result.method)
+                for other, result in self.engine.score(index, product)[:limit]
+            ]
+        return {"query": _offer(product, 1.0, "query"), "matches": offers}
+
+    def match_batch(self, queries: list, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        if not isinstance(queries, list):
+            raise QueryError("products must be a list")
+        if len(queries) > MAX_BATCH:
+            raise QueryError(f"at most {MAX_BATCH} products per request")
+        limit = _limit(limit)
+
+        results = []
+        for query in queries:
+            try:
+                results.append(self.match(query, limit))
+            except QueryError as e:
+                results.append({"error": str(e)})
+        return results
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 3)
+
+        with self._lock:
+            catalogs = {supplier: len(index) for supplier, index in self.catalogs.items()}
+        return {
+            "catalogs": catalogs,
+            "sources": {spider: str(path) for spider, (path, _) in self.sources.items()},
+            "loaded_at": self.loaded_at,
+            "requests": len(latencies),
+            "latency_ms": {"p50": percentile(0.50), "p99": percentile(0.99)},
+        }
+
+    def watch(self, interval: float = REFRESH_INTERVAL) -> threading.Event:
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    changes = self.refresh()
+                except (OSError, ValueError, TypeError) as e:
+                    print(f"Refresh failed: {e}")
+                    continue
+                for spider, counts in changes.items():
+                    print(f"Refreshed {spider}: {counts}")
+
+        threading.Thread(target=loop, name="catalog-refresh", daemon=True).start()
+        return stop
+
+
+class MatchRequestHandler(BaseHTTPRequestHandler):
+    service: MatchService
+
+    def _send(self, status: HTTPStatus, payload) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send(HTTPStatus.OK, {"status": "ok"})
+        elif path == "/stats":
+            self._send(HTTPStatus.OK, self.service.stats())
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"no such endpoint: {path}"})
+
+    def do_POST(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/refresh":
+            try:
+                changes = self.service.refresh()
+            except (OSError, ValueError, TypeError) as e:
+                self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"refresh failed: {e}"})
+                return
+            self._send(HTTPStatus.OK, {"changes": changes})
+            return
+        if path != "/match":
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"no such endpoint: {path}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise QueryError("request body must be a JSON object")
+            limit = _limit(body.pop("limit", DEFAULT_LIMIT))
+            if "products" in body:
+                payload = {"results": self.service.match_batch(body["products"], limit)}
+            else:
+                payload = self.service.match(body, limit)
+        except (QueryError, ValueError) as e:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        self.service.latencies.append(time.perf_counter() - start)
+        self._send(HTTPStatus.OK, payload)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def make_server(service: MatchService, host: str, port: int) -> ThreadingHTTPServer:
+    handler = type("Handler", (MatchRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve product matches over HTTP/JSON")
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("output"),
+        help="Directory containing spider output files",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.70,
+        help="Minimum confidence for returned matches",
+    )
+    parser.add_argument(
+        "--ngram-top-k",
+        type=int,
+        default=0,
+        help="Also consider this many nearest names by character trigrams (0 = off)",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=REFRESH_INTERVAL,
+        help="Seconds between checks for new exports",
+    )
+
+    args = parser.parse_args()
+    engine = MatchingEngine(fuzzy_threshold=args.threshold, ngram_top_k=args.ngram_top_k)
+    service = MatchService(args.output_dir, engine)
+
+    start = time.perf_counter()
+    service.refresh()
+    for supplier, size in service.stats()["catalogs"].items():
+        print(f"  {supplier}: {size} products")
+    print(f"Loaded in {time.perf_counter() - start:.1f}s")
+
+    service.watch(args.refresh_interval)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,42 @@
 from typing import Optional
 
-from rapidfuzz import fuzz
+import numpy as np
+from rapidfuzz import fuzz, process
 
+from .features import MatchFeatures, category_similarity, features_of
 from .models import Match, Product
+from .stats import MatchStats
+
+# Pruning only drops pairs that miss the cutoff by more than float noise.
+BOUND_SLACK = 1e-9
+
+FUZZY_WEIGHTS = {
+    "name": 0.40,
+    "brand": 0.25,
+    "category": 0.15,
+    "quantity": 0.10,
+    "unit": 0.10,
+}
+
+_REST_WEIGHT = 1 - FUZZY_WEIGHTS["name"]
+_TAIL_WEIGHT = FUZZY_WEIGHTS["category"] + FUZZY_WEIGHTS["quantity"] + FUZZY_WEIGHTS["unit"]
 
 
 def exact_match(product_a: Product, product_b: Product) -> Optional[Match]:
-    if product_a.ean and product_b.ean and product_a.ean == product_b.ean:
+    a, b = features_of(product_a), features_of(product_b)
+
+    if a.ean and a.ean == b.ean:
         return Match(confidence=1.0, method="ean")
 
     if (
-        product_a.manufacturer_code
-        and product_b.manufacturer_code
-        and product_a.manufacturer_code == product_b.manufacturer_code
-        and product_a.normalized_brand
-        and product_b.normalized_brand
-        and product_a.normalized_brand.lower() == product_b.normalized_brand.lower()
+        a.manufacturer_code
+        and a.manufacturer_code == b.manufacturer_code
+        and a.brand
+        and a.brand == b.brand
     ):
         return Match(confidence=1.0, method="manufacturer_code")
 
-    if (
-        product_a.anvisa_registration
-        and product_b.anvisa_registration
-        and product_a.anvisa_registration == product_b.anvisa_registration
-    ):
+    if a.anvisa_registration and a.anvisa_registration == b.anvisa_registration:
         return Match(confidence=0.95, method="anvisa")
 
     return None
@@ -34,65 +47,198 @@ def fuzzy_match(
     product_b: Product,
     threshold: float = 0.80,
     min_name_similarity: float = 0.75,
+    stats: Optional[MatchStats] = None,
+    score_cutoff: float = 0.0,
 ) -> Optional[Match]:
-    weights = {
-        "name": 0.40,
-        "brand": 0.25,
-        "category": 0.15,
-        "quantity": 0.10,
-        "unit": 0.10,
-    }
+    weights = FUZZY_WEIGHTS
+    a, b = features_of(product_a), features_of(product_b)
+
+    # score_cutoff applies to the rounded confidence, which can sit up to half
+    # a unit in the third decimal above the raw score.
+    cutoff = score_cutoff - 0.0005
+    if cutoff < threshold:
+        cutoff = threshold
+    cutoff -= BOUND_SLACK
+
+    # The name must be good enough that perfect scores on every other field
+    # could still reach the cutoff; rapidfuzz gives up early below that.
+    name_cutoff = (cutoff - _REST_WEIGHT) / weights["name"]
+    if name_cutoff < min_name_similarity:
+        name_cutoff = min_name_similarity
 
     score = 0.0
 
     name_sim = 0.0
-    if product_a.normalized_name and product_b.normalized_name:
-        name_sim = fuzz.token_sort_ratio(
-            product_a.normalized_name,
-            product_b.normalized_name,
+    if a.sorted_name and b.sorted_name:
+        name_sim = fuzz.ratio(
+            a.sorted_name, b.sorted_name, score_cutoff=name_cutoff * 100 - 1e-6
         ) / 100
         score += name_sim * weights["name"]
 
-    if name_sim < min_name_similarity:
+    if name_sim < name_cutoff:
+        if stats is not None:
+            if name_cutoff > min_name_similarity and a.sorted_name and b.sorted_name:
+                # rapidfuzz reports 0 below name_cutoff, so whether the name
+                # also misses min_name_similarity needs a look of its own.
+                name_sim = fuzz.ratio(
+                    a.sorted_name, b.sorted_name, score_cutoff=min_name_similarity * 100 - 1e-6
+                ) / 100
+            stats.count("min_name_rejects" if name_sim < min_name_similarity else "pruned_pairs")
         return None
 
-    if product_a.normalized_brand and product_b.normalized_brand:
-        brand_sim = fuzz.ratio(
-            product_a.normalized_brand.lower(),
-            product_b.normalized_brand.lower(),
-        ) / 100
+    if a.brand and b.brand:
+        brand_sim = fuzz.ratio(a.brand, b.brand) / 100
         score += brand_sim * weights["brand"]
-    elif not product_a.normalized_brand and not product_b.normalized_brand:
+    elif not a.brand and not b.brand:
         score += weights["brand"] * 0.5
 
-    if product_a.category and product_b.category:
-        if product_a.category == product_b.category:
+    if score + _TAIL_WEIGHT < cutoff:
+        if stats is not None:
+            stats.count("pruned_pairs")
+        return None
+
+    if a.category and b.category:
+        if a.category_id == b.category_id:
             score += weights["category"]
         else:
-            cat_sim = fuzz.ratio(product_a.category, product_b.category) / 100
+            cat_sim = category_similarity(a.category, b.category)
             score += cat_sim * weights["category"] * 0.5
 
-    if product_a.quantity == product_b.quantity:
+    if a.quantity == b.quantity:
         score += weights["quantity"]
-    elif product_a.quantity and product_b.quantity:
-        ratio = min(product_a.quantity, product_b.quantity) / max(
-            product_a.quantity, product_b.quantity
-        )
+    elif a.quantity and b.quantity:
+        ratio = min(a.quantity, b.quantity) / max(a.quantity, b.quantity)
         score += ratio * weights["quantity"] * 0.5
 
-    if product_a.unit and product_b.unit:
-        if product_a.unit.lower() == product_b.unit.lower():
-            score += weights["unit"]
+    if a.unit and a.unit == b.unit:
+        score += weights["unit"]
 
-    if score >= threshold:
+    if score >= threshold and round(score, 3) >= score_cutoff:
         return Match(confidence=round(score, 3), method="fuzzy")
 
     return None
 
 
-def compute_similarity(product_a: Product, product_b: Product) -> Optional[Match]:
+def _codes(values_a: list, values_b: list) -> tuple[list, np.ndarray, np.ndarray]:
+    uniques: dict = {}
+    codes_a = np.array([uniques.setdefault(v, len(uniques)) for v in values_a], dtype=np.int64)
+    codes_b = np.array([uniques.setdefault(v, len(uniques)) for v in values_b], dtype=np.int64)
+    return list(uniques), codes_a, codes_b
+
+
+def _quantities(features: list[MatchFeatures]) -> np.ndarray:
+    return np.array(
+        [np.nan if f.quantity is None else f.quantity for f in features],
+        dtype=np.float64,
+    )
+
+
+def fuzzy_match_batch(
+    products_a: list[Product],
+    products_b: list[Product],
+    threshold: float = 0.80,
+    min_name_similarity: float = 0.75,
+    name_mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    weights = FUZZY_WEIGHTS
+    confidences = np.zeros((len(products_a), len(products_b)))
+    if not products_a or not products_b:
+        return confidences
+
+    features_a = [features_of(p) for p in products_a]
+    features_b = [features_of(p) for p in products_b]
+
+    names_a = [f.sorted_name for f in features_a]
+    names_b = [f.sorted_name for f in features_b]
+    name_matrix = process.cdist(
+        names_a,
+        names_b,
+        scorer=fuzz.ratio,
+        score_cutoff=max(min_name_similarity * 100 - 1e-6, 0),
+        dtype=np.float64,
+        workers=-1,
+    ) / 100
+    name_matrix[~np.outer([bool(n) for n in names_a], [bool(n) for n in names_b])] = 0.0
+
+    # Every other term is only computed for pairs that pass the name cutoff.
+    passed = name_matrix >= min_name_similarity
+    if name_mask is not None:
+        name_mask[...] = passed
+    rows, cols = np.nonzero(passed)
+    if not len(rows):
+        return confidences
+
+    score = name_matrix[rows, cols] * weights["name"]
+
+    brands, codes_a, codes_b = _codes(
+        [f.brand for f in features_a], [f.brand for f in features_b]
+    )
+    brand_a = np.array([bool(f.brand) for f in features_a])[rows]
+    brand_b = np.array([bool(f.brand) for f in features_b])[cols]
+    brand_sim = process.cdist(
+        brands, brands, scorer=fuzz.ratio, dtype=np.float64, workers=-1
+    )[codes_a[rows], codes_b[cols]] / 100
+    score += np.where(
+        brand_a & brand_b,
+        brand_sim * weights["brand"],
+        np.where(~brand_a & ~brand_b, weights["brand"] * 0.5, 0.0),
+    )
+
+    categories, codes_a, codes_b = _codes(
+        [f.category_id for f in features_a], [f.category_id for f in features_b]
+    )
+    names = {f.category_id: f.category for f in features_a + features_b}
+    cat_a, cat_b = codes_a[rows], codes_b[cols]
+    cat_sim = np.array([
+        [category_similarity(names[x], names[y]) for y in categories] for x in categories
+    ])[cat_a, cat_b]
+    has_category = (
+        np.array([bool(f.category) for f in features_a])[rows]
+        & np.array([bool(f.category) for f in features_b])[cols]
+    )
+    score += np.where(
+        has_category,
+        np.where(cat_a == cat_b, weights["category"], cat_sim * weights["category"] * 0.5),
+        0.0,
+    )
+
+    qty_a = _quantities(features_a)[rows]
+    qty_b = _quantities(features_b)[cols]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        qty_ratio = np.minimum(qty_a, qty_b) / np.maximum(qty_a, qty_b)
+    qty_equal = (qty_a == qty_b) | (np.isnan(qty_a) & np.isnan(qty_b))
+    qty_set = ~np.isnan(qty_a) & (qty_a != 0) & ~np.isnan(qty_b) & (qty_b != 0)
+    score += np.where(
+        qty_equal,
+        weights["quantity"],
+        np.where(qty_set, qty_ratio * weights["quantity"] * 0.5, 0.0),
+    )
+
+    _, codes_a, codes_b = _codes([f.unit for f in features_a], [f.unit for f in features_b])
+    has_unit = (
+        np.array([bool(f.unit) for f in features_a])[rows]
+        & np.array([bool(f.unit) for f in features_b])[cols]
+    )
+    score += np.where(has_unit & (codes_a[rows] == codes_b[cols]), weights["unit"], 0.0)
+
+    for i, j, value in zip(rows, cols, score):
+        if value >= threshold:
+            confidences[i, j] = round(float(value), 3)
+    return confidences
+
+
+def compute_similarity(
+    product_a: Product,
+    product_b: Product,
+    stats: Optional[MatchStats] = None,
+    score_cutoff: float = 0.0,
+) -> Optional[Match]:
     exact = exact_match(product_a, product_b)
     if exact:
+        if stats is not None:
+            stats.count("exact_pairs")
         return exact
 
-    return fuzzy_match(product_a, product_b)
+    if stats is not None:
+        stats.count("fuzzy_pairs")
+    return fuzzy_match(product_a, product_b, stats=stats, score_cutoff=score_cutoff)
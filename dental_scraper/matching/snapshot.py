@@ -0,0 +1,223 @@
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Optional
+
+from .models import Product
+
+SNAPSHOT_SUFFIX = ".dcat"
+MAGIC = b"DCAT"
+VERSION = 1
+
+# magic, version, rows, strings, string offsets at, string data at, id index at
+HEADER = struct.Struct("<4sIIIQQQ")
+
+STRING_FIELDS = (
+    "supplier",
+    "external_id",
+    "external_url",
+    "name",
+    "normalized_name",
+    "brand",
+    "normalized_brand",
+    "category",
+    "unit",
+    "ean",
+    "manufacturer_code",
+    "anvisa_registration",
+)
+
+# One string table id per text field, then quantity, price, pix price, in stock.
+ROW = struct.Struct(f"<{len(STRING_FIELDS)}Iiqq?3x")
+
+# String id 0 is reserved for missing values.
+NULL_STRING = 0
+NULL_INT = -(1 << 31)
+NULL_CENTS = -(1 << 63)
+
+_EXTERNAL_ID = STRING_FIELDS.index("external_id")
+
+
+class SnapshotWriter:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(bytes(HEADER.size))
+        self._strings: dict[str, int] = {}
+        self._rows: dict[str, int] = {}
+
+    def _string_id(self, value: Optional[str]) -> int:
+        if value is None:
+            return NULL_STRING
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = self._strings[value] = len(self._strings) + 1
+        return string_id
+
+    def add(self, product: Product) -> None:
+        row = ROW.pack(
+            *(self._string_id(getattr(product, name)) for name in STRING_FIELDS),
+            NULL_INT if product.quantity is None else product.quantity,
+            NULL_CENTS if product.price_cents is None else product.price_cents,
+            NULL_CENTS if product.pix_price_cents is None else product.pix_price_cents,
+            bool(product.in_stock),
+        )
+
+        # Rows are fixed width, so a product seen again is overwritten in place.
+        position = self._rows.get(product.external_id)
+        if position is None:
+            self._rows[product.external_id] = len(self._rows)
+            self._file.write(row)
+        else:
+            self._file.seek(HEADER.size + position * ROW.size)
+            self._file.write(row)
+            self._file.seek(0, os.SEEK_END)
+
+    def close(self) -> None:
+        f = self._file
+        encoded = [value.replace("\0", "").encode("utf-8") for value in self._strings]
+
+        # Strings are NUL separated so a full load is one decode and split,
+        # while the offsets keep single lookups independent of the rest.
+        offsets_at = f.tell()
+        offset = 0
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offset)
+            offset += len(data) + 1
+        offsets.append(offset)
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+
+        data_at = f.tell()
+        f.write(b"\0".join(encoded))
+
+        index_at = f.tell()
+        ordered = sorted(self._rows.items())
+        f.write(struct.pack(f"<{len(ordered)}I", *(row for _, row in ordered)))
+
+        f.seek(0)
+        f.write(HEADER.pack(
+            MAGIC, VERSION, len(self._rows), len(encoded) + 1, offsets_at, data_at, index_at
+        ))
+        f.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self) -> "SnapshotWriter":
+        return self
+
+    def discard(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class CatalogSnapshot:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, rows, strings, offsets_at, data_at, index_at = HEADER.unpack_from(
+            self._buffer
+        )
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} catalog snapshot")
+
+        self._rows: int = rows
+        view = memoryview(self._buffer)
+        self._offsets = view[offsets_at:offsets_at + (strings + 1) * 8].cast("Q")
+        self._index = view[index_at:index_at + rows * 4].cast("I")
+        view.release()
+        self._data_at = data_at
+        self._strings: list[Optional[str]] = [None] * strings
+
+    def close(self) -> None:
+        for view in ("_offsets", "_index"):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self._buffer.close()
+
+    def __enter__(self) -> "CatalogSnapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _string(self, string_id: int) -> Optional[str]:
+        value = self._strings[string_id]
+        if value is None and string_id != NULL_STRING:
+            start = self._data_at + self._offsets[string_id]
+            end = self._data_at + self._offsets[string_id + 1] - 1
+            value = self._strings[string_id] = self._buffer[start:end].decode("utf-8")
+        return value
+
+    def _load_strings(self) -> list[Optional[str]]:
+        if len(self._strings) > 1:
+            data = self._buffer[self._data_at:self._data_at + self._offsets[-1] - 1]
+            self._strings = [None, *data.decode("utf-8").split("\0")]
+        return self._strings
+
+    def _external_id(self, row: int) -> str:
+        offset = HEADER.size + row * ROW.size + _EXTERNAL_ID * 4
+        return self._string(struct.unpack_from("<I", self._buffer, offset)[0]) or ""
+
+    def _product(self, values: tuple, strings: list[Optional[str]]) -> Product:
+        (
+            supplier, external_id, external_url, name, normalized_name, brand,
+            normalized_brand, category, unit, ean, manufacturer_code, anvisa_registration,
+            quantity, price_cents, pix_price_cents, in_stock,
+        ) = values
+        return Product(
+            supplier=strings[supplier] or "",
+            external_id=strings[external_id] or "",
+            external_url=strings[external_url] or "",
+            name=strings[name] or "",
+            normalized_name=strings[normalized_name] or "",
+            brand=strings[brand] or "",
+            normalized_brand=strings[normalized_brand] or "",
+            category=strings[category] or "",
+            quantity=None if quantity == NULL_INT else quantity,
+            unit=strings[unit] or "",
+            price_cents=None if price_cents == NULL_CENTS else price_cents,
+            pix_price_cents=None if pix_price_cents == NULL_CENTS else pix_price_cents,
+            ean=strings[ean],
+            manufacturer_code=strings[manufacturer_code],
+            anvisa_registration=strings[anvisa_registration],
+            in_stock=in_stock,
+        )
+
+    def product(self, row: int) -> Product:
+        values = ROW.unpack_from(self._buffer, HEADER.size + row * ROW.size)
+        for string_id in values[:len(STRING_FIELDS)]:
+            self._string(string_id)
+        return self._product(values, self._strings)
+
+    def get(self, external_id: str) -> Optional[Product]:
+        lo, hi = 0, self._rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._external_id(self._index[mid]) < external_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._rows and self._external_id(self._index[lo]) == external_id:
+            return self.product(self._index[lo])
+        return None
+
+    def __iter__(self) -> Iterator[Product]:
+        strings = self._load_strings()
+        rows = self._buffer[HEADER.size:HEADER.size + self._rows * ROW.size]
+        for values in ROW.iter_unpack(rows):
+            yield self._product(values, strings)
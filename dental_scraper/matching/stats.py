@@ -0,0 +1,61 @@
+import time
+from bisect import bisect_right
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Lower bounds of the candidates-per-query histogram buckets.
+CANDIDATE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _bucket_label(index: int) -> str:
+    low = CANDIDATE_BUCKETS[index]
+    if index + 1 == len(CANDIDATE_BUCKETS):
+        return f"{low}+"
+    high = CANDIDATE_BUCKETS[index + 1] - 1
+    return str(low) if low == high else f"{low}-{high}"
+
+
+@dataclass
+class MatchStats:
+    timings: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+    candidates: list[int] = field(default_factory=lambda: [0] * len(CANDIDATE_BUCKETS))
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_candidates(self, n: int) -> None:
+        self.candidates[bisect_right(CANDIDATE_BUCKETS, n) - 1] += 1
+
+    def merge(self, other: "MatchStats") -> None:
+        for stage, seconds in other.timings.items():
+            self.add_time(stage, seconds)
+        for name, n in other.counters.items():
+            self.count(name, n)
+        self.candidates = [a + b for a, b in zip(self.candidates, other.candidates)]
+
+    def to_dict(self) -> dict:
+        return {
+            "timings": {stage: round(seconds, 4) for stage, seconds in self.timings.items()},
+            "counters": dict(sorted(self.counters.items())),
+            "candidates_per_query": {
+                _bucket_label(i): n for i, n in enumerate(self.candidates) if n
+            },
+        }
+
+
+def stage(stats: Optional[MatchStats], name: str) -> AbstractContextManager:
+    return nullcontext() if stats is None else stats.stage(name)
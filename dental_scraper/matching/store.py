@@ -0,0 +1,165 @@
+import hashlib
+import json
+import sqlite3
+from collections.abc import Iterable
+from pathlib import Path
+
+from .models import Match, Product
+
+FINGERPRINT_FIELDS = (
+    "normalized_name",
+    "normalized_brand",
+    "category",
+    "quantity",
+    "unit",
+    "ean",
+    "manufacturer_code",
+    "anvisa_registration",
+)
+
+# Bumped whenever what the store keeps changes, so older stores are reset
+# rather than read with missing tables.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS fingerprints (uid TEXT PRIMARY KEY, fingerprint TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS edges (
+    uid_a TEXT NOT NULL,
+    uid_b TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    method TEXT NOT NULL,
+    PRIMARY KEY (uid_a, uid_b)
+);
+CREATE INDEX IF NOT EXISTS edges_uid_b ON edges (uid_b);
+CREATE TABLE IF NOT EXISTS lookup_keys (uid TEXT PRIMARY KEY, keys TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS neighbours (uid TEXT PRIMARY KEY, uids TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS matches (
+    uid_a TEXT PRIMARY KEY,
+    uid_b TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+"""
+
+
+def fingerprint(product: Product) -> str:
+    values = [getattr(product, name) for name in FINGERPRINT_FIELDS]
+    payload = json.dumps(values, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class MatchStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "MatchStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def check_config(self, config: dict) -> bool:
+        value = json.dumps({**config, "schema": SCHEMA_VERSION}, sort_keys=True)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+        if row and row[0] == value:
+            return True
+
+        with self.conn:
+            for table in ("fingerprints", "edges", "lookup_keys", "neighbours", "matches"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('config', ?)", (value,)
+            )
+        return False
+
+    def fingerprints(self) -> dict[str, str]:
+        return dict(self.conn.execute("SELECT uid, fingerprint FROM fingerprints"))
+
+    def edges(self) -> Iterable[tuple[str, str, Match]]:
+        for uid_a, uid_b, confidence, method in self.conn.execute(
+            "SELECT uid_a, uid_b, confidence, method FROM edges"
+        ):
+            yield uid_a, uid_b, Match(confidence=confidence, method=method)
+
+    def lookup_keys(self, uids: Iterable[str]) -> dict[str, list[str]]:
+        keys = {}
+        for uid in uids:
+            row = self.conn.execute("SELECT keys FROM lookup_keys WHERE uid = ?", (uid,)).fetchone()
+            if row:
+                keys[uid] = json.loads(row[0])
+        return keys
+
+    def neighbours(self) -> dict[str, list[str]]:
+        return {
+            uid: json.loads(uids)
+            for uid, uids in self.conn.execute("SELECT uid, uids FROM neighbours")
+        }
+
+    def matches(self) -> dict[str, tuple[str, str]]:
+        return {
+            uid_a: (uid_b, status)
+            for uid_a, uid_b, status in self.conn.execute(
+                "SELECT uid_a, uid_b, status FROM matches"
+            )
+        }
+
+    def sync(
+        self,
+        stale: set[str],
+        rescored: set[str],
+        fingerprints: dict[str, str],
+        edges: list[tuple[str, str, Match]],
+        matches: dict[str, tuple[str, str]],
+        lookup_keys: dict[str, list[str]],
+        neighbours: dict[str, list[str]],
+    ) -> None:
+        # Rescored A products replace all their edges and neighbours; changed
+        # and removed products drop theirs from either side.
+        previous = self.matches()
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM edges WHERE uid_a = ?", ((uid,) for uid in stale | rescored)
+            )
+            self.conn.executemany(
+                "DELETE FROM edges WHERE uid_b = ?", ((uid,) for uid in stale)
+            )
+            for table in ("fingerprints", "lookup_keys"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE uid = ?", ((uid,) for uid in stale)
+                )
+            self.conn.executemany(
+                "DELETE FROM neighbours WHERE uid = ?", ((uid,) for uid in stale | rescored)
+            )
+            self.conn.executemany(
+                "INSERT INTO fingerprints (uid, fingerprint) VALUES (?, ?)",
+                fingerprints.items(),
+            )
+            self.conn.executemany(
+                "INSERT INTO lookup_keys (uid, keys) VALUES (?, ?)",
+                ((uid, json.dumps(keys, ensure_ascii=False)) for uid, keys in lookup_keys.items()),
+            )
+            self.conn.executemany(
+                "INSERT INTO neighbours (uid, uids) VALUES (?, ?)",
+                ((uid, json.dumps(uids)) for uid, uids in neighbours.items()),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO edges (uid_a, uid_b, confidence, method) VALUES (?, ?, ?, ?)",
+                ((a, b, m.confidence, m.method) for a, b, m in edges),
+            )
+            self.conn.executemany(
+                "DELETE FROM matches WHERE uid_a = ?",
+                ((uid,) for uid in previous if uid not in matches),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO matches (uid_a, uid_b, status) VALUES (?, ?, ?)",
+                (
+                    (uid_a, uid_b, status)
+                    for uid_a, (uid_b, status) in matches.items()
+                    if previous.get(uid_a) != (uid_b, status)
+                ),
+            )
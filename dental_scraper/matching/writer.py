@@ -0,0 +1,61 @@
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+LINES_SUFFIX = ".jsonl"
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class ResultWriter:
+    # Items are written as soon as they are added, so a run never holds more
+    # than one serialized item. The stats block is only known at the end and
+    # goes last: as the closing key of the JSON object, or as the final line
+    # of a JSON Lines file.
+    def __init__(self, path: Path, key: str, header: Optional[dict] = None):
+        self.path = Path(path)
+        self.key = key
+        self.header = header or {}
+        self.stats: dict = {}
+        self.count = 0
+        self.lines = self.path.suffix == LINES_SUFFIX
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+
+        if not self.lines:
+            self._file.write("{\n")
+            for name, value in self.header.items():
+                self._file.write(f"  {_dumps(name)}: {_dumps(value)},\n")
+            self._file.write(f"  {_dumps(key)}: [")
+
+    def add(self, item: dict) -> None:
+        if self.lines:
+            self._file.write(_dumps(item) + "\n")
+        else:
+            self._file.write(",\n    " if self.count else "\n    ")
+            self._file.write(_dumps(item))
+        self.count += 1
+
+    def close(self) -> None:
+        if self.lines:
+            self._file.write(_dumps({**self.header, "stats": self.stats}) + "\n")
+        else:
+            self._file.write("\n  ],\n" if self.count else "],\n")
+            stats = json.dumps(self.stats, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            self._file.write(f'  "stats": {stats}\n}}\n')
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            self._tmp_path.unlink(missing_ok=True)
+
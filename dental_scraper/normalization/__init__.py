@@ -1,5 +1,6 @@
 from .brands import normalize_brand
 from .categories import normalize_category
+from .codes import normalize_anvisa, normalize_gtin
 from .supplier_mappings import get_supplier_category
 from .text import clean_text, normalize_text
 from .units import normalize_unit
@@ -8,6 +9,8 @@ __all__ = [
     "normalize_brand",
     "normalize_category",
     "normalize_unit",
+    "normalize_gtin",
+    "normalize_anvisa",
     "clean_text",
     "normalize_text",
     "get_supplier_category",
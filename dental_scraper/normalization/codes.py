@@ -0,0 +1,43 @@
+import re
+from functools import lru_cache
+
+GTIN_LENGTH = 14
+MIN_GTIN_LENGTH = 8
+
+# Product registrations have 11 digits; medicine registrations add the
+# presentation and reach 13.
+ANVISA_LENGTHS = (11, 13)
+
+_NOT_DIGITS = re.compile(r"\D")
+
+
+def gtin_check_digit(digits: str) -> int:
+    # GS1 mod 10: weights alternate 3, 1 starting from the rightmost digit.
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return (10 - total % 10) % 10
+
+
+@lru_cache(maxsize=65536)
+def normalize_gtin(value: str | None) -> str | None:
+    # GTIN-8, UPC-A, EAN-13 and GTIN-14 spellings of one code, with or without
+    # separators and leading zeros, all map to the same zero-padded GTIN-14.
+    if not value:
+        return None
+    digits = _NOT_DIGITS.sub("", str(value))
+    if not MIN_GTIN_LENGTH <= len(digits) <= GTIN_LENGTH or not digits.strip("0"):
+        return None
+    if gtin_check_digit(digits[:-1]) != int(digits[-1]):
+        return None
+    return digits.zfill(GTIN_LENGTH)
+
+
+@lru_cache(maxsize=65536)
+def normalize_anvisa(value: str | None) -> str | None:
+    # Registrations carry no published check digit, so only the shape is
+    # validated; exemption notes ("isento", "dispensado") have no digits.
+    if not value:
+        return None
+    digits = _NOT_DIGITS.sub("", str(value))
+    if len(digits) not in ANVISA_LENGTHS or not digits.strip("0"):
+        return None
+    return digits
@@ -1,11 +1,48 @@
+import csv
 import json
+import os
 from datetime import datetime
 from pathlib import Path
+from typing import Any, TextIO
 
 from scrapy import signals
 from scrapy.exporters import JsonItemExporter
 
 from dental_scraper.items import NormalizedProductItem
+from dental_scraper.matching.manifest import RUN_FORMAT, ExportManifest, ManifestEntry
+from dental_scraper.matching.models import Product
+from dental_scraper.matching.snapshot import SNAPSHOT_SUFFIX, SnapshotWriter
+
+
+def export_path(spider, suffix: str) -> tuple[Path, str]:
+    output_dir = Path(spider.settings.get("OUTPUT_DIR", "./output"))
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Every exporter of a crawl shares one run id, so the JSON export and its
+    # snapshot have the same stem and are recorded as the same run.
+    run = getattr(spider, "export_run", None)
+    if run is None:
+        run = spider.export_run = datetime.now().strftime(RUN_FORMAT)
+    return output_dir / f"{spider.name}_{run}{suffix}", run
+
+
+def csv_value(value):
+    # Nested fields (invalid_codes, pdf_urls, ...) are written as JSON so the
+    # CSV can be parsed back; csv.writer would write their Python repr.
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def record_export(path: Path, spider, run: str, items: int) -> None:
+    ExportManifest(path.parent).record(ManifestEntry.describe(path, spider.name, run, items))
+
+
+def discard_export(spider, reason: str, items: int) -> None:
+    spider.logger.warning(
+        f"Crawl ended with reason {reason!r}; discarded partial export of {items} items "
+        "so the last complete run stays current"
+    )
 
 
 class JsonExporterPipeline:
@@ -13,6 +50,7 @@ class JsonExporterPipeline:
         self.files: dict[str, any] = {}
         self.exporters: dict[str, JsonItemExporter] = {}
         self.item_counts: dict[str, int] = {}
+        self.paths: dict[str, tuple[Path, str]] = {}
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -22,13 +60,11 @@ class JsonExporterPipeline:
         return pipeline
 
     def spider_opened(self, spider):
-        output_dir = Path(spider.settings.get("OUTPUT_DIR", "./output"))
-        output_dir.mkdir(parents=True, exist_ok=True)
+        filename, run = export_path(spider, ".json")
+        self.paths[spider.name] = (filename, run)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = output_dir / f"{spider.name}_{timestamp}.json"
-
-        self.files[spider.name] = open(filename, "wb")
+        # Written under a temporary name so readers never pick up a partial export.
+        self.files[spider.name] = open(filename.with_name(filename.name + ".tmp"), "wb")
         self.exporters[spider.name] = JsonItemExporter(
             self.files[spider.name],
             encoding="utf-8",
@@ -39,12 +75,20 @@ class JsonExporterPipeline:
 
         spider.logger.info(f"Exporting to: {filename}")
 
-    def spider_closed(self, spider):
+    def spider_closed(self, spider, reason="finished"):
         if spider.name in self.exporters:
             self.exporters[spider.name].finish_exporting()
             self.files[spider.name].close()
 
             count = self.item_counts.get(spider.name, 0)
+            filename, run = self.paths.pop(spider.name)
+            if reason != "finished":
+                # Only a complete crawl may replace the previous export.
+                os.remove(self.files[spider.name].name)
+                discard_export(spider, reason, count)
+                return
+            os.replace(self.files[spider.name].name, filename)
+            record_export(filename, spider, run, count)
             spider.logger.info(f"Exported {count} items for {spider.name}")
 
     def process_item(self, item: NormalizedProductItem, spider) -> NormalizedProductItem:
@@ -54,11 +98,11 @@ class JsonExporterPipeline:
         return item
 
 
-class CsvExporterPipeline:
+class SnapshotExporterPipeline:
     def __init__(self):
-        self.files: dict[str, any] = {}
-        self.writers: dict[str, any] = {}
-        self.headers_written: dict[str, bool] = {}
+        self.writers: dict[str, SnapshotWriter] = {}
+        self.item_counts: dict[str, int] = {}
+        self.runs: dict[str, str] = {}
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -68,23 +112,80 @@ class CsvExporterPipeline:
         return pipeline
 
     def spider_opened(self, spider):
-        import csv
+        filename, run = export_path(spider, SNAPSHOT_SUFFIX)
+        self.runs[spider.name] = run
+
+        self.writers[spider.name] = SnapshotWriter(filename)
+        self.item_counts[spider.name] = 0
+
+        spider.logger.info(f"Exporting snapshot to: {filename}")
+
+    def spider_closed(self, spider, reason="finished"):
+        if spider.name in self.writers:
+            writer = self.writers.pop(spider.name)
+            count = self.item_counts.get(spider.name, 0)
+            run = self.runs.pop(spider.name)
+            if reason != "finished":
+                writer.discard()
+                discard_export(spider, reason, count)
+                return
+
+            writer.close()
+            record_export(writer.path, spider, run, count)
+            spider.logger.info(f"Exported {count} items for {spider.name}")
+
+    def process_item(self, item: NormalizedProductItem, spider) -> NormalizedProductItem:
+        if spider.name in self.writers:
+            self.writers[spider.name].add(Product.from_dict(dict(item)))
+            self.item_counts[spider.name] = self.item_counts.get(spider.name, 0) + 1
+        return item
 
-        output_dir = Path(spider.settings.get("OUTPUT_DIR", "./output"))
-        output_dir.mkdir(parents=True, exist_ok=True)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = output_dir / f"{spider.name}_{timestamp}.csv"
+class CsvExporterPipeline:
+    def __init__(self):
+        self.files: dict[str, TextIO] = {}
+        self.writers: dict[str, Any] = {}
+        self.headers_written: dict[str, bool] = {}
+        self.item_counts: dict[str, int] = {}
+        self.paths: dict[str, tuple[Path, str]] = {}
 
-        self.files[spider.name] = open(filename, "w", newline="", encoding="utf-8")
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls()
+        crawler.signals.connect(pipeline.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def spider_opened(self, spider):
+        filename, run = export_path(spider, ".csv")
+        self.paths[spider.name] = (filename, run)
+
+        # Written under a temporary name, like the JSON export.
+        self.files[spider.name] = open(
+            filename.with_name(filename.name + ".tmp"), "w", newline="", encoding="utf-8"
+        )
         self.writers[spider.name] = csv.writer(self.files[spider.name])
         self.headers_written[spider.name] = False
+        self.item_counts[spider.name] = 0
 
         spider.logger.info(f"Exporting CSV to: {filename}")
 
-    def spider_closed(self, spider):
+    def spider_closed(self, spider, reason="finished"):
         if spider.name in self.files:
-            self.files[spider.name].close()
+            file = self.files.pop(spider.name)
+            file.close()
+            del self.writers[spider.name]
+
+            count = self.item_counts.get(spider.name, 0)
+            filename, run = self.paths.pop(spider.name)
+            if reason != "finished":
+                os.remove(file.name)
+                discard_export(spider, reason, count)
+                return
+            os.replace(file.name, filename)
+            # Recorded with the run for completeness; the matcher only reads
+            # the JSON export or snapshot.
+            record_export(filename, spider, run, count)
 
     def process_item(self, item: NormalizedProductItem, spider) -> NormalizedProductItem:
         if spider.name not in self.writers:
@@ -96,5 +197,6 @@ class CsvExporterPipeline:
             self.writers[spider.name].writerow(item_dict.keys())
             self.headers_written[spider.name] = True
 
-        self.writers[spider.name].writerow(item_dict.values())
+        self.writers[spider.name].writerow(csv_value(value) for value in item_dict.values())
+        self.item_counts[spider.name] = self.item_counts.get(spider.name, 0) + 1
         return item
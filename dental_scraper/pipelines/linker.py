@@ -0,0 +1,92 @@
+import re
+from collections import defaultdict
+
+from rapidfuzz import fuzz, process
+
+# Fuzzy lookups start from the postings of one of the name's rarest tokens
+# and intersect with the other tokens until few enough candidates remain to
+# score them all. A second seed keeps a master whose rarest token is the one
+# that differs (a model code, "2 5cm" for "25 cm") reachable. A block the
+# other tokens cannot narrow (common words, one-word names) is not scored:
+# only an exact name links then, so no item pays for a scan of a whole
+# posting list.
+SEED_TOKENS = 2
+MAX_CANDIDATES = 300
+
+_TOKEN = re.compile(r"\w+")
+
+
+class MasterIndex:
+    def __init__(self, threshold=100):
+        self.threshold = threshold
+        self.names = {}
+        # Several masters can share a name (the products table only makes
+        # them unique once normalized), so each name keeps all of its ids.
+        self.by_name = defaultdict(set)
+        self.postings = defaultdict(set)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, product_id):
+        return product_id in self.names
+
+    def add(self, product_id, name):
+        if product_id in self.names:
+            self.remove(product_id)
+        self.names[product_id] = name
+        self.by_name[name].add(product_id)
+        for token in set(_TOKEN.findall(name)):
+            self.postings[token].add(product_id)
+
+    def remove(self, product_id):
+        name = self.names.pop(product_id, None)
+        if name is None:
+            return
+        ids = self.by_name.get(name)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del self.by_name[name]
+        for token in set(_TOKEN.findall(name)):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self.postings[token]
+
+    def find(self, name):
+        # The oldest master wins, as it does among fuzzy ties below.
+        ids = self.by_name.get(name)
+        if ids or self.threshold >= 100:
+            # A ratio of 100 means the very same string.
+            return min(ids) if ids else None
+
+        postings = sorted(
+            (self.postings[t] for t in set(_TOKEN.findall(name)) if t in self.postings),
+            key=len,
+        )
+        if not postings:
+            return None
+
+        # The first seed's block usually holds the match; the next one is only
+        # scored when it does not.
+        for block in postings[:SEED_TOKENS]:
+            for ids in postings[SEED_TOKENS:]:
+                if len(block) <= MAX_CANDIDATES:
+                    break
+                # A token no candidate shares is skipped rather than emptying the block.
+                block = block & ids or block
+            if len(block) > MAX_CANDIDATES:
+                continue
+
+            # Ids are visited in order so ties resolve to the oldest master.
+            best = process.extractOne(
+                name,
+                {product_id: self.names[product_id] for product_id in sorted(block)},
+                scorer=fuzz.ratio,
+                score_cutoff=self.threshold,
+            )
+            if best:
+                return best[2]
+        return None
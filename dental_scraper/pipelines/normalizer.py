@@ -1,7 +1,9 @@
 from dental_scraper.items import NormalizedProductItem, RawProductItem
 from dental_scraper.normalization import (
     clean_text,
+    normalize_anvisa,
     normalize_brand,
+    normalize_gtin,
     normalize_text,
     normalize_unit,
 )
@@ -73,8 +75,16 @@ class NormalizerPipeline:
         description = item.get("raw_description", "")
         normalized["description"] = clean_text(description) if description else ""
 
-        normalized["ean"] = item.get("ean")
-        normalized["anvisa_registration"] = item.get("anvisa_registration")
+        # Codes that fail validation are dropped from the matching fields
+        # but kept verbatim under invalid_codes.
+        invalid_codes = {}
+        codes = (("ean", normalize_gtin), ("anvisa_registration", normalize_anvisa))
+        for field, normalize in codes:
+            raw = item.get(field)
+            normalized[field] = normalize(raw)
+            if raw and normalized[field] is None:
+                invalid_codes[field] = raw
+        normalized["invalid_codes"] = invalid_codes
         normalized["restricted_sale"] = item.get("restricted_sale", False)
         normalized["professional_area"] = item.get("professional_area")
         normalized["specialty"] = item.get("specialty")
@@ -1,7 +1,16 @@
+import io
 import re
+import time
+from collections import deque
+
 import psycopg2
 from itemadapter import ItemAdapter
-from rapidfuzz import fuzz
+from psycopg2.extras import execute_values
+from twisted.internet import defer, task, threads
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+from dental_scraper.pipelines.linker import MasterIndex
 
 SUPPLIER_MAPPING = {
     "dental_speed": ("Dental Speed", "dental-speed"),
@@ -10,6 +19,127 @@ SUPPLIER_MAPPING = {
 
 SIMILARITY_THRESHOLD = 100
 
+# Items are buffered and written in one COPY plus a few set-based statements
+# per batch; a batch size of 1 writes every item on its own as before.
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5.0
+
+# Writes run on one dedicated thread so queries never block the reactor.
+# Past this many queued writes (batches, or items when unbatched)
+# process_item stops returning immediately, which holds back the scraper
+# until the database catches up. 0 writes on the reactor thread instead.
+WRITE_QUEUE_SIZE = 4
+
+STAGING_TABLE = "supplier_products_staging"
+
+UPSERT_COLUMNS = (
+    ("supplier_id", "bigint"),
+    ("external_id", "text"),
+    ("external_url", "text"),
+    ("name", "text"),
+    ("normalized_name", "text"),
+    ("brand", "text"),
+    ("category", "text"),
+    ("raw_category", "text"),
+    ("unit", "text"),
+    ("quantity", "integer"),
+    ("ean", "text"),
+    ("anvisa_registration", "text"),
+    ("manufacturer_code", "text"),
+    ("image_url", "text"),
+    ("in_stock", "boolean"),
+    ("current_price", "numeric"),
+    ("pix_price", "numeric"),
+    ("original_price", "numeric"),
+    ("discount_percent", "numeric"),
+)
+
+# Price changes are detected locally against the state loaded at spider
+# open, and travel with each staged row.
+STAGING_COLUMNS = UPSERT_COLUMNS + (("price_changed", "boolean"),)
+
+# Rows per round trip when the caches are streamed in at spider open.
+FETCH_SIZE = 10_000
+
+_COLUMNS = ", ".join(name for name, _ in UPSERT_COLUMNS)
+_STAGING_COLUMNS = ", ".join(name for name, _ in STAGING_COLUMNS)
+
+# Columns an existing row takes from a new scrape; external_url is kept.
+UPDATE_COLUMNS = tuple(
+    name for name, _ in UPSERT_COLUMNS if name not in ("supplier_id", "external_id", "external_url")
+)
+
+# The master link only depends on these, through normalize_name.
+IDENTITY_COLUMNS = ("name", "quantity", "unit")
+
+
+def _row_of(table, columns):
+    return "(" + ", ".join(f"{table}.{name}" for name in columns) + ")"
+
+
+_SET_COLUMNS = ",\n        ".join(f"{name} = EXCLUDED.{name}" for name in UPDATE_COLUMNS)
+
+# Unchanged rows are left alone entirely: no new row version, no index or
+# WAL churn and no RETURNING row. Rows without a master link are always
+# returned so they get another chance to be linked.
+UPSERT_CONFLICT = f"""
+    ON CONFLICT (supplier_id, external_id) DO UPDATE SET
+        {_SET_COLUMNS},
+        product_id = CASE
+            WHEN {_row_of("supplier_products", IDENTITY_COLUMNS)}
+                IS NOT DISTINCT FROM {_row_of("EXCLUDED", IDENTITY_COLUMNS)}
+            THEN supplier_products.product_id
+        END,
+        last_scraped_at = NOW(),
+        updated_at = NOW()
+    WHERE supplier_products.product_id IS NULL
+        OR {_row_of("supplier_products", UPDATE_COLUMNS)}
+            IS DISTINCT FROM {_row_of("EXCLUDED", UPDATE_COLUMNS)}
+"""
+
+BUMP_SCRAPED_SQL = "UPDATE supplier_products SET last_scraped_at = NOW() WHERE id = ANY(%s)"
+
+CREATE_STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+        {", ".join(f"{name} {type_}" for name, type_ in STAGING_COLUMNS)}
+    ) ON COMMIT DELETE ROWS
+"""
+
+BATCH_UPSERT_SQL = f"""
+    WITH upserted AS (
+        INSERT INTO supplier_products ({_COLUMNS}, last_scraped_at, created_at, updated_at)
+        SELECT {_COLUMNS}, NOW(), NOW(), NOW() FROM {STAGING_TABLE}
+        WHERE true
+        {UPSERT_CONFLICT}
+        RETURNING id, external_id, product_id, current_price, pix_price, original_price, in_stock
+    ), history AS (
+        INSERT INTO price_histories (
+            supplier_product_id, price, pix_price, original_price, in_stock, recorded_at, created_at
+        )
+        SELECT u.id, u.current_price, u.pix_price, u.original_price, u.in_stock, NOW(), NOW()
+        FROM upserted u
+        JOIN {STAGING_TABLE} s ON s.external_id = u.external_id
+        WHERE s.price_changed
+    )
+    SELECT id, external_id, product_id FROM upserted
+"""
+
+
+def copy_value(value) -> str:
+    # COPY text format: \N is NULL, and backslashes, tabs and line breaks
+    # inside values are escaped.
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
 
 def normalize_name(name, quantity=None, unit=None):
     if not name:
@@ -27,11 +157,35 @@ def normalize_name(name, quantity=None, unit=None):
 
 
 class PostgresPipeline:
-    def __init__(self, db_config):
+    def __init__(
+        self,
+        db_config,
+        batch_size=BATCH_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+        link_threshold=SIMILARITY_THRESHOLD,
+        write_queue_size=WRITE_QUEUE_SIZE,
+    ):
         self.db_config = db_config
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_queue_size = write_queue_size
+        # Set when the spider opens: importing the reactor here would install
+        # the default one before Scrapy installs the configured asyncio reactor.
+        self.reactor = None
+        self.writer = None
+        self.queued = 0
+        self.waiting = deque()
+        self.drained = []
         self.conn = None
         self.supplier_cache = {}
-        self.product_cache = {}
+        self.masters = MasterIndex(link_threshold)
+        self.buffer = {}
+        self.flusher = None
+        self.new_masters = []
+        self.supplier_state = {}
+        self.pending_state = []
+        self.touched = []
+        self.pending_touched = []
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -42,51 +196,290 @@ class PostgresPipeline:
                 "dbname": crawler.settings.get("DB_NAME"),
                 "user": crawler.settings.get("DB_USER"),
                 "password": crawler.settings.get("DB_PASSWORD"),
-            }
+            },
+            batch_size=crawler.settings.getint("DB_BATCH_SIZE", BATCH_SIZE),
+            flush_interval=crawler.settings.getfloat("DB_FLUSH_INTERVAL", FLUSH_INTERVAL),
+            link_threshold=crawler.settings.getint("MASTER_LINK_THRESHOLD", SIMILARITY_THRESHOLD),
+            write_queue_size=crawler.settings.getint("DB_WRITE_QUEUE_SIZE", WRITE_QUEUE_SIZE),
         )
 
     def open_spider(self, spider):
+        if self.reactor is None:
+            from twisted.internet import reactor
+
+            self.reactor = reactor
+        if self.write_queue_size > 0:
+            self._start_writer()
+
+        # Connecting and loading the caches takes a while on a large catalog,
+        # so it runs on the writer thread; the crawl starts once it is done.
+        d = self._call(self._open, spider)
+        d.addCallbacks(lambda _: self._start_flusher(spider), self._open_failed)
+        return d
+
+    def _start_writer(self):
+        # The connection and the caches are only touched by this thread from
+        # here on; one thread keeps writes in order.
+        self.writer = ThreadPool(minthreads=1, maxthreads=1, name="postgres-writer")
+        self.writer.start()
+
+    def _call(self, f, *args):
+        if self.writer is None:
+            return defer.maybeDeferred(f, *args)
+        return threads.deferToThreadPool(self.reactor, self.writer, f, *args)
+
+    def _open(self, spider):
         self.conn = psycopg2.connect(**self.db_config)
         spider.logger.info(f"Connected to PostgreSQL: {self.db_config['dbname']}")
         self._load_product_cache(spider)
+        self._load_supplier_state(spider)
+
+        if self.batch_size > 1:
+            with self.conn.cursor() as cur:
+                cur.execute(CREATE_STAGING_SQL)
+            self.conn.commit()
+
+    def _start_flusher(self, spider):
+        if self.batch_size > 1 and self.flush_interval > 0:
+            # Slow crawls still reach the database every few seconds.
+            self.flusher = task.LoopingCall(self._flush, spider)
+            self.flusher.start(self.flush_interval, now=False)
+
+    def _open_failed(self, failure):
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        return failure
 
     def _load_product_cache(self, spider):
-        with self.conn.cursor() as cur:
+        # Named cursors stream the rows from the server in chunks instead of
+        # materializing a whole table client-side.
+        with self.conn.cursor(name="products_cache") as cur:
+            cur.itersize = FETCH_SIZE
             cur.execute("SELECT id, normalized_name FROM products WHERE normalized_name IS NOT NULL")
-            for row in cur.fetchall():
-                self.product_cache[row[0]] = row[1]
-        spider.logger.info(f"Loaded {len(self.product_cache)} products into cache")
+            for product_id, normalized_name in cur:
+                self.masters.add(product_id, normalized_name)
+        self.conn.commit()
+        spider.logger.info(f"Loaded {len(self.masters)} products into cache")
+
+    def _load_supplier_state(self, spider):
+        with self.conn.cursor() as cur:
+            supplier_id = self._get_or_create_supplier(cur, spider.name)
+        self.conn.commit()
+
+        with self.conn.cursor(name="supplier_products_state") as cur:
+            cur.itersize = FETCH_SIZE
+            cur.execute(
+                "SELECT external_id, id, current_price FROM supplier_products WHERE supplier_id = %s",
+                (supplier_id,),
+            )
+            for external_id, sp_id, price in cur:
+                self.supplier_state[external_id] = (sp_id, None if price is None else float(price))
+        self.conn.commit()
+        spider.logger.info(f"Loaded {len(self.supplier_state)} {spider.name} products into state")
 
     def close_spider(self, spider):
-        if self.conn:
+        if self.flusher is not None and self.flusher.running:
+            self.flusher.stop()
+        if not self.conn:
+            return None
+        self._flush(spider)
+        self._submit(spider, self._bump_scraped, spider)
+
+        def close(result):
+            if self.writer is not None:
+                self.writer.stop()
             self.conn.close()
             spider.logger.info("PostgreSQL connection closed")
+            return result
+
+        return self._drain().addBoth(close)
 
     def process_item(self, item, spider):
-        adapter = ItemAdapter(item)
+        # Writes may happen after later pipelines have seen the item.
+        adapter = ItemAdapter(dict(ItemAdapter(item)))
+
+        if self.batch_size > 1:
+            # A product seen twice in one batch would make the set-based
+            # upsert touch the same row twice; the latest copy wins.
+            self.buffer.pop(adapter.get("external_id"), None)
+            self.buffer[adapter.get("external_id")] = adapter
+            if len(self.buffer) >= self.batch_size:
+                self._flush(spider)
+        else:
+            self._submit(spider, self._write_item, spider, adapter)
+
+        if self.queued > self.write_queue_size:
+            accepted = defer.Deferred()
+            self.waiting.append(accepted)
+            return accepted.addCallback(lambda _: item)
+        return item
 
+    def _flush(self, spider):
+        if not self.buffer:
+            return
+        batch, self.buffer = list(self.buffer.values()), {}
+        self._submit(spider, self._write_batch_or_items, spider, batch)
+
+    def _submit(self, spider, write, *args):
+        if self.writer is None:
+            write(*args)
+            return
+        self.queued += 1
+        d = threads.deferToThreadPool(self.reactor, self.writer, write, *args)
+        d.addBoth(self._written, spider)
+
+    def _written(self, result, spider):
+        self.queued -= 1
+        while self.waiting and self.queued <= self.write_queue_size:
+            self.waiting.popleft().callback(None)
+        if not self.queued:
+            drained, self.drained = self.drained, []
+            for d in drained:
+                d.callback(None)
+        if isinstance(result, Failure):
+            spider.logger.error(f"Database writer failed: {result.getErrorMessage()}")
+
+    def _drain(self):
+        if not self.queued:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.drained.append(d)
+        return d
+
+    def _write_batch_or_items(self, spider, batch):
+        start = time.perf_counter()
+        try:
+            with self.conn.cursor() as cur:
+                self._write_batch(cur, spider, batch)
+                self._commit()
+        except Exception as e:
+            # One bad row fails the whole statement; replaying the batch item
+            # by item keeps every other row and logs the culprit.
+            self._rollback()
+            spider.logger.warning(f"Batch of {len(batch)} items failed ({e}), retrying one by one")
+            for adapter in batch:
+                self._write_item(spider, adapter)
+            return
+
+        spider.logger.debug(f"Wrote {len(batch)} items in {time.perf_counter() - start:.3f}s")
+        self._bump_scraped(spider, min_rows=self.batch_size)
+
+    def _write_batch(self, cur, spider, batch):
+        supplier_id = self._get_or_create_supplier(cur, spider.name)
+        by_external_id = {adapter.get("external_id"): adapter for adapter in batch}
+
+        rows = io.StringIO()
+        for adapter in batch:
+            row = self._row(supplier_id, adapter) + (self._price_changed(adapter),)
+            rows.write("\t".join(copy_value(v) for v in row))
+            rows.write("\n")
+        rows.seek(0)
+        cur.copy_expert(f"COPY {STAGING_TABLE} ({_STAGING_COLUMNS}) FROM STDIN", rows)
+
+        cur.execute(BATCH_UPSERT_SQL)
+        upserted = cur.fetchall()
+        self.pending_state = [(sp_id, by_external_id[external_id]) for sp_id, external_id, _ in upserted]
+
+        # Rows the upsert skipped are unchanged and only need last_scraped_at.
+        written = {external_id for _, external_id, _ in upserted}
+        self.pending_touched = [
+            self.supplier_state[external_id][0]
+            for external_id in by_external_id
+            if external_id not in written and external_id in self.supplier_state
+        ]
+
+        # Only new rows and rows whose identity changed lost their master link.
+        links = []
+        for sp_id, external_id, product_id in upserted:
+            if product_id:
+                continue
+            master_id = self._find_master(cur, by_external_id[external_id])
+            if master_id:
+                links.append((sp_id, master_id))
+        if links:
+            execute_values(
+                cur,
+                """
+                UPDATE supplier_products AS sp SET product_id = v.product_id
+                FROM (VALUES %s) AS v (id, product_id)
+                WHERE sp.id = v.id
+                """,
+                links,
+                page_size=len(links),
+            )
+
+    def _write_item(self, spider, adapter):
         try:
             with self.conn.cursor() as cur:
                 supplier_id = self._get_or_create_supplier(cur, spider.name)
-                sp_id, old_price, product_id = self._upsert_supplier_product(
-                    cur, supplier_id, adapter
-                )
+                price_changed = self._price_changed(adapter)
+                upserted = self._upsert_supplier_product(cur, supplier_id, adapter)
+
+                if upserted is None:
+                    known = self.supplier_state.get(adapter.get("external_id"))
+                    self.pending_touched = [known[0]] if known else []
+                else:
+                    sp_id, product_id = upserted
+                    self.pending_state = [(sp_id, adapter)]
 
-                new_price = adapter.get("price")
-                if new_price and (
-                    old_price is None or float(old_price) != float(new_price)
-                ):
-                    self._insert_price_history(cur, sp_id, adapter)
+                    if price_changed:
+                        self._insert_price_history(cur, sp_id, adapter)
 
-                if not product_id:
-                    self._try_link_to_master(cur, sp_id, adapter)
+                    if not product_id:
+                        self._try_link_to_master(cur, sp_id, adapter)
 
-                self.conn.commit()
+                self._commit()
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             spider.logger.error(f"DB error for {adapter.get('external_id')}: {e}")
+            return
 
-        return item
+        self._bump_scraped(spider, min_rows=self.batch_size)
+
+    def _commit(self):
+        self.conn.commit()
+        for sp_id, adapter in self.pending_state:
+            price = adapter.get("price")
+            self.supplier_state[adapter.get("external_id")] = (
+                sp_id,
+                None if price is None else float(price),
+            )
+        self.pending_state = []
+        self.new_masters.clear()
+
+        self.touched.extend(self.pending_touched)
+        self.pending_touched = []
+
+    def _bump_scraped(self, spider, min_rows=1):
+        # Unchanged rows are confirmed as still listed in one UPDATE per
+        # batch_size rows rather than one write each.
+        if len(self.touched) < min_rows:
+            return
+        touched, self.touched = self.touched, []
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(BUMP_SCRAPED_SQL, (touched,))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            spider.logger.error(f"DB error bumping last_scraped_at for {len(touched)} rows: {e}")
+
+    def _rollback(self):
+        # Master products created in the failed transaction no longer exist.
+        self.conn.rollback()
+        for master_id in self.new_masters:
+            self.masters.remove(master_id)
+        self.pending_state = []
+        self.pending_touched = []
+        self.new_masters.clear()
+
+    def _price_changed(self, adapter):
+        new_price = adapter.get("price")
+        if not new_price:
+            return False
+        _, old_price = self.supplier_state.get(adapter.get("external_id"), (None, None))
+        return old_price is None or old_price != float(new_price)
 
     def _get_or_create_supplier(self, cur, spider_name):
         if spider_name in self.supplier_cache:
@@ -115,68 +508,39 @@ class PostgresPipeline:
 
     def _upsert_supplier_product(self, cur, supplier_id, adapter):
         cur.execute(
-            "SELECT id, current_price FROM supplier_products WHERE supplier_id = %s AND external_id = %s",
-            (supplier_id, adapter.get("external_id")),
-        )
-        existing = cur.fetchone()
-        old_price = existing[1] if existing else None
-
-        cur.execute(
-            """
-            INSERT INTO supplier_products (
-                supplier_id, external_id, external_url, name, normalized_name,
-                brand, category, raw_category, unit, quantity, ean, anvisa_registration,
-                manufacturer_code, image_url, in_stock, current_price, pix_price,
-                original_price, discount_percent, last_scraped_at, created_at, updated_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW(), NOW())
-            ON CONFLICT (supplier_id, external_id) DO UPDATE SET
-                name = EXCLUDED.name,
-                normalized_name = EXCLUDED.normalized_name,
-                brand = EXCLUDED.brand,
-                category = EXCLUDED.category,
-                raw_category = EXCLUDED.raw_category,
-                unit = EXCLUDED.unit,
-                quantity = EXCLUDED.quantity,
-                ean = EXCLUDED.ean,
-                anvisa_registration = EXCLUDED.anvisa_registration,
-                manufacturer_code = EXCLUDED.manufacturer_code,
-                image_url = EXCLUDED.image_url,
-                in_stock = EXCLUDED.in_stock,
-                current_price = EXCLUDED.current_price,
-                pix_price = EXCLUDED.pix_price,
-                original_price = EXCLUDED.original_price,
-                discount_percent = EXCLUDED.discount_percent,
-                product_id = NULL,
-                last_scraped_at = NOW(),
-                updated_at = NOW()
-            RETURNING id
+            f"""
+            INSERT INTO supplier_products ({_COLUMNS}, last_scraped_at, created_at, updated_at)
+            VALUES ({", ".join(["%s"] * len(UPSERT_COLUMNS))}, NOW(), NOW(), NOW())
+            {UPSERT_CONFLICT}
+            RETURNING id, product_id
             """,
-            (
-                supplier_id,
-                adapter.get("external_id"),
-                adapter.get("external_url"),
-                adapter.get("name"),
-                adapter.get("normalized_name"),
-                adapter.get("brand") or adapter.get("normalized_brand"),
-                adapter.get("category"),
-                adapter.get("raw_category"),
-                adapter.get("unit", "unidade"),
-                adapter.get("quantity", 1),
-                adapter.get("ean"),
-                adapter.get("anvisa_registration"),
-                adapter.get("manufacturer_code"),
-                adapter.get("image_url"),
-                adapter.get("in_stock", True),
-                adapter.get("price"),
-                adapter.get("pix_price"),
-                adapter.get("original_price"),
-                adapter.get("discount_percent"),
-            ),
+            self._row(supplier_id, adapter),
+        )
+        # None when the row exists and nothing in it changed.
+        return cur.fetchone()
+
+    def _row(self, supplier_id, adapter):
+        return (
+            supplier_id,
+            adapter.get("external_id"),
+            adapter.get("external_url"),
+            adapter.get("name"),
+            adapter.get("normalized_name"),
+            adapter.get("brand") or adapter.get("normalized_brand"),
+            adapter.get("category"),
+            adapter.get("raw_category"),
+            adapter.get("unit", "unidade"),
+            adapter.get("quantity", 1),
+            adapter.get("ean"),
+            adapter.get("anvisa_registration"),
+            adapter.get("manufacturer_code"),
+            adapter.get("image_url"),
+            adapter.get("in_stock", True),
+            adapter.get("price"),
+            adapter.get("pix_price"),
+            adapter.get("original_price"),
+            adapter.get("discount_percent"),
         )
-        result = cur.fetchone()
-        sp_id = result[0]
-
-        return sp_id, old_price, None
 
     def _insert_price_history(self, cur, supplier_product_id, adapter):
         cur.execute(
@@ -195,34 +559,26 @@ class PostgresPipeline:
         )
 
     def _try_link_to_master(self, cur, supplier_product_id, adapter):
+        master_id = self._find_master(cur, adapter)
+        if master_id:
+            cur.execute(
+                "UPDATE supplier_products SET product_id = %s WHERE id = %s",
+                (master_id, supplier_product_id),
+            )
+
+    def _find_master(self, cur, adapter):
         name = adapter.get("name")
         quantity = adapter.get("quantity")
         unit = adapter.get("unit")
         normalized = normalize_name(name, quantity, unit)
 
         if not normalized:
-            return
-
-        best_match_id = None
-        best_score = 0
+            return None
 
-        for product_id, product_name in self.product_cache.items():
-            score = fuzz.ratio(normalized, product_name)
-            if score > best_score and score >= SIMILARITY_THRESHOLD:
-                best_score = score
-                best_match_id = product_id
-
-        if best_match_id:
-            cur.execute(
-                "UPDATE supplier_products SET product_id = %s WHERE id = %s",
-                (best_match_id, supplier_product_id),
-            )
-        else:
-            master_id = self._create_master_product(cur, adapter, normalized)
-            cur.execute(
-                "UPDATE supplier_products SET product_id = %s WHERE id = %s",
-                (master_id, supplier_product_id),
-            )
+        master_id = self.masters.find(normalized)
+        if master_id:
+            return master_id
+        return self._create_master_product(cur, adapter, normalized)
 
     def _create_master_product(self, cur, adapter, normalized_name):
         cur.execute(
@@ -242,5 +598,7 @@ class PostgresPipeline:
             ),
         )
         master_id = cur.fetchone()[0]
-        self.product_cache[master_id] = normalized_name
+        if master_id not in self.masters:
+            self.new_masters.append(master_id)
+        self.masters.add(master_id, normalized_name)
         return master_id
@@ -83,3 +83,7 @@ DB_PORT = int(os.getenv("DB_PORT", "54329"))
 DB_NAME = os.getenv("DB_NAME", "dental_radar")
 DB_USER = os.getenv("DB_USER", "dental_radar")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "secret")
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "500"))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "5"))
+DB_WRITE_QUEUE_SIZE = int(os.getenv("DB_WRITE_QUEUE_SIZE", "4"))
+MASTER_LINK_THRESHOLD = int(os.getenv("MASTER_LINK_THRESHOLD", "100"))
@@ -1,5 +1,7 @@
 import pytest
 
+from dental_scraper.matching.models import Product
+
 
 @pytest.fixture
 def sample_raw_product():
@@ -32,3 +34,30 @@ def sample_normalized_product():
         "price": 150.00,
         "in_stock": True,
     }
+
+
+@pytest.fixture
+def make_product():
+    # Products as the exporter writes them, already normalized; tests pass
+    # only the fields they are about.
+    def make(
+        supplier: str = "dental_speed",
+        external_id: str = "1",
+        name: str = "resina filtek z350 xt a2 4g",
+        **kwargs,
+    ) -> Product:
+        data = {
+            "supplier": supplier,
+            "external_id": external_id,
+            "name": name,
+            "normalized_name": name,
+            "normalized_brand": "3M",
+            "category": "Consumíveis > Resinas",
+            "unit": "Unidade",
+            "price": 100.0,
+            "in_stock": True,
+        }
+        data.update(kwargs)
+        return Product.from_dict(data)
+
+    return make
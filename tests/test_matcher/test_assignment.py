@@ -0,0 +1,93 @@
+import random
+
+from benchmarks.catalog import make_catalogs
+from dental_scraper.matching.assignment import (
+    connected_components,
+    exact_assignment,
+    global_assignment,
+    greedy_assignment,
+)
+from dental_scraper.matching.engine import MatchingEngine
+
+
+class TestAssignment:
+    def test_greedy_takes_highest_edges_first(self):
+        edges = [(0, 0, 0.9), (0, 1, 0.8), (1, 0, 0.95)]
+        assert sorted(greedy_assignment(edges)) == [(0, 1, 0.8), (1, 0, 0.95)]
+
+    def test_exact_maximizes_total(self):
+        edges = [(0, 0, 0.9), (0, 1, 0.85), (1, 0, 0.88)]
+        assert sorted(exact_assignment(edges)) == [(0, 1, 0.85), (1, 0, 0.88)]
+
+    def test_components(self):
+        edges = [(0, 0, 0.9), (1, 0, 0.8), (2, 5, 0.9)]
+        components = connected_components(edges)
+        assert sorted(len(c) for c in components) == [1, 2]
+
+    def test_pinned_edges_are_kept(self):
+        edges = [(0, 1, 0.9), (1, 0, 0.95)]
+        assert sorted(global_assignment(edges, pinned=[(0, 0, 1.0)])) == [(0, 0, 1.0)]
+
+    def test_large_components_fall_back_to_greedy(self):
+        edges = [(0, 0, 0.9), (0, 1, 0.85), (1, 0, 0.88)]
+        assert sorted(global_assignment(edges, max_exact_size=1)) == [(0, 0, 0.9)]
+
+    def test_kept_edges_still_size_their_component(self):
+        edges = [(0, 0, 0.9), (0, 1, 0.85), (1, 0, 0.88), (2, 1, 0.7)]
+        chosen = global_assignment(edges, max_exact_size=2, kept=[(2, 2, 0.95)])
+        assert sorted(chosen) == [(0, 0, 0.9), (2, 2, 0.95)]
+
+
+class TestGlobalEngine:
+    def test_early_product_does_not_steal_better_match(self, make_product):
+        early = make_product("dental_speed", "1", "resina filtek z350 xt a3 4g")
+        late = make_product("dental_speed", "2", "filtek z350 xt a3")
+        target = make_product("dental_cremer", "1", "resina filtek z350 xt a3")
+        other = make_product("dental_cremer", "2", "resina filtek z350 xt a3 4g seringa")
+
+        greedy = MatchingEngine(assignment="greedy").match([early, late], [target, other])
+        result = MatchingEngine().match([early, late], [target, other])
+
+        assert len(greedy.matches) < len(result.matches)
+        pairs = {(m.product_a.uid, m.product_b.uid) for m in result.matches}
+        assert pairs == {
+            ("dental_speed:1", "dental_cremer:2"),
+            ("dental_speed:2", "dental_cremer:1"),
+        }
+
+    def test_independent_of_input_order(self, make_product):
+        rng = random.Random(7)
+        words = ["resina", "filtek", "z350", "z250", "xt", "a1", "a2", "a3", "4g", "seringa"]
+        products_a = [
+            make_product("dental_speed", str(i), " ".join(rng.sample(words, 5)))
+            for i in range(60)
+        ]
+        products_b = [
+            make_product("dental_cremer", str(i), " ".join(rng.sample(words, 5)))
+            for i in range(60)
+        ]
+
+        def pairs(result):
+            return sorted((m.product_a.uid, m.product_b.uid) for m in result.matches)
+
+        forward = MatchingEngine().match(products_a, products_b)
+        backward = MatchingEngine().match(products_a[::-1], products_b)
+        assert forward.matches
+        assert pairs(forward) == pairs(backward)
+
+    def test_independent_of_catalog_b_order(self):
+        products_a, products_b = make_catalogs(2000, seed=0).values()
+        shuffled = products_b[:]
+        random.Random(3).shuffle(shuffled)
+
+        def pairs(result):
+            return sorted((m.product_a.uid, m.product_b.uid) for m in result.matches)
+
+        engine = MatchingEngine()
+        index_b, index_shuffled = engine.build_index(products_b), engine.build_index(shuffled)
+        for product in products_a:
+            # Includes the token fallback, whose ties used to follow B's order.
+            assert index_b.find_by_tokens(product) == index_shuffled.find_by_tokens(product)
+        assert pairs(engine.match(products_a, products_b)) == pairs(
+            engine.match(products_a, shuffled)
+        )
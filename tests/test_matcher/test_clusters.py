@@ -0,0 +1,65 @@
+import pytest
+
+from dental_scraper.matching.clusters import UnionFind
+from dental_scraper.matching.engine import MatchingEngine
+
+
+@pytest.fixture
+def products(make_product):
+    return [
+        make_product("dental_speed", "1", "resina filtek z350 xt a2", ean="7891234567895"),
+        make_product("dental_speed", "2", "luva latex procedimento m", normalized_brand=""),
+        make_product("dental_cremer", "1", "resina filtek z350 a2 xt", ean="7891234567895", price=90.0),
+        make_product("dental_cremer", "2", "luva procedimento latex m", normalized_brand=""),
+        make_product("surya_dental", "1", "resina z350 xt filtek a2", price=95.0),
+        make_product("surya_dental", "2", "resina z350 xt filtek a2 seringa"),
+    ]
+
+
+class TestUnionFind:
+    def test_union_and_find(self):
+        uf = UnionFind()
+        for uid, supplier in [("a", "x"), ("b", "y"), ("c", "z")]:
+            uf.add(uid, supplier)
+
+        assert uf.union("a", "b")
+        assert uf.union("b", "c")
+        assert uf.find("a") == uf.find("c")
+        assert not uf.union("a", "c")
+
+    def test_rejects_two_products_from_same_supplier(self):
+        uf = UnionFind()
+        for uid, supplier in [("a", "x"), ("b", "y"), ("c", "x")]:
+            uf.add(uid, supplier)
+
+        assert uf.union("a", "b")
+        assert not uf.union("b", "c")
+
+
+class TestMatchClusters:
+    def test_clusters_across_all_suppliers(self, products):
+        result = MatchingEngine().match_clusters(products)
+
+        resin = result.clusters[0]
+        assert sorted(p.uid for p in resin.products) == [
+            "dental_cremer:1",
+            "dental_speed:1",
+            "surya_dental:1",
+        ]
+        assert resin.cheapest.supplier == "dental_cremer"
+        assert [p.uid for p in result.unclustered] == ["surya_dental:2"]
+
+    def test_brandless_products_cluster_through_tokens(self, products):
+        result = MatchingEngine().match_clusters(products)
+        gloves = [c for c in result.clusters if c.products[0].name.startswith("luva")]
+        assert len(gloves) == 1
+        assert len(gloves[0].products) == 2
+
+    def test_each_pair_scored_once(self, products):
+        result = MatchingEngine().match_clusters(products)
+        links = [(m.product_a.uid, m.product_b.uid) for c in result.clusters for m in c.links]
+        assert len(links) == len({tuple(sorted(pair)) for pair in links})
+
+    def test_match_all_pairs_rejects_more_than_two_suppliers(self, products):
+        with pytest.raises(ValueError):
+            MatchingEngine().match_all_pairs(products)
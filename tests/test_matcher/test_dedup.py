@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from dental_scraper.matching.dedup import MinHasher, find_duplicates, jaccard, shingles
+
+
+class TestMinHash:
+    def test_signature_agreement_estimates_jaccard(self):
+        a = shingles("resina composta filtek z350 xt cor a2 seringa 4g")
+        b = shingles("resina composta filtek z350 xt a2 seringa 4g")
+        hasher = MinHasher(num_hashes=256)
+        estimate = np.mean(hasher.signature(a) == hasher.signature(b))
+        assert abs(estimate - jaccard(a, b)) < 0.1
+
+    def test_deterministic_for_a_seed(self):
+        s = shingles("luva de procedimento latex m")
+        assert (MinHasher(seed=1).signature(s) == MinHasher(seed=1).signature(s)).all()
+
+
+class TestFindDuplicates:
+    def test_groups_repeat_listings(self, make_product):
+        products = [
+            make_product(external_id="1", name="resina filtek z350 xt a2 4g", price=120.0),
+            make_product(external_id="2", name="resina filtek z350 xt a2 4g", price=110.0),
+            make_product(
+                external_id="3", name="filtek z350 xt a2 4g resina", in_stock=False, price=90.0
+            ),
+            make_product(external_id="4", name="luva de procedimento latex m"),
+        ]
+        result = find_duplicates(products)
+
+        assert len(result.groups) == 1
+        group = result.groups[0]
+        # In-stock listings are kept over cheaper out-of-stock ones.
+        assert [p.external_id for p in group.products] == ["2", "1", "3"]
+        assert group.similarity < 1.0
+        assert result.stats["by_supplier"] == {"dental_speed": 2}
+        assert [p.external_id for p in result.collapse(products)] == ["2", "4"]
+
+    @pytest.mark.parametrize(
+        "other",
+        [
+            {"normalized_name": "resina filtek z350 xt a3 4g"},
+            {"quantity": 2},
+            {"normalized_brand": "FGM"},
+            {"ean": "7891234567888"},
+            {"supplier": "dental_cremer"},
+        ],
+    )
+    def test_variants_and_other_suppliers_are_kept(self, other, make_product):
+        products = [
+            make_product(external_id="1", name="resina filtek z350 xt a2 4g", ean="7891234567895"),
+            make_product(external_id="2", name="resina filtek z350 xt a2 4g", **other),
+        ]
+        assert find_duplicates(products).groups == []
+
+    def test_large_buckets(self, monkeypatch, make_product):
+        monkeypatch.setattr("dental_scraper.matching.dedup.MAX_BUCKET_SIZE", 3)
+        products = [
+            make_product(external_id=str(i), name="sugador descartavel c/ 40 un") for i in range(10)
+        ]
+        result = find_duplicates(products)
+        assert [len(g.products) for g in result.groups] == [10]
+
+    def test_bands_must_divide_hashes(self):
+        with pytest.raises(ValueError):
+            find_duplicates([], num_hashes=64, bands=5)
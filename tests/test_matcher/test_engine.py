@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from dental_scraper.matching.engine import MatchingEngine
+from dental_scraper.matching.models import Product
+
+from .test_similarity import random_product
+
+
+@pytest.fixture
+def catalogs():
+    rng = random.Random(42)
+    products_a = [random_product(rng, "dental_speed", str(i)) for i in range(120)]
+    products_b = [random_product(rng, "dental_cremer", str(i)) for i in range(150)]
+    return products_a, products_b
+
+
+@pytest.fixture
+def catalogs_with_ean():
+    # Random catalogs plus one pair that only an identifier can match.
+    rng = random.Random(7)
+    products_a = [random_product(rng, "dental_speed", str(i)) for i in range(80)]
+    products_b = [random_product(rng, "dental_cremer", str(i)) for i in range(90)]
+    products_b.append(Product.from_dict({
+        "supplier": "dental_cremer",
+        "external_id": "ean",
+        "normalized_name": "resina",
+        "ean": "7891234567895",
+    }))
+    products_a.append(Product.from_dict({
+        "supplier": "dental_speed",
+        "external_id": "ean",
+        "normalized_name": "resina z350",
+        "ean": "7891234567895",
+    }))
+    return products_a, products_b
+
+
+def pairs(result):
+    return [(m.product_a.uid, m.product_b.uid, m.confidence) for m in result.matches]
+
+
+class TestBatchedEngine:
+    def test_same_matches_as_scalar(self, catalogs):
+        products_a, products_b = catalogs
+        scalar = MatchingEngine().match(products_a, products_b)
+        batched = MatchingEngine(batch_size=16).match(products_a, products_b)
+
+        def pairs(result):
+            return [
+                (m.product_a.uid, m.product_b.uid, m.confidence, m.method)
+                for m in result.matches
+            ]
+
+        assert pairs(batched) == pairs(scalar)
+        assert scalar.matches
+
+
+class TestParallelEngine:
+    @pytest.mark.parametrize("batch_size", [0, 16])
+    def test_same_matches_as_serial(self, catalogs, batch_size):
+        products_a, products_b = catalogs
+        serial = MatchingEngine(batch_size=batch_size).match(products_a, products_b)
+        parallel = MatchingEngine(batch_size=batch_size, workers=2).match(products_a, products_b)
+
+        assert [(m.product_a, m.product_b, m.confidence) for m in parallel.matches] == [
+            (m.product_a, m.product_b, m.confidence) for m in serial.matches
+        ]
+        assert parallel.unmatched_b == serial.unmatched_b
+
+
+class TestInstrumentedEngine:
+    def test_disabled_by_default(self, catalogs_with_ean):
+        assert "timings" not in MatchingEngine().match(*catalogs_with_ean).stats
+
+    def test_counters(self, catalogs_with_ean):
+        products_a, _ = catalogs_with_ean
+        result = MatchingEngine(instrument=True).match(*catalogs_with_ean)
+        stats = result.stats
+        counters = stats["counters"]
+
+        assert pairs(result) == pairs(MatchingEngine().match(*catalogs_with_ean))
+        assert {"index_build", "candidate_lookup", "similarity", "score", "resolve"} <= set(
+            stats["timings"]
+        )
+        assert sum(stats["candidates_per_query"].values()) == len(products_a)
+        assert counters["exact_pairs"] >= 1
+        assert 0 < counters["min_name_rejects"] <= counters["fuzzy_pairs"]
+        assert counters["fallback_hits"] <= counters["fallback_queries"]
+
+    @pytest.mark.parametrize("options", [{"batch_size": 16}, {"workers": 2, "batch_size": 0}])
+    def test_same_counters_on_every_path(self, catalogs_with_ean, options):
+        # Serial global assignment scores every candidate pair, like the
+        # batched and parallel paths; only how many get pruned may differ.
+        expected = MatchingEngine(instrument=True, assignment="global").match(*catalogs_with_ean).stats
+        stats = MatchingEngine(instrument=True, **options).match(*catalogs_with_ean).stats
+        expected["counters"].pop("pruned_pairs", None)
+        stats["counters"].pop("pruned_pairs", None)
+        assert stats["counters"] == expected["counters"]
+        assert stats["candidates_per_query"] == expected["candidates_per_query"]
+
+    def test_greedy_pruning(self, catalogs_with_ean):
+        options = {"instrument": True, "assignment": "greedy"}
+        unpruned = MatchingEngine(batch_size=16, **options).match(*catalogs_with_ean)
+        pruned = MatchingEngine(**options).match(*catalogs_with_ean)
+        counters = pruned.stats["counters"]
+
+        assert pairs(pruned) == pairs(unpruned)
+        assert counters["early_exits"] >= 1
+        assert counters["pruned_pairs"] > 0
+        assert "pruned_pairs" not in unpruned.stats["counters"]
+
+    def test_clusters(self, catalogs_with_ean):
+        products_a, products_b = catalogs_with_ean
+        stats = MatchingEngine(instrument=True).match_clusters(products_a + products_b).stats
+        assert {"index_build", "score", "cluster"} <= set(stats["timings"])
+        assert stats["counters"]["fuzzy_pairs"] > 0
@@ -0,0 +1,34 @@
+from rapidfuzz import fuzz
+
+from dental_scraper.matching.features import category_id, extract_features, features_of
+from dental_scraper.matching.index import MatchIndex
+
+
+class TestExtractFeatures:
+    def test_fields(self, make_product):
+        features = extract_features(make_product("dental_speed", "1", "z350 resina filtek z350"))
+        assert features.sorted_name == "filtek resina z350 z350"
+        assert features.tokens == ("filtek", "resina", "z350")
+        assert features.brand == "3m"
+        assert features.unit == "unidade"
+        assert features.category_id == category_id("Consumíveis > Resinas")
+
+    def test_sorted_name_ratio_matches_token_sort_ratio(self, make_product):
+        a = make_product("dental_speed", "1", "resina filtek z350 xt a2")
+        b = make_product("dental_cremer", "1", "filtek z350 resina a2 4g")
+        expected = fuzz.token_sort_ratio(a.normalized_name, b.normalized_name)
+        assert fuzz.ratio(features_of(a).sorted_name, features_of(b).sorted_name) == expected
+
+    def test_category_ids(self):
+        assert category_id("") == -1
+        assert category_id("Consumíveis > Resinas") != category_id("Consumíveis > Luvas")
+
+    def test_computed_once(self, make_product):
+        product = make_product("dental_speed", "1", "resina")
+        assert product.features is None
+        assert features_of(product) is features_of(product)
+
+    def test_index_populates_features(self, make_product):
+        product = make_product("dental_speed", "1", "resina filtek")
+        MatchIndex().add(product)
+        assert product.features is not None
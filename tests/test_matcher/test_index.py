@@ -0,0 +1,92 @@
+import pytest
+
+from dental_scraper.matching.index import MatchIndex
+
+
+@pytest.fixture
+def index(make_product):
+    index = MatchIndex(fuzzy_top_k=2)
+    index.add_many([
+        make_product("dental_speed", "1", "resina filtek z350 xt a2"),
+        make_product("dental_speed", "2", "resina filtek z250 a3"),
+        make_product("dental_speed", "3", "luva de procedimento latex m"),
+        make_product("dental_speed", "4", "resina opallis a2"),
+    ])
+    return index
+
+
+class TestFindByTokens:
+    def test_rare_tokens_rank_first(self, index, make_product):
+        query = make_product("dental_cremer", "q", "filtek z350")
+        candidates = index.find_by_tokens(query)
+        assert [p.external_id for p in candidates] == ["1", "2"]
+
+    def test_top_k_cap(self, index, make_product):
+        query = make_product("dental_cremer", "q", "resina")
+        assert len(index.find_by_tokens(query)) == 2
+        assert len(index.find_by_tokens(query, top_k=3)) == 3
+
+    def test_no_shared_tokens(self, index, make_product):
+        query = make_product("dental_cremer", "q", "sugador descartavel")
+        assert index.find_by_tokens(query) == []
+
+    def test_excludes_self(self, index, make_product):
+        query = make_product("dental_speed", "1", "resina filtek z350 xt a2")
+        assert all(p.external_id != "1" for p in index.find_by_tokens(query))
+
+    def test_finds_products_without_brand(self, index, make_product):
+        query = make_product("dental_cremer", "q", "luva latex m", normalized_brand="")
+        assert [p.external_id for p in index.find_by_tokens(query)] == ["3"]
+
+
+class TestUidStore:
+    def test_uid_computed_once(self, make_product):
+        product = make_product("dental_speed", "1", "resina")
+        assert product.uid == "dental_speed:1"
+        assert product.uid is product.uid
+
+    def test_find_candidates_returns_products(self, make_product):
+        index = MatchIndex()
+        stored = make_product("dental_speed", "1", "resina filtek", ean="7891234567895")
+        index.add(stored)
+
+        query = make_product("dental_cremer", "q", "resina", ean="7891234567895")
+        assert index.find_candidates(query)[0] is stored
+
+    def test_remove(self, index):
+        removed = index.remove("dental_speed:1")
+        assert removed.external_id == "1"
+        assert "dental_speed:1" not in index
+        assert len(index) == 3
+        assert "z350" not in index.by_token
+        assert index.remove("dental_speed:1") is None
+
+    def test_update_reindexes(self, make_product):
+        index = MatchIndex()
+        index.add(make_product("dental_speed", "1", "resina", ean="7891234567895"))
+        index.update(make_product("dental_speed", "1", "resina", ean="7891234567888"))
+
+        assert len(index) == 1
+        assert index.find_by_ean("7891234567895") == []
+        assert [p.ean for p in index.find_by_ean("7891234567888")] == ["07891234567888"]
+
+
+class TestCopy:
+    def test_changes_stay_in_the_copy(self, index, make_product):
+        copy = index.copy()
+        copy.remove("dental_speed:1")
+        copy.add(make_product("dental_speed", "5", "resina z350 flow"))
+
+        assert "dental_speed:1" in index
+        assert "dental_speed:5" not in index
+        assert set(index.by_token["z350"]) == {"dental_speed:1"}
+        assert set(copy.by_token["z350"]) == {"dental_speed:5"}
+
+    def test_untouched_buckets_are_shared(self, index):
+        copy = index.copy()
+        assert copy.by_token["luva"] is index.by_token["luva"]
+
+        # Either side copies a shared bucket before changing it.
+        index.remove("dental_speed:3")
+        assert "luva" not in index.by_token
+        assert set(copy.by_token["luva"]) == {"dental_speed:3"}
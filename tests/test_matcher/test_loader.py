@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from dental_scraper.matching import loader
+from dental_scraper.matching.loader import iter_records, load_index
+
+
+def make_record(i: int) -> dict:
+    return {
+        "supplier": "dental_speed",
+        "external_id": str(i),
+        "name": f"Resina Filtek {i}",
+        "normalized_name": f"resina filtek {i}",
+        "price": 10.5 + i,
+    }
+
+
+RECORDS = [make_record(i) for i in range(50)]
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(loader, "CHUNK_SIZE", 64)
+
+
+def write_array(path, records, indent=None):
+    path.write_text(json.dumps(records, indent=indent, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+class TestIterRecords:
+    @pytest.mark.parametrize("indent", [None, 2])
+    def test_json_array(self, tmp_path, indent):
+        path = write_array(tmp_path / "export.json", RECORDS, indent)
+        assert list(iter_records(path)) == RECORDS
+
+    def test_json_lines(self, tmp_path):
+        path = tmp_path / "export.jsonl"
+        path.write_text("\n".join(json.dumps(r) for r in RECORDS) + "\n", encoding="utf-8")
+        assert list(iter_records(path)) == RECORDS
+
+    def test_truncated_array_keeps_complete_records(self, tmp_path):
+        content = json.dumps(RECORDS)
+        cut = content.index('"external_id": "30"')
+        path = tmp_path / "export.json"
+        path.write_text(content[:cut], encoding="utf-8")
+        assert list(iter_records(path)) == RECORDS[:30]
+
+    @pytest.mark.parametrize("bad", ['"price": 30.5.1', '"price": [30.5}'])
+    def test_malformed_record_is_skipped(self, tmp_path, caplog, bad):
+        content = json.dumps(RECORDS).replace('"price": 30.5', bad)
+        path = tmp_path / "export.json"
+        path.write_text(content, encoding="utf-8")
+        assert list(iter_records(path)) == RECORDS[:20] + RECORDS[21:]
+        assert "skipped malformed record" in caplog.text
+
+    def test_unclosed_array(self, tmp_path):
+        path = tmp_path / "export.json"
+        path.write_text(json.dumps(RECORDS)[:-1] + ",\n", encoding="utf-8")
+        assert list(iter_records(path)) == RECORDS
+
+    def test_malformed_line_is_skipped(self, tmp_path):
+        lines = [json.dumps(r) for r in RECORDS[:3]]
+        lines[1] = lines[1][:20]
+        path = tmp_path / "export.jsonl"
+        path.write_text("\n".join(lines), encoding="utf-8")
+        assert list(iter_records(path)) == [RECORDS[0], RECORDS[2]]
+
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "export.json"
+        path.write_text("", encoding="utf-8")
+        assert list(iter_records(path)) == []
+        path.write_text("[]", encoding="utf-8")
+        assert list(iter_records(path)) == []
+
+
+class TestLoadIndex:
+    def test_feeds_index(self, tmp_path):
+        path = write_array(tmp_path / "export.json", RECORDS)
+        index = load_index(path)
+        assert len(index) == len(RECORDS)
+        assert index.get("dental_speed:7").price_cents == 1750
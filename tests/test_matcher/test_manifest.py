@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+
+import pytest
+
+from dental_scraper.matching.manifest import ExportManifest, ManifestEntry
+from dental_scraper.matching.runner import find_latest_json_files, save_results
+from dental_scraper.pipelines.exporter import JsonExporterPipeline, SnapshotExporterPipeline
+
+
+def export(tmp_path, spider: str, run: str, suffix: str = ".json") -> ManifestEntry:
+    path = tmp_path / f"{spider}_{run}{suffix}"
+    path.write_text("[]")
+    entry = ManifestEntry.describe(path, spider, run, items=0)
+    ExportManifest(tmp_path).record(entry)
+    return entry
+
+
+class FakeSpider:
+    def __init__(self, name, output_dir):
+        self.name = name
+        self.settings = {"OUTPUT_DIR": str(output_dir)}
+        self.logger = logging.getLogger(name)
+
+
+class TestExportManifest:
+    def test_latest_run_per_spider(self, tmp_path):
+        export(tmp_path, "dental_speed", "20260101_000000")
+        export(tmp_path, "dental_speed", "20260102_000000")
+        export(tmp_path, "dental_cremer", "20260101_000000")
+        # An older run that finishes late does not replace the newer one.
+        export(tmp_path, "dental_speed", "20251231_000000")
+
+        assert ExportManifest(tmp_path).latest() == {
+            "dental_speed": tmp_path / "dental_speed_20260102_000000.json",
+            "dental_cremer": tmp_path / "dental_cremer_20260101_000000.json",
+        }
+
+    def test_snapshot_of_the_same_run_is_preferred(self, tmp_path):
+        export(tmp_path, "dental_speed", "20260101_000000", ".dcat")
+        export(tmp_path, "dental_speed", "20260102_000000")
+        assert ExportManifest(tmp_path).latest()["dental_speed"].suffix == ".json"
+
+        export(tmp_path, "dental_speed", "20260102_000000", ".dcat")
+        assert ExportManifest(tmp_path).latest()["dental_speed"].suffix == ".dcat"
+
+    def test_entry_describes_file(self, tmp_path):
+        entry = export(tmp_path, "dental_speed", "20260101_000000")
+        loaded = ExportManifest(tmp_path).load()["dental_speed"]
+        assert loaded == [entry]
+        assert entry.bytes == 2
+        assert len(entry.sha256) == 64
+
+    def test_runner_trusts_manifest_over_directory(self, tmp_path):
+        export(tmp_path, "dental_speed", "20260101_000000")
+        # A newer file the manifest does not list, e.g. one still being written.
+        (tmp_path / "dental_speed_20260102_000000.json").write_text("[")
+        assert find_latest_json_files(tmp_path) == {
+            "dental_speed": tmp_path / "dental_speed_20260101_000000.json"
+        }
+
+    def test_runner_scans_spiders_missing_from_manifest_on_request(self, tmp_path):
+        export(tmp_path, "dental_speed", "20260101_000000")
+        # Exported before the manifest existed.
+        (tmp_path / "dental_cremer_20251231_000000.json").write_text("[]")
+        assert find_latest_json_files(tmp_path) == {
+            "dental_speed": tmp_path / "dental_speed_20260101_000000.json",
+        }
+        assert find_latest_json_files(tmp_path, scan=True) == {
+            "dental_speed": tmp_path / "dental_speed_20260101_000000.json",
+            "dental_cremer": tmp_path / "dental_cremer_20251231_000000.json",
+        }
+
+    def test_runner_scan_only_takes_exports(self, tmp_path):
+        for name in (
+            "dental_speed_20260101_000000.json",
+            "dental_cremer.json",
+            "suppliers_metadata.json",
+            "dental_speed_backup.json",
+            "surya_dental.json",
+        ):
+            (tmp_path / name).write_text("[]")
+        save_results(tmp_path / "matches.json", "matches", [], {}, {})
+        assert find_latest_json_files(tmp_path) == {
+            "dental_speed": tmp_path / "dental_speed_20260101_000000.json",
+            "dental_cremer": tmp_path / "dental_cremer.json",
+        }
+
+    def test_unknown_version(self, tmp_path):
+        (tmp_path / "manifest.json").write_text(json.dumps({"version": 99, "spiders": {}}))
+        with pytest.raises(ValueError):
+            ExportManifest(tmp_path).load()
+
+
+def test_exporter_pipelines_record_runs(tmp_path):
+    spider = FakeSpider("dental_speed", tmp_path)
+    pipelines = [JsonExporterPipeline(), SnapshotExporterPipeline()]
+    item = {
+        "supplier": "dental_speed",
+        "external_id": "1",
+        "name": "Resina Filtek Z350 XT A2",
+        "normalized_name": "resina filtek z350 xt a2",
+        "price": 100.0,
+    }
+
+    for pipeline in pipelines:
+        pipeline.spider_opened(spider)
+        pipeline.process_item(item, spider)
+    assert ExportManifest(tmp_path).latest() == {}
+    for pipeline in pipelines:
+        pipeline.spider_closed(spider)
+
+    entries = ExportManifest(tmp_path).load()["dental_speed"]
+    assert sorted(e.suffix for e in entries) == [".dcat", ".json"]
+    assert {e.run for e in entries} == {spider.export_run}
+    assert all(e.items == 1 for e in entries)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    assert find_latest_json_files(tmp_path)["dental_speed"].suffix == ".dcat"
+
+
+@pytest.mark.parametrize("reason", ["shutdown", "cancelled"])
+def test_interrupted_crawl_keeps_last_complete_run(tmp_path, reason):
+    export(tmp_path, "dental_speed", "20260101_000000")
+    spider = FakeSpider("dental_speed", tmp_path)
+    pipelines = [JsonExporterPipeline(), SnapshotExporterPipeline()]
+    for pipeline in pipelines:
+        pipeline.spider_opened(spider)
+        pipeline.process_item({"supplier": "dental_speed", "external_id": "1"}, spider)
+        pipeline.spider_closed(spider, reason)
+
+    assert find_latest_json_files(tmp_path) == {
+        "dental_speed": tmp_path / "dental_speed_20260101_000000.json"
+    }
+    assert sorted(os.listdir(tmp_path)) == [
+        "dental_speed_20260101_000000.json",
+        "manifest.json",
+        "manifest.json.lock",
+    ]
@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from dental_scraper.matching.models import Product, ProductMatch
+
+
+class TestProduct:
+    def test_prices_stored_as_cents(self, make_product):
+        product = make_product("dental_speed", price=19.99, pix_price="18.5")
+        assert product.price_cents == 1999
+        assert product.pix_price_cents == 1850
+        assert product.price == Decimal("19.99")
+
+    def test_half_cents_round_up_exactly(self, make_product):
+        # 1.005 and 2.675 are just below the half cent as floats.
+        product = make_product("dental_speed", price=1.005, pix_price="2.675")
+        assert product.price_cents == 101
+        assert product.pix_price_cents == 268
+
+    def test_missing_price(self, make_product):
+        product = make_product("dental_speed", price=None)
+        assert product.price_cents is None
+        assert product.price is None
+
+    def test_categorical_strings_are_interned(self, make_product):
+        category = "".join(["Consumíveis > ", "Resinas"])
+        a = make_product("dental_speed", price=10.0, category=category)
+        b = make_product("dental_cremer", price=10.0, category="Consumíveis > Resinas")
+        assert a.category is b.category
+        assert a.brand_key == "3m"
+
+    def test_no_instance_dict(self, make_product):
+        assert not hasattr(make_product("dental_speed", price=10.0), "__dict__")
+
+    def test_codes_are_canonicalized(self, make_product):
+        a = make_product(
+            "dental_speed", price=10, ean="789 1234 567895", anvisa_registration="1.0497.1384.001-1"
+        )
+        b = make_product(
+            "dental_cremer", price=10, ean="07891234567895", anvisa_registration="Isento"
+        )
+        assert a.ean == b.ean == "07891234567895"
+        assert a.anvisa_registration == "1049713840011"
+        assert b.anvisa_registration is None
+        assert make_product("dental_speed", price=10, ean="7891234567890").ean is None
+
+    def test_from_rows_coerces_csv_values(self):
+        rows = [{
+            "supplier": "dental_speed",
+            "external_id": "1",
+            "normalized_name": "resina",
+            "quantity": "10",
+            "in_stock": "False",
+            "price": "150.0",
+            "ean": "",
+        }]
+        original = [dict(row) for row in rows]
+        [product] = Product.from_rows(rows)
+        assert product.quantity == 10
+        assert product.in_stock is False
+        assert product.price_cents == 15000
+        assert product.ean is None
+        assert rows == original
+
+
+class TestProductMatch:
+    def test_price_comparison(self, make_product):
+        match = ProductMatch(
+            product_a=make_product("dental_speed", price=100.0),
+            product_b=make_product("dental_cremer", price=90.0),
+            confidence=0.9,
+            method="fuzzy",
+        )
+        assert match.price_diff_absolute == Decimal("-10.00")
+        assert match.price_diff_percent == -10.0
+        assert match.cheaper_supplier == "dental_cremer"
+        assert match.to_dict()["product_b"]["price"] == 90.0
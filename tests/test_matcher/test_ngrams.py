@@ -0,0 +1,115 @@
+import pickle
+from dataclasses import replace
+
+import pytest
+
+from dental_scraper.matching.engine import MatchingEngine
+from dental_scraper.matching.index import MatchIndex
+from dental_scraper.matching.ngrams import NgramIndex, char_ngrams
+
+
+@pytest.fixture
+def catalog(make_product):
+    return [
+        make_product("dental_cremer", "1", "resina filtek z350 xt a2 4g"),
+        make_product("dental_cremer", "2", "resina filtek z250 a3 4g"),
+        make_product("dental_cremer", "3", "luva de procedimento latex m"),
+        make_product("dental_cremer", "4", "anestesico lidocaina 2% c/ 50 tubetes"),
+        make_product("dental_speed", "5", "resina z350 xt filtek a2"),
+    ]
+
+
+def test_char_ngrams():
+    assert char_ngrams("z350") == [" z3", "z35", "350", "50 "]
+    assert char_ngrams("") == []
+
+
+class TestNgramIndex:
+    def test_closest_names_rank_first(self, catalog, make_product):
+        index = NgramIndex(catalog)
+        query = make_product("dental_speed", "q", "resina filtek z350 a2")
+        found = index.top_k([query], 2)[0]
+        assert [p.external_id for p, _ in found] == ["1", "5"]
+        assert found[0][1] >= found[1][1] >= index.min_similarity
+
+    def test_excludes_self_and_own_supplier(self, catalog):
+        index = NgramIndex(catalog)
+        query = catalog[0]
+        assert all(p is not query for p, _ in index.top_k([query], 5)[0])
+        found = index.top_k([query], 5, exclude_own_supplier=True)[0]
+        assert [p.external_id for p, _ in found] == ["5"]
+
+    def test_blocks_agree_with_single_queries(self, catalog):
+        index = NgramIndex(catalog, min_similarity=0.0, block_size=2)
+        batched = index.top_k(catalog, 3)
+        assert batched == [index.top_k([p], 3)[0] for p in catalog]
+
+    def test_unknown_trigrams(self, catalog, make_product):
+        index = NgramIndex(catalog)
+        assert index.top_k([make_product("dental_speed", "q", "xyzw")], 3) == [[]]
+
+
+class TestMatchIndexNgrams:
+    def test_neighbours_follow_index_changes(self, catalog):
+        index = MatchIndex()
+        index.add_many(catalog[:4])
+        query = catalog[4]
+        index.prepare_ngrams([query], top_k=2)
+        assert [p.external_id for p in index.find_by_ngrams(query, 2)] == ["1", "2"]
+
+        index.remove(catalog[0].uid)
+        assert [p.external_id for p in index.find_by_ngrams(query, 2)] == ["2"]
+
+    def test_prepared_neighbours_serve_copies(self, catalog, monkeypatch):
+        index = MatchIndex()
+        index.add_many(catalog[:4])
+        query = catalog[4]
+        index.prepare_ngrams([query], top_k=2)
+
+        lookups = []
+        top_k = index.ngrams.top_k
+
+        def counting_top_k(products, *args, **kwargs):
+            lookups.append(products)
+            return top_k(products, *args, **kwargs)
+
+        monkeypatch.setattr(index.ngrams, "top_k", counting_top_k)
+        # As a worker process receives it.
+        copy = pickle.loads(pickle.dumps(query))
+        assert [p.external_id for p in index.find_by_ngrams(copy, 2)] == ["1", "2"]
+        assert lookups == []
+
+        changed = replace(query, normalized_name="luva de procedimento latex m")
+        assert [p.external_id for p in index.find_by_ngrams(changed, 2)] == ["3"]
+        assert len(lookups) == 1
+
+
+class TestEngine:
+    def test_finds_pairs_outside_the_block(self, make_product):
+        products_a = [make_product("dental_speed", "1", "resina filtek z350 xt a2")]
+        products_b = [
+            make_product("dental_cremer", "1", "resina filtek z350 xt a2", category="Outros > Geral"),
+            make_product("dental_cremer", "2", "luva de procedimento latex m"),
+        ]
+        blocked = MatchingEngine().match(products_a, products_b)
+        assert blocked.matches == []
+
+        result = MatchingEngine(ngram_top_k=5, instrument=True).match(products_a, products_b)
+        assert [m.product_b.external_id for m in result.matches] == ["1"]
+        assert result.stats["counters"]["ngram_candidates"] == 1
+
+    def test_clusters(self, make_product):
+        # Both sides have other products in their blocks, so neither falls
+        # back to the token lookup.
+        products = [
+            make_product("dental_speed", "1", "resina filtek z350 xt a2"),
+            make_product("dental_speed", "2", "sugador descartavel", category="Outros > Geral"),
+            make_product("dental_cremer", "1", "resina filtek z350 xt a2", category="Outros > Geral"),
+            make_product("dental_cremer", "2", "luva de procedimento latex m"),
+        ]
+        assert MatchingEngine().match_clusters(products).clusters == []
+
+        clusters = MatchingEngine(ngram_top_k=5).match_clusters(products).clusters
+        assert [sorted(p.uid for p in c.products) for c in clusters] == [
+            ["dental_cremer:1", "dental_speed:1"]
+        ]
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from dental_scraper.matching.service import MatchService, QueryError, make_server
+
+
+def record(supplier: str, external_id: str, name: str, price: float) -> dict:
+    return {
+        "supplier": supplier,
+        "external_id": external_id,
+        "name": name,
+        "normalized_name": name.lower(),
+        "normalized_brand": "3M",
+        "category": "Dentística > Resinas",
+        "unit": "unidade",
+        "price": price,
+        "in_stock": True,
+    }
+
+
+def write_export(path, records, mtime=None):
+    path.write_text(json.dumps(records), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def service(tmp_path):
+    write_export(tmp_path / "dental_speed_20260101_000000.json", [
+        record("Dental Speed", "1", "Resina Filtek Z350 XT A2", 100.0),
+        record("Dental Speed", "2", "Luva de Procedimento Latex M", 30.0),
+    ], mtime=1_000)
+    write_export(tmp_path / "dental_cremer_20260101_000000.json", [
+        record("Dental Cremer", "10", "Resina Filtek Z350 XT A2", 95.0),
+        record("Dental Cremer", "11", "Resina Opallis A3", 60.0),
+    ], mtime=1_000)
+    service = MatchService(tmp_path)
+    service.refresh()
+    return service
+
+
+class TestMatchService:
+    @pytest.mark.parametrize("supplier", ["dental_speed", "Dental Speed"])
+    def test_match_by_reference(self, service, supplier):
+        result = service.match({"supplier": supplier, "external_id": "1"})
+        # The product's own catalog is skipped.
+        assert list(result["matches"]) == ["Dental Cremer"]
+        best = result["matches"]["Dental Cremer"][0]
+        assert (best["external_id"], best["price"]) == ("10", 95.0)
+
+    def test_match_ad_hoc_product(self, service):
+        result = service.match({"name": "Resina Filtek Z350 XT A2", "brand": "3M"})
+        assert set(result["matches"]) == {"Dental Speed", "Dental Cremer"}
+
+        result = service.match({"supplier": "dental_speed", "name": "Resina Filtek Z350 XT A2"})
+        assert list(result["matches"]) == ["Dental Cremer"]
+
+    def test_unknown_reference(self, service):
+        with pytest.raises(QueryError):
+            service.match({"supplier": "dental_speed", "external_id": "404"})
+
+    @pytest.mark.parametrize("query", [
+        {"name": "Resina Filtek Z350", "quantity": "duas"},
+        {"name": "Resina Filtek Z350", "quantity": 0},
+        {"name": "Resina Filtek Z350", "price": "barato"},
+        {"name": "Resina Filtek Z350", "price": [100]},
+        {"name": ["Resina Filtek Z350"]},
+        {"supplier": ["dental_speed"], "external_id": "1"},
+    ])
+    def test_invalid_fields(self, service, query):
+        with pytest.raises(QueryError):
+            service.match(query)
+
+    def test_fields_are_coerced(self, service):
+        result = service.match(
+            {"name": "Resina Filtek Z350 XT A2", "brand": "3M", "quantity": "1", "price": "99.9"}
+        )
+        assert result["query"]["price"] == 99.9
+        assert result["matches"]["Dental Cremer"][0]["external_id"] == "10"
+
+    @pytest.mark.parametrize("limit", [0, -1, "many", None])
+    def test_invalid_limit(self, service, limit):
+        with pytest.raises(QueryError):
+            service.match({"supplier": "dental_speed", "external_id": "1"}, limit)
+
+    def test_batch_reports_errors_per_item(self, service):
+        results = service.match_batch([
+            {"supplier": "dental_speed", "external_id": "1"},
+            {"supplier": "dental_speed", "external_id": "404"},
+        ])
+        assert "matches" in results[0]
+        assert results[1] == {"error": "unknown product: Dental Speed:404"}
+
+    def test_incremental_refresh(self, service, tmp_path):
+        assert service.refresh() == {}
+
+        write_export(tmp_path / "dental_cremer_20260101_000000.json", [
+            record("Dental Cremer", "10", "Resina Filtek Z350 XT A2", 80.0),
+        ], mtime=2_000)
+        assert service.refresh() == {"dental_cremer": {"changed": 1, "removed": 1}}
+
+        result = service.match({"supplier": "dental_speed", "external_id": "1"})
+        assert [o["price"] for o in result["matches"]["Dental Cremer"]] == [80.0]
+        assert service.stats()["catalogs"] == {"Dental Speed": 2, "Dental Cremer": 1}
+
+    def test_refresh_swaps_in_a_new_catalog(self, service, tmp_path):
+        before = service.catalogs["Dental Cremer"]
+        write_export(tmp_path / "dental_cremer_20260101_000000.json", [
+            record("Dental Cremer", "10", "Resina Filtek Z350 XT A2", 80.0),
+            record("Dental Cremer", "11", "Resina Opallis A3", 60.0),
+        ], mtime=2_000)
+        service.refresh()
+
+        # Queries already holding the old catalog never see it half updated.
+        after = service.catalogs["Dental Cremer"]
+        assert after is not before
+        assert before.get("Dental Cremer:10").price_cents == 9500
+        assert after.get("Dental Cremer:10").price_cents == 8000
+        assert after.get("Dental Cremer:11") is before.get("Dental Cremer:11")
+        # Only the changed listing was reindexed.
+        assert after.by_token["opallis"] is before.by_token["opallis"]
+
+    def test_queries_score_without_the_lock(self, service, monkeypatch):
+        held = []
+
+        def probe():
+            if service._lock.acquire(timeout=1):
+                service._lock.release()
+                held.append(False)
+            else:
+                held.append(True)
+
+        score = service.engine.score
+
+        def score_and_probe(index, product):
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+            return score(index, product)
+
+        monkeypatch.setattr(service.engine, "score", score_and_probe)
+        service.match({"supplier": "dental_speed", "external_id": "1"})
+        assert held == [False]
+
+
+class TestHttp:
+    @pytest.fixture
+    def url(self, service):
+        server = make_server(service, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+
+    def post(self, url, payload):
+        request = urllib.request.Request(
+            url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def test_match_and_stats(self, url):
+        result = self.post(f"{url}/match", {"supplier": "dental_speed", "external_id": "1"})
+        assert result["matches"]["Dental Cremer"][0]["external_id"] == "10"
+
+        batch = self.post(f"{url}/match", {"products": [{"name": "Resina Opallis A3"}], "limit": 1})
+        assert len(batch["results"]) == 1
+
+        with urllib.request.urlopen(f"{url}/stats") as response:
+            stats = json.load(response)
+        assert stats["requests"] == 2
+        assert stats["latency_ms"]["p99"] is not None
+
+    def test_failed_refresh_is_a_json_error(self, url, tmp_path):
+        write_export(tmp_path / "dental_cremer_20260101_000000.json", [
+            {"supplier": 10, "external_id": "10", "name": "Resina Filtek Z350 XT A2"},
+        ], mtime=2_000)
+        with pytest.raises(urllib.error.HTTPError) as error:
+            self.post(f"{url}/refresh", {})
+        assert error.value.code == 500
+        assert "refresh failed" in json.load(error.value)["error"]
+
+    def test_bad_request(self, url):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            self.post(f"{url}/match", {"supplier": "dental_speed", "external_id": "404"})
+        assert error.value.code == 400
+
+    @pytest.mark.parametrize("payload", [
+        {"name": "Resina Filtek Z350", "quantity": "duas"},
+        {"supplier": "dental_speed", "external_id": "1", "limit": 0},
+    ])
+    def test_invalid_query_is_a_bad_request(self, url, payload):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            self.post(f"{url}/match", payload)
+        assert error.value.code == 400
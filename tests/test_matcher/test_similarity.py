@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from dental_scraper.matching.models import Product
+from dental_scraper.matching.similarity import fuzzy_match, fuzzy_match_batch
+
+WORDS = ["resina", "filtek", "z350", "a2", "a3", "xt", "luva", "latex", "nitrilo", "m", "p"]
+BRANDS = ["3M", "3m", "Dentsply", "FGM", ""]
+CATEGORIES = ["Consumíveis > Resinas", "Consumíveis > Luvas", "Outros > Geral", ""]
+UNITS = ["unidade", "Unidade", "caixa", ""]
+
+
+def random_product(rng: random.Random, supplier: str, external_id: str) -> Product:
+    name = " ".join(rng.sample(WORDS, rng.randint(0, 4)))
+    return Product.from_dict({
+        "supplier": supplier,
+        "external_id": external_id,
+        "name": name,
+        "normalized_name": name,
+        "normalized_brand": rng.choice(BRANDS),
+        "category": rng.choice(CATEGORIES),
+        "quantity": rng.choice([1, 1, 2, 10, 100, 0, None]),
+        "unit": rng.choice(UNITS),
+    })
+
+
+@pytest.fixture
+def catalogs():
+    rng = random.Random(42)
+    products_a = [random_product(rng, "dental_speed", str(i)) for i in range(120)]
+    products_b = [random_product(rng, "dental_cremer", str(i)) for i in range(150)]
+    return products_a, products_b
+
+
+class TestFuzzyMatchBatch:
+    def test_same_confidences_as_scalar(self, catalogs):
+        products_a, products_b = catalogs
+        confidences = fuzzy_match_batch(products_a, products_b)
+
+        for i, product_a in enumerate(products_a):
+            for j, product_b in enumerate(products_b):
+                result = fuzzy_match(product_a, product_b)
+                assert confidences[i, j] == (result.confidence if result else 0.0)
+
+    def test_custom_thresholds(self, catalogs):
+        products_a, products_b = catalogs
+        confidences = fuzzy_match_batch(
+            products_a, products_b, threshold=0.5, min_name_similarity=0.0
+        )
+
+        for i, product_a in enumerate(products_a):
+            for j, product_b in enumerate(products_b):
+                result = fuzzy_match(product_a, product_b, 0.5, 0.0)
+                assert confidences[i, j] == (result.confidence if result else 0.0)
+
+    def test_empty_block(self, catalogs):
+        products_a, _ = catalogs
+        assert fuzzy_match_batch(products_a, []).shape == (len(products_a), 0)
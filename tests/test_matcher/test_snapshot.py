@@ -0,0 +1,62 @@
+import pytest
+
+from dental_scraper.matching.loader import iter_products
+from dental_scraper.matching.models import Product
+from dental_scraper.matching.snapshot import CatalogSnapshot, SnapshotWriter
+
+
+@pytest.fixture
+def products(make_product):
+    # Every field set, so the round trip covers all the columns.
+    listed = {"brand": "3M", "quantity": 1, "pix_price": 95.0}
+    return [
+        make_product(external_id="1", ean="7891234567895", **listed),
+        make_product(external_id="2", quantity=None, price=None, in_stock=False),
+        make_product(
+            external_id="10",
+            external_url="https://www.dentalspeed.com/10",
+            name="Luva de Látex",
+            manufacturer_code="LX-10",
+            **listed,
+        ),
+    ]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, products):
+    path = tmp_path / "dental_speed_20260101_000000.dcat"
+    with SnapshotWriter(path) as writer:
+        for product in products:
+            writer.add(product)
+    return path
+
+
+class TestSnapshot:
+    def test_round_trip(self, snapshot_path, products):
+        assert Product.from_snapshot(snapshot_path) == products
+
+    def test_get_by_external_id(self, snapshot_path, products):
+        with CatalogSnapshot(snapshot_path) as snapshot:
+            assert len(snapshot) == 3
+            assert snapshot.get("10") == products[2]
+            assert snapshot.get("3") is None
+
+    def test_repeated_id_overwrites_row(self, tmp_path, products, make_product):
+        path = tmp_path / "catalog.dcat"
+        with SnapshotWriter(path) as writer:
+            for product in products:
+                writer.add(product)
+            writer.add(make_product(external_id="1", price=150.0))
+
+        restored = Product.from_snapshot(path)
+        assert [p.external_id for p in restored] == ["1", "2", "10"]
+        assert restored[0].price_cents == 15000
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "catalog.dcat"
+        path.write_bytes(b"[]" + bytes(64))
+        with pytest.raises(ValueError):
+            CatalogSnapshot(path)
+
+    def test_loader_reads_snapshots(self, snapshot_path, products):
+        assert list(iter_products(snapshot_path)) == products
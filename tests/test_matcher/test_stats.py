@@ -0,0 +1,35 @@
+import pytest
+
+from dental_scraper.matching.models import Product
+from dental_scraper.matching.similarity import fuzzy_match
+from dental_scraper.matching.stats import MatchStats
+
+
+class TestMatchStats:
+    def test_histogram_buckets(self):
+        stats = MatchStats()
+        for n in (0, 1, 3, 4, 20, 150):
+            stats.record_candidates(n)
+        assert stats.to_dict()["candidates_per_query"] == {
+            "0": 1, "1": 1, "2-4": 2, "20-49": 1, "100+": 1,
+        }
+
+    def test_merge(self):
+        a, b = MatchStats(), MatchStats()
+        a.count("fuzzy_pairs", 2)
+        b.count("fuzzy_pairs", 3)
+        b.add_time("score", 0.5)
+        a.merge(b)
+        assert a.counters == {"fuzzy_pairs": 5}
+        assert a.timings == {"score": 0.5}
+
+    @pytest.mark.parametrize(
+        "name, counter",
+        [("resina filtek z350 a2 seringa", "pruned_pairs"), ("adesivo single bond", "min_name_rejects")],
+    )
+    def test_high_cutoff_keeps_name_rejects_apart(self, name, counter):
+        a = Product.from_dict({"supplier": "dental_speed", "normalized_name": "resina filtek z350 xt a2"})
+        b = Product.from_dict({"supplier": "dental_cremer", "normalized_name": name})
+        stats = MatchStats()
+        assert fuzzy_match(a, b, stats=stats, score_cutoff=0.97) is None
+        assert stats.counters == {counter: 1}
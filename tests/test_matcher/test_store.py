@@ -0,0 +1,234 @@
+from dataclasses import replace
+
+import pytest
+
+from benchmarks.catalog import make_catalogs
+from dental_scraper.matching.engine import MatchingEngine
+from dental_scraper.matching.store import MatchStore, fingerprint
+
+
+@pytest.fixture
+def catalogs(make_product):
+    products_a = [
+        make_product("dental_speed", "1", "resina filtek z350 xt a2"),
+        make_product("dental_speed", "2", "resina filtek z250 a3"),
+        make_product("dental_speed", "3", "adesivo single bond"),
+    ]
+    products_b = [
+        make_product("dental_cremer", "1", "resina filtek z350 xt a2 4g"),
+        make_product("dental_cremer", "2", "resina filtek z250 a3 4g"),
+        make_product("dental_cremer", "3", "adesivo single bond universal"),
+    ]
+    return products_a, products_b
+
+
+def pairs(result):
+    return sorted((m.product_a.uid, m.product_b.uid, m.confidence) for m in result.matches)
+
+
+class TestFingerprint:
+    def test_ignores_price(self, make_product):
+        a = make_product("dental_speed", "1", "resina", price=10.0)
+        b = make_product("dental_speed", "1", "resina", price=20.0)
+        assert fingerprint(a) == fingerprint(b)
+
+    def test_tracks_matching_fields(self, make_product):
+        a = make_product("dental_speed", "1", "resina")
+        b = make_product("dental_speed", "1", "resina", ean="7891234567895")
+        assert fingerprint(a) != fingerprint(b)
+
+
+class TestMatchIncremental:
+    def test_first_run_matches_full_run(self, tmp_path, catalogs):
+        engine = MatchingEngine()
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            result = engine.match_incremental(*catalogs, store)
+
+        assert pairs(result) == pairs(engine.match(*catalogs))
+        assert result.stats["rescored_a"] == 3
+        assert result.stats["cached_edges"] == 0
+
+    def test_unchanged_run_rescores_nothing(self, tmp_path, catalogs):
+        engine = MatchingEngine()
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            first = engine.match_incremental(*catalogs, store)
+            second = engine.match_incremental(*catalogs, store)
+
+        assert pairs(second) == pairs(first)
+        assert second.stats["rescored_a"] == 0
+        assert second.stats["rescored_pairs"] == 0
+        assert second.stats["carried_matches"] == len(first.matches)
+
+    def test_only_changed_products_are_rescored(self, tmp_path, catalogs, make_product):
+        products_a, products_b = catalogs
+        engine = MatchingEngine()
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            engine.match_incremental(products_a, products_b, store)
+
+            products_b = products_b[:2] + [
+                make_product("dental_cremer", "4", "resina filtek z350 xt a2"),
+            ]
+            result = engine.match_incremental(products_a, products_b, store)
+
+        # The new product joins every block it shares; only those pairs are scored.
+        assert result.stats["rescored_a"] == 0
+        assert result.stats["rescored_pairs"] == 3
+        assert result.stats["changed_b"] == 1
+        assert result.stats["removed"] == 1
+        uids = {(m.product_a.uid, m.product_b.uid) for m in result.matches}
+        assert ("dental_speed:1", "dental_cremer:1") in uids
+        assert all(uid_b != "dental_cremer:3" for _, uid_b in uids)
+
+    def test_changes_in_b_only_reach_products_sharing_their_keys(
+        self, tmp_path, catalogs, make_product
+    ):
+        gloves = {"normalized_brand": "Descarpack", "category": "Descartáveis > Luvas"}
+        products_a = catalogs[0] + [make_product("dental_speed", "4", "luva latex", **gloves)]
+        products_b = catalogs[1] + [
+            make_product("dental_cremer", "4", "luva latex", **gloves),
+            make_product("dental_cremer", "5", "luva vinil", **gloves),
+        ]
+        engine = MatchingEngine()
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            engine.match_incremental(products_a, products_b, store)
+
+            products_b[3] = make_product("dental_cremer", "4", "luva latex nitrilica", **gloves)
+            result = engine.match_incremental(products_a, products_b, store)
+
+        assert result.stats["checked_a"] == 1
+        assert result.stats["rescored_a"] == 0
+        assert result.stats["rescored_pairs"] == 1
+        assert pairs(result) == pairs(engine.match(products_a, products_b))
+
+    def test_streamed_matches_are_stored(self, tmp_path, catalogs):
+        engine = MatchingEngine()
+        streamed = []
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            first = engine.match_incremental(*catalogs, store, sink=streamed.append)
+            second = engine.match_incremental(*catalogs, store)
+
+        assert first.matches == []
+        assert sorted((m.product_a.uid, m.product_b.uid) for m in streamed) == [
+            (uid_a, uid_b) for uid_a, uid_b, _ in pairs(second)
+        ]
+        assert second.stats["carried_matches"] == len(streamed)
+
+    def test_config_change_resets_store(self, tmp_path, catalogs):
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            MatchingEngine().match_incremental(*catalogs, store)
+            result = MatchingEngine(fuzzy_top_k=5).match_incremental(*catalogs, store)
+
+        assert result.stats["rescored_a"] == 3
+
+    def test_swapped_suppliers_reset_store(self, tmp_path, catalogs):
+        products_a, products_b = catalogs
+        engine = MatchingEngine()
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            engine.match_incremental(products_a, products_b, store)
+            swapped = engine.match_incremental(products_b, products_a, store)
+            again = engine.match_incremental(products_b, products_a, store)
+
+        assert pairs(swapped) == pairs(engine.match(products_b, products_a))
+        assert swapped.stats["rescored_a"] == 3
+        assert pairs(again) == pairs(swapped)
+
+
+class TestReuseEdges:
+    def fresh_edges(self, engine, products_a, products_b):
+        index_b = engine.build_index(products_b)
+        scored = engine._score_products(index_b, products_a)
+        return {
+            (product_a.uid, product_b.uid): match
+            for product_a, candidates in zip(products_a, scored)
+            for product_b, match in candidates
+        }
+
+    def test_nothing_reusable_resolves_as_full_run(self, tmp_path, catalogs):
+        products_a, products_b = catalogs
+        engine = MatchingEngine()
+        fresh = self.fresh_edges(engine, products_a, products_b)
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            edges, carried = engine._reuse_edges(
+                store,
+                fresh,
+                {p.uid for p in products_a},
+                set(),
+                engine.build_index(products_a),
+                engine.build_index(products_b),
+            )
+
+        assert edges == fresh
+        assert carried == set()
+        by_uid = {p.uid: p for p in products_b}
+        scored = [
+            [(by_uid[uid_b], m) for (uid_a, uid_b), m in sorted(edges.items()) if uid_a == p.uid]
+            for p in products_a
+        ]
+        result = engine._resolve(products_a, products_b, scored, carried)
+        assert pairs(result) == pairs(engine.match(products_a, products_b))
+
+    def test_unchanged_products_keep_their_edges(self, tmp_path, catalogs):
+        products_a, products_b = catalogs
+        engine = MatchingEngine()
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            first = engine.match_incremental(products_a, products_b, store)
+            stored = {(uid_a, uid_b) for uid_a, uid_b, _ in store.edges()}
+            edges, carried = engine._reuse_edges(
+                store,
+                {},
+                set(),
+                {"dental_cremer:3"},
+                engine.build_index(products_a),
+                engine.build_index(products_b),
+            )
+
+        assert edges.keys() == {pair for pair in stored if pair[1] != "dental_cremer:3"}
+        assert carried == {
+            (m.product_a.uid, m.product_b.uid)
+            for m in first.matches
+            if m.product_b.uid != "dental_cremer:3"
+        }
+
+
+@pytest.fixture(scope="module")
+def synthetic_catalogs():
+    products_a, products_b = make_catalogs(4000, seed=5).values()
+    return products_a, products_b
+
+
+@pytest.fixture(scope="module")
+def next_day(synthetic_catalogs):
+    products_a, products_b = synthetic_catalogs
+    changed = [replace(p, normalized_name=p.normalized_name + " refil") for p in products_b[::15]]
+    unbranded = [replace(p, normalized_brand="") for p in products_b[7::40]]
+    added = [replace(p, external_id=f"new-{p.external_id}") for p in products_b[3::60]]
+    replaced = {p.uid: p for p in changed + unbranded}
+    kept = [replaced.get(p.uid, p) for i, p in enumerate(products_b) if i % 25 != 11]
+    return products_a[5:], kept + added
+
+
+class TestMatchIncrementalCatalog:
+    def edges(self, store):
+        return sorted((uid_a, uid_b, m.confidence) for uid_a, uid_b, m in store.edges())
+
+    def test_first_run_matches_full_run(self, tmp_path, synthetic_catalogs):
+        engine = MatchingEngine()
+        with MatchStore(tmp_path / "store.sqlite") as store:
+            result = engine.match_incremental(*synthetic_catalogs, store)
+
+        assert pairs(result) == pairs(engine.match(*synthetic_catalogs))
+
+    def test_changed_catalog_keeps_full_run_edges(self, tmp_path, synthetic_catalogs, next_day):
+        engine = MatchingEngine(ngram_top_k=5)
+        with MatchStore(tmp_path / "store.sqlite") as store, MatchStore(
+            tmp_path / "fresh.sqlite"
+        ) as fresh:
+            engine.match_incremental(*synthetic_catalogs, store)
+            result = engine.match_incremental(*next_day, store)
+            engine.match_incremental(*next_day, fresh)
+
+            assert self.edges(store) == self.edges(fresh)
+            assert result.stats["rescored_a"] < len(next_day[0])
+
+            again = engine.match_incremental(*next_day, store)
+            assert pairs(again) == pairs(result)
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from dental_scraper.matching.engine import MatchingEngine
+from dental_scraper.matching.models import MatchResult, ProductMatch
+from dental_scraper.matching.runner import MatchSummary
+from dental_scraper.matching.writer import ResultWriter
+
+
+@pytest.fixture
+def result(make_product):
+    matches = [
+        ProductMatch(
+            make_product("dental_speed", str(i), price=100.0 + i),
+            make_product("dental_cremer", str(i), price=99.0),
+            confidence=0.9,
+            method="fuzzy",
+        )
+        for i in range(3)
+    ]
+    return MatchResult(matches=matches, unmatched_a=[], unmatched_b=[])
+
+
+def write(path, result):
+    with ResultWriter(path, "matches", {"generated_at": "2026-01-01T00:00:00"}) as writer:
+        for match in result.matches:
+            writer.add(match.to_dict())
+        writer.stats = result.stats
+
+
+class TestResultWriter:
+    def test_json(self, tmp_path, result):
+        path = tmp_path / "matches.json"
+        write(path, result)
+
+        data = json.loads(path.read_text(encoding="utf-8"))
+        assert data == {**result.to_dict(), "generated_at": "2026-01-01T00:00:00"}
+        # The stats block is only known at the end and is written last.
+        assert list(data)[-1] == "stats"
+
+    def test_json_lines(self, tmp_path, result):
+        path = tmp_path / "matches.jsonl"
+        write(path, result)
+
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        assert lines[:-1] == result.to_dict()["matches"]
+        assert lines[-1] == {"generated_at": "2026-01-01T00:00:00", "stats": result.stats}
+
+    def test_empty(self, tmp_path):
+        path = tmp_path / "matches.json"
+        with ResultWriter(path, "matches") as writer:
+            writer.stats = {"total_matches": 0}
+        assert json.loads(path.read_text()) == {"matches": [], "stats": {"total_matches": 0}}
+
+    def test_failed_run_leaves_previous_output(self, tmp_path, result):
+        path = tmp_path / "matches.json"
+        path.write_text("previous")
+        with pytest.raises(RuntimeError):
+            with ResultWriter(path, "matches") as writer:
+                writer.add(result.matches[0].to_dict())
+                raise RuntimeError
+        assert path.read_text() == "previous"
+        assert list(tmp_path.iterdir()) == [path]
+
+
+@pytest.fixture
+def catalogs(make_product):
+    products_a = [
+        make_product("dental_speed", "1", "resina filtek z350 xt a2", price=120.0),
+        make_product("dental_speed", "2", "resina filtek z250 a3", price=80.0),
+        make_product("dental_speed", "3", "adesivo single bond", ean="7891234567895"),
+    ]
+    products_b = [
+        make_product("dental_cremer", "1", "resina filtek z350 xt a2 4g", price=100.0),
+        make_product("dental_cremer", "2", "resina filtek z250 a3 4g", price=90.0),
+        make_product("dental_cremer", "3", "adesivo", ean="7891234567895"),
+    ]
+    return products_a, products_b
+
+
+class TestStreamedMatches:
+    @pytest.mark.parametrize("assignment", ["global", "greedy"])
+    def test_sink_gets_every_match(self, catalogs, assignment):
+        engine = MatchingEngine(assignment=assignment)
+        collected = engine.match(*catalogs)
+        streamed = []
+        result = engine.match(*catalogs, sink=streamed.append)
+
+        assert result.matches == []
+        key = lambda m: (m.product_a.uid, m.product_b.uid, m.confidence)  # noqa: E731
+        assert sorted(map(key, streamed)) == sorted(map(key, collected.matches))
+        assert result.stats["total_matches"] == collected.stats["total_matches"] == 3
+        assert result.stats["by_method"] == collected.stats["by_method"]
+        assert result.unmatched_a == collected.unmatched_a
+
+    def test_summary(self, catalogs):
+        summary = MatchSummary(top=2)
+        MatchingEngine().match(*catalogs, sink=summary.add)
+        collected = MatchingEngine().match(*catalogs)
+
+        assert summary.seen == 3
+        pairs = [(m.product_a.uid, m.product_b.uid) for m in summary.top_matches()]
+        assert pairs == [(m.product_a.uid, m.product_b.uid) for m in collected.matches[:2]]
+        assert summary.cheaper_count == {"dental_speed": 1, "dental_cremer": 1}
+        assert summary.total_savings == {"dental_speed": 10.0, "dental_cremer": 20.0}
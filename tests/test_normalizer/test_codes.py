@@ -0,0 +1,39 @@
+import pytest
+
+from dental_scraper.normalization.codes import gtin_check_digit, normalize_anvisa, normalize_gtin
+
+
+class TestNormalizeGtin:
+    def test_check_digit(self):
+        assert gtin_check_digit("789123456789") == 5
+        assert gtin_check_digit("03600029145") == 2
+
+    @pytest.mark.parametrize(
+        "value",
+        ["7891234567895", "789 1234 567895", "789-1234-567895", "07891234567895"],
+    )
+    def test_spellings_of_one_code(self, value):
+        assert normalize_gtin(value) == "07891234567895"
+
+    def test_lengths_share_one_form(self):
+        # UPC-A, its EAN-13 form and its GTIN-14 form are the same code.
+        assert normalize_gtin("036000291452") == "00036000291452"
+        assert normalize_gtin("0036000291452") == "00036000291452"
+        assert normalize_gtin("96385074") == "00000096385074"
+
+    @pytest.mark.parametrize(
+        "value", [None, "", "7891234567890", "1234567", "123456789012345", "00000000", "n/a"]
+    )
+    def test_invalid(self, value):
+        assert normalize_gtin(value) is None
+
+
+class TestNormalizeAnvisa:
+    def test_formats(self):
+        assert normalize_anvisa("80145110155") == "80145110155"
+        assert normalize_anvisa("8.0145.1101.55") == "80145110155"
+        assert normalize_anvisa("1.0497.1384.001-1") == "1049713840011"
+
+    @pytest.mark.parametrize("value", [None, "", "Isento", "Dispensado de registro", "12345"])
+    def test_invalid(self, value):
+        assert normalize_anvisa(value) is None
@@ -0,0 +1,62 @@
+import csv
+import json
+import logging
+
+from dental_scraper.matching.manifest import ExportManifest
+from dental_scraper.pipelines.exporter import CsvExporterPipeline
+
+
+class FakeSpider:
+    name = "dental_speed"
+
+    def __init__(self, output_dir):
+        self.settings = {"OUTPUT_DIR": str(output_dir)}
+        self.logger = logging.getLogger(self.name)
+
+
+def test_csv_nested_fields_are_json(tmp_path):
+    spider = FakeSpider(tmp_path)
+    pipeline = CsvExporterPipeline()
+    pipeline.spider_opened(spider)
+    pipeline.process_item({
+        "external_id": "1",
+        "ean": None,
+        "invalid_codes": {"ean": "7891234567890", "anvisa_registration": "Isento"},
+        "pdf_urls": ["https://example.com/bula.pdf"],
+    }, spider)
+    pipeline.spider_closed(spider)
+
+    [path] = tmp_path.glob("*.csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        [row] = csv.DictReader(f)
+    assert json.loads(row["invalid_codes"]) == {
+        "ean": "7891234567890",
+        "anvisa_registration": "Isento",
+    }
+    assert json.loads(row["pdf_urls"]) == ["https://example.com/bula.pdf"]
+    assert row["external_id"] == "1"
+
+
+def test_csv_is_renamed_into_place_and_recorded(tmp_path):
+    spider = FakeSpider(tmp_path)
+    pipeline = CsvExporterPipeline()
+    pipeline.spider_opened(spider)
+    pipeline.process_item({"external_id": "1"}, spider)
+    pipeline.process_item({"external_id": "2"}, spider)
+    assert list(tmp_path.glob("*.csv")) == []
+    pipeline.spider_closed(spider)
+
+    [path] = tmp_path.glob("*.csv")
+    [entry] = ExportManifest(tmp_path).load()["dental_speed"]
+    assert (entry.file, entry.items) == (path.name, 2)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_csv_of_unfinished_crawl_is_discarded(tmp_path):
+    spider = FakeSpider(tmp_path)
+    pipeline = CsvExporterPipeline()
+    pipeline.spider_opened(spider)
+    pipeline.process_item({"external_id": "1"}, spider)
+    pipeline.spider_closed(spider, reason="shutdown")
+
+    assert list(tmp_path.iterdir()) == []
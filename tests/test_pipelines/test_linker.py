@@ -0,0 +1,87 @@
+import pytest
+from rapidfuzz import fuzz
+
+from dental_scraper.pipelines import linker
+from dental_scraper.pipelines.linker import MAX_CANDIDATES, MasterIndex
+
+MASTERS = {
+    1: "resina filtek z350 xt a2 4g",
+    2: "resina filtek z350 xt a3 4g",
+    3: "luva de procedimento latex m 100un",
+    4: "anestesico lidocaina 2 c epinefrina 50un",
+}
+
+
+def build(threshold):
+    index = MasterIndex(threshold)
+    for product_id, name in MASTERS.items():
+        index.add(product_id, name)
+    return index
+
+
+def linear_scan(name, threshold):
+    # The scan the index replaces.
+    best_id, best_score = None, 0
+    for product_id, product_name in MASTERS.items():
+        score = fuzz.ratio(name, product_name)
+        if score > best_score and score >= threshold:
+            best_id, best_score = product_id, score
+    return best_id
+
+
+class TestMasterIndex:
+    def test_exact(self):
+        index = build(100)
+        assert index.find("resina filtek z350 xt a3 4g") == 2
+        assert index.find("resina filtek z350 xt a3 4 g") is None
+
+    @pytest.mark.parametrize(
+        "name",
+        [
+            "resina filtek z350 xt a2 4g",
+            "resina filtek z350xt a2 4g",
+            "luva procedimento latex m 100un",
+            "anestesico lidocaina 2 epinefrina 50un",
+            "broca diamantada 1012 fg",
+        ],
+    )
+    @pytest.mark.parametrize("threshold", [85, 90, 95])
+    def test_fuzzy_agrees_with_linear_scan(self, name, threshold):
+        assert build(threshold).find(name) == linear_scan(name, threshold)
+
+    def test_remove(self):
+        index = build(90)
+        index.remove(1)
+        assert index.find("resina filtek z350 xt a2 4g") == 2
+        assert 1 not in index
+        assert len(index) == 3
+
+    def test_remove_keeps_other_masters_with_the_same_name(self):
+        index = MasterIndex(100)
+        index.add(5, "resina filtek z350 xt a2 4g")
+        index.add(9, "resina filtek z350 xt a2 4g")
+        assert index.find("resina filtek z350 xt a2 4g") == 5
+
+        index.remove(5)
+        assert index.find("resina filtek z350 xt a2 4g") == 9
+        index.remove(9)
+        assert index.find("resina filtek z350 xt a2 4g") is None
+        assert not index.by_name
+
+    def test_oversized_block_is_not_scored(self, monkeypatch):
+        index = MasterIndex(85)
+        for product_id in range(MAX_CANDIDATES + 100):
+            index.add(product_id, f"resina {product_id:03d}")
+
+        scored = []
+        extract_one = linker.process.extractOne
+
+        def spy(query, choices, **kwargs):
+            scored.append(len(choices))
+            return extract_one(query, choices, **kwargs)
+
+        monkeypatch.setattr(linker.process, "extractOne", spy)
+        # Only "resina" is indexed, and it is shared by every master.
+        assert index.find("resina 0001") is None
+        assert index.find("resina 001") == 1
+        assert all(size <= MAX_CANDIDATES for size in scored)
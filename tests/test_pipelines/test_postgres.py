@@ -0,0 +1,474 @@
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+from decimal import Decimal
+from itertools import count
+
+import psycopg2
+import pytest
+from psycopg2.extensions import parse_dsn
+
+from dental_scraper.pipelines import postgres
+from dental_scraper.pipelines.postgres import (
+    BATCH_UPSERT_SQL,
+    CREATE_STAGING_SQL,
+    PostgresPipeline,
+    copy_value,
+)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.connection = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, params=None):
+        self.conn.gate.wait()
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+        self.conn.statements.append(sql)
+        if sql == BATCH_UPSERT_SQL:
+            if self.conn.fail_batches:
+                self.conn.fail_batches -= 1
+                raise ValueError("invalid input syntax for type numeric")
+            self.result = [
+                (next(self.conn.ids), row[1], None)
+                for row in self.conn.copied
+                if row[1] not in self.conn.unchanged
+            ]
+        elif "FROM suppliers" in sql:
+            self.result = [(7,)]
+        elif "SELECT external_id, id, current_price" in sql:
+            self.result = self.conn.state_rows
+        elif "FROM products" in sql:
+            self.result = self.conn.master_rows
+        elif "INSERT INTO supplier_products" in sql:
+            if params[1] == "bad":
+                raise ValueError("invalid input syntax for type numeric")
+            self.result = [] if params[1] in self.conn.unchanged else [(next(self.conn.ids), None)]
+        elif "RETURNING id" in sql:
+            self.result = [(next(self.conn.ids),)]
+
+    def copy_expert(self, sql, file):
+        self.conn.copied = [line.split("\t") for line in file.read().splitlines()]
+
+    def mogrify(self, template, args):
+        return repr(args).encode()
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def __iter__(self):
+        return iter(self.result)
+
+
+class FakeConnection:
+    encoding = "UTF8"
+
+    def __init__(self):
+        self.statements = []
+        self.copied = []
+        self.commits = 0
+        self.fail_batches = 0
+        self.ids = count(1)
+        self.state_rows = []
+        self.master_rows = []
+        self.unchanged = set()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def history_inserts(self):
+        return sum("INSERT INTO price_histories" in sql for sql in self.statements)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSpider:
+    name = "dental_speed"
+    logger = logging.getLogger("dental_speed")
+
+
+def item(external_id: str, price: float = 100.0) -> dict:
+    return {
+        "external_id": external_id,
+        "name": f"Resina Filtek Z350 {external_id}",
+        "normalized_name": f"resina filtek z350 {external_id}",
+        "price": price,
+        "in_stock": True,
+    }
+
+
+class FakeReactor:
+    # Collects what the writer thread hands back so the test thread can run
+    # it, as the reactor thread would.
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def callFromThread(self, f, *args, **kwargs):
+        self.calls.put((f, args, kwargs))
+
+    def run_until(self, condition):
+        while not condition():
+            f, args, kwargs = self.calls.get(timeout=5)
+            f(*args, **kwargs)
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = PostgresPipeline(db_config={}, batch_size=3, flush_interval=0, write_queue_size=0)
+    pipeline.conn = FakeConnection()
+    return pipeline
+
+
+def test_copy_value():
+    assert copy_value(None) == r"\N"
+    assert copy_value(True) == "t"
+    assert copy_value(12.5) == "12.5"
+    assert copy_value("a\tb\nc\\d") == r"a\tb\nc\\d"
+
+
+def test_import_does_not_install_a_reactor():
+    # Scrapy installs the asyncio reactor after loading the project; one
+    # installed by an import before then would make the crawl fail.
+    code = (
+        "import sys, dental_scraper.pipelines.postgres; "
+        "print('twisted.internet.reactor' in sys.modules)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    assert output.strip() == "False"
+
+
+class TestBatchedWrites:
+    def test_items_are_buffered_until_batch_is_full(self, pipeline):
+        spider = FakeSpider()
+        pipeline.process_item(item("1"), spider)
+        pipeline.process_item(item("2", 90.0), spider)
+        pipeline.process_item(item("1", 95.0), spider)
+        assert pipeline.conn.statements == []
+
+        pipeline.process_item(item("3"), spider)
+        assert BATCH_UPSERT_SQL in pipeline.conn.statements
+        assert pipeline.conn.commits == 1
+        # A repeated product is written once, with its latest data.
+        assert [(row[1], row[15]) for row in pipeline.conn.copied] == [
+            ("2", "90.0"),
+            ("1", "95.0"),
+            ("3", "100.0"),
+        ]
+
+    def test_close_flushes_remainder(self, pipeline):
+        spider = FakeSpider()
+        pipeline.process_item(item("1"), spider)
+        pipeline.close_spider(spider)
+        assert [row[1] for row in pipeline.conn.copied] == ["1"]
+
+    def test_failed_batch_is_retried_item_by_item(self, pipeline):
+        spider = FakeSpider()
+        pipeline.conn.fail_batches = 1
+        for external_id in ("1", "bad", "3"):
+            pipeline.process_item(item(external_id), spider)
+
+        # Only the bad row is lost; the others commit on their own.
+        assert pipeline.conn.commits == 2
+        assert pipeline.buffer == {}
+
+
+class TestOpenSpider:
+    def test_caches_load_on_writer_thread(self, pipeline, monkeypatch):
+        conn, pipeline.conn = pipeline.conn, None
+        conn.master_rows = [(1, "resina filtek z350 xt a2")]
+        conn.state_rows = [("1", 10, Decimal("100.00"))]
+        monkeypatch.setattr(postgres.psycopg2, "connect", lambda **kwargs: conn)
+        pipeline.db_config = {"dbname": "dental"}
+        pipeline.write_queue_size = 1
+        pipeline.reactor = FakeReactor()
+
+        conn.gate.clear()
+        opened = pipeline.open_spider(FakeSpider())
+        assert not opened.called
+
+        conn.gate.set()
+        pipeline.reactor.run_until(lambda: opened.called)
+        assert 1 in pipeline.masters
+        assert pipeline.supplier_state == {"1": (10, 100.0)}
+        assert CREATE_STAGING_SQL in conn.statements
+        pipeline.writer.stop()
+
+    def test_failed_open_stops_writer(self, pipeline, monkeypatch):
+        def connect(**kwargs):
+            raise ValueError("could not connect to server")
+
+        monkeypatch.setattr(postgres.psycopg2, "connect", connect)
+        pipeline.write_queue_size = 1
+        pipeline.reactor = FakeReactor()
+
+        opened = pipeline.open_spider(FakeSpider())
+        pipeline.reactor.run_until(lambda: opened.called)
+        assert pipeline.writer is None
+        with pytest.raises(ValueError):
+            opened.result.raiseException()
+        opened.addErrback(lambda _: None)
+
+
+class TestSupplierState:
+    @pytest.fixture
+    def pipeline(self, pipeline):
+        pipeline.batch_size = 1
+        pipeline.conn.state_rows = [("1", 10, Decimal("100.00")), ("2", 11, None)]
+        pipeline._load_supplier_state(FakeSpider())
+        return pipeline
+
+    def test_loaded_at_open(self, pipeline):
+        assert pipeline.supplier_state == {"1": (10, 100.0), "2": (11, None)}
+
+    def test_price_changes_are_detected_locally(self, pipeline):
+        spider = FakeSpider()
+        pipeline.process_item(item("1", 100.0), spider)
+        assert pipeline.conn.history_inserts() == 0
+
+        pipeline.process_item(item("1", 90.0), spider)
+        pipeline.process_item(item("2", 50.0), spider)
+        assert pipeline.conn.history_inserts() == 2
+        assert pipeline.supplier_state["1"][1] == 90.0
+        assert not any("WHERE supplier_id = %s AND external_id" in sql for sql in pipeline.conn.statements)
+
+    def test_batches_carry_the_change_flag(self, pipeline):
+        spider = FakeSpider()
+        pipeline.batch_size = 2
+        pipeline.process_item(item("1", 100.0), spider)
+        pipeline.process_item(item("3", 100.0), spider)
+        assert [(row[1], row[-1]) for row in pipeline.conn.copied] == [("1", "f"), ("3", "t")]
+        assert pipeline.supplier_state["3"][1] == 100.0
+
+
+class TestUnchangedRows:
+    @pytest.fixture
+    def pipeline(self, pipeline):
+        pipeline.conn.state_rows = [("1", 10, Decimal("100.00"))]
+        pipeline.conn.unchanged = {"1"}
+        pipeline._load_supplier_state(FakeSpider())
+        return pipeline
+
+    def masters_created(self, pipeline):
+        return sum("INSERT INTO products" in sql for sql in pipeline.conn.statements)
+
+    def test_only_last_scraped_at_is_bumped(self, pipeline):
+        spider = FakeSpider()
+        pipeline.batch_size = 1
+        pipeline.process_item(item("1", 100.0), spider)
+
+        assert pipeline.conn.history_inserts() == 0
+        assert self.masters_created(pipeline) == 0
+        # Unbatched, each unchanged row is confirmed on its own.
+        assert pipeline.conn.statements[-1].startswith("UPDATE supplier_products SET last_scraped_at")
+        assert pipeline.touched == []
+
+    def test_batches_link_only_written_rows(self, pipeline):
+        spider = FakeSpider()
+        pipeline.batch_size = 2
+        pipeline.process_item(item("1", 100.0), spider)
+        pipeline.process_item(item("3", 100.0), spider)
+
+        assert self.masters_created(pipeline) == 1
+        # Bumps wait for a batch worth of unchanged rows, or the close.
+        assert pipeline.touched == [10]
+
+        pipeline.close_spider(spider)
+        assert pipeline.conn.statements[-1].startswith("UPDATE supplier_products SET last_scraped_at")
+        assert pipeline.touched == []
+
+
+class TestWriterThread:
+    @pytest.fixture
+    def pipeline(self, pipeline):
+        pipeline.batch_size = 1
+        pipeline.write_queue_size = 1
+        pipeline.reactor = FakeReactor()
+        pipeline._start_writer()
+        yield pipeline
+        if pipeline.writer.started:
+            pipeline.writer.stop()
+
+    def test_backpressure_when_queue_is_full(self, pipeline):
+        spider = FakeSpider()
+        pipeline.conn.gate.clear()
+
+        assert pipeline.process_item(item("1"), spider) == item("1")
+        accepted = pipeline.process_item(item("2"), spider)
+        assert not accepted.called
+
+        pipeline.conn.gate.set()
+        pipeline.reactor.run_until(lambda: accepted.called)
+        assert accepted.result == item("2")
+
+    def test_close_waits_for_queued_writes(self, pipeline):
+        spider = FakeSpider()
+        pipeline.conn.gate.clear()
+        pipeline.process_item(item("1"), spider)
+
+        closed = pipeline.close_spider(spider)
+        assert not closed.called
+
+        pipeline.conn.gate.set()
+        pipeline.reactor.run_until(lambda: closed.called)
+        assert pipeline.conn.commits == 1
+        assert not pipeline.writer.started
+
+
+# The tables as the app that owns the database defines them, reduced to the
+# columns and constraints the pipeline relies on.
+SCHEMA_SQL = """
+    CREATE TABLE suppliers (
+        id bigserial PRIMARY KEY, name text, slug text UNIQUE, is_active boolean,
+        created_at timestamp, updated_at timestamp
+    );
+    CREATE TABLE products (
+        id bigserial PRIMARY KEY, name text, normalized_name text UNIQUE, brand text,
+        normalized_brand text, quantity integer, unit text,
+        created_at timestamp, updated_at timestamp
+    );
+    CREATE TABLE supplier_products (
+        id bigserial PRIMARY KEY, supplier_id bigint NOT NULL, product_id bigint,
+        external_id text NOT NULL, external_url text, name text, normalized_name text,
+        brand text, category text, raw_category text, unit text, quantity integer, ean text,
+        anvisa_registration text, manufacturer_code text, image_url text, in_stock boolean,
+        current_price numeric, pix_price numeric, original_price numeric,
+        discount_percent numeric, last_scraped_at timestamp,
+        created_at timestamp, updated_at timestamp,
+        UNIQUE (supplier_id, external_id)
+    );
+    CREATE TABLE price_histories (
+        id bigserial PRIMARY KEY, supplier_product_id bigint, price numeric, pix_price numeric,
+        original_price numeric, in_stock boolean, recorded_at timestamp, created_at timestamp
+    );
+"""
+
+
+@pytest.fixture
+def database():
+    # Runs the SQL for real against POSTGRES_TEST_DSN, in a schema of its
+    # own that is dropped afterwards; skipped when no server is configured.
+    dsn = os.getenv("POSTGRES_TEST_DSN")
+    if not dsn:
+        pytest.skip("POSTGRES_TEST_DSN is not set")
+    try:
+        conn = psycopg2.connect(dsn)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+
+    schema = f"pipeline_test_{os.getpid()}"
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"SET search_path TO {schema}")
+        cur.execute(SCHEMA_SQL)
+    try:
+        yield conn, {**parse_dsn(dsn), "options": f"-c search_path={schema}"}
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+
+def crawl(db_config, items, batch_size):
+    # One spider run, with writes on the calling thread.
+    pipeline = PostgresPipeline(db_config, batch_size, flush_interval=0, write_queue_size=0)
+    pipeline.reactor = FakeReactor()
+    spider = FakeSpider()
+    opened = pipeline.open_spider(spider)
+    assert opened.called and opened.result is None
+    for product in items:
+        pipeline.process_item(product, spider)
+    closed = pipeline.close_spider(spider)
+    assert closed.called and closed.result is None
+
+
+def listed(name: str, price: float, **fields) -> dict:
+    return {
+        "external_id": "1",
+        "name": name,
+        "normalized_name": name.lower(),
+        "price": price,
+        "quantity": 1,
+        "unit": "un",
+        "in_stock": True,
+        **fields,
+    }
+
+
+@pytest.mark.parametrize("batch_size", [1, 3])
+class TestAgainstPostgres:
+    def row(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT product_id, updated_at, last_scraped_at FROM supplier_products"
+                " WHERE external_id = '1'"
+            )
+            return cur.fetchone()
+
+    def history(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT price FROM price_histories ORDER BY id")
+            return [price for (price,) in cur.fetchall()]
+
+    def test_unchanged_item_is_not_rewritten(self, database, batch_size):
+        conn, db_config = database
+        crawl(db_config, [listed("Resina Z350", 100.0)], batch_size)
+        product_id, updated_at, scraped_at = self.row(conn)
+
+        crawl(db_config, [listed("Resina Z350", 100.0)], batch_size)
+
+        # Only the bump marks it as still listed; the upsert left it alone.
+        again = self.row(conn)
+        assert again[:2] == (product_id, updated_at)
+        assert again[2] > scraped_at
+        assert self.history(conn) == [Decimal("100.0")]
+
+    def test_price_change_adds_one_history_row(self, database, batch_size):
+        conn, db_config = database
+        crawl(db_config, [listed("Resina Z350", 100.0)], batch_size)
+        crawl(db_config, [listed("Resina Z350", 90.0)], batch_size)
+        crawl(db_config, [listed("Resina Z350", 90.0)], batch_size)
+
+        assert self.history(conn) == [Decimal("100.0"), Decimal("90.0")]
+
+    def test_master_link_follows_identity_columns(self, database, batch_size):
+        conn, db_config = database
+        crawl(db_config, [listed("Resina Z350", 100.0)], batch_size)
+        (linked, *_) = self.row(conn)
+        assert linked is not None
+
+        # Price, brand and stock are not part of the identity.
+        crawl(db_config, [listed("Resina Z350", 80.0, brand="3M", in_stock=False)], batch_size)
+        assert self.row(conn)[0] == linked
+
+        for changed in ({"quantity": 2}, {"unit": "cx"}, {"name": "Resina Z350 XT"}):
+            crawl(db_config, [listed("Resina Z350", 80.0, **changed)], batch_size)
+            relinked = self.row(conn)[0]
+            assert relinked not in (None, linked)
+            linked = relinked